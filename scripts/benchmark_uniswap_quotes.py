@@ -0,0 +1,412 @@
+import argparse
+import collections
+import datetime as dt
+import json
+import math
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector, keccak
+import uniswap_quotes as uq
+
+############################
+# CONFIGURATION
+############################
+
+ENGINES = ["sequential", "threaded", "async"]  # Quote engines of uniswap_quotes.QUOTE_ENGINE
+NETWORK_KEY = "ethereum"
+START_BLOCK = 20000000
+START_BLOCK_TIMESTAMP = 1717281407  # Block times follow from START_BLOCK at 12 seconds per block
+GAS_PRICE_WEI = 20 * 10**9
+ETH_PRICE_USD = 3000
+SYNTHETIC_POOL_CODE = "0x6080604052"  # Any non-empty code, so CREATE2 pool candidates count as deployed
+HANDSHAKE_METHODS = {"web3_clientVersion", "eth_chainId", "net_version"}  # Never failed, so the collector's connection check passes
+
+# Selectors of the reads the collector makes, as served by the mock node
+SELECTORS = {
+   "0x" + function_signature_to_4byte_selector(signature).hex(): name for signature, name in [
+       ("aggregate3((address,bool,bytes)[])", "aggregate3"),
+       ("getPool(address,address,uint24)", "getPool"),
+       ("liquidity()", "liquidity"),
+       ("quoteExactInputSingle(address,address,uint24,uint256,uint160)", "quoteExactInputSingle"),
+       ("quoteExactInput(bytes,uint256)", "quoteExactInput"),
+       ("slot0()", "slot0"),
+       ("decimals()", "decimals"),
+       ("symbol()", "symbol")
+   ]
+}
+
+############################
+# MOCK JSON-RPC NODE
+############################
+
+def  synthetic_reserve (token_in, token_out, fee):
+   """Deterministic per-pool depth, so fee tiers quote differently"""
+   token0, token1 = sorted([token_in.lower(), token_out.lower()])
+   seed = int.from_bytes(keccak(text=f"{token0}:{token1}:{fee}")[:4], "big")
+   return (seed % 1000 + 1) * 10**24
+
+def  synthetic_amount_out (token_in, token_out, fee, amount_in):
+   """Constant product output after the pool fee"""
+   amount_in_less_fee = amount_in * (1000000 - fee) // 1000000
+   reserve = synthetic_reserve(token_in, token_out, fee)
+   return reserve * amount_in_less_fee // (reserve + amount_in_less_fee)
+
+def  synthetic_call (target, calldata):
+   """
+   Answer one eth_call from its selector. Returns (success, return data bytes); unknown reads revert
+   """
+   name = SELECTORS.get(calldata[:10])
+   args = bytes.fromhex(calldata[10:])
+   if name == "getPool":
+       token_a, token_b, fee = decode(["address", "address", "uint24"], args)
+       return True, encode(["address"], ["0x" + keccak(text=f"{min(token_a, token_b)}:{max(token_a, token_b)}:{fee}")[12:].hex()])
+   if name == "liquidity":
+       return True, encode(["uint128"], [int.from_bytes(keccak(text=target.lower())[:4], "big") * 10**12 + 1])
+   if name == "quoteExactInputSingle":
+       token_in, token_out, fee, amount_in, _ = decode(["address", "address", "uint24", "uint256", "uint160"], args)
+       return True, encode(["uint256"], [synthetic_amount_out(token_in, token_out, fee, amount_in)])
+   if name == "quoteExactInput":
+       path, amount_in = decode(["bytes", "uint256"], args)
+       token_in, fee, token_out = "0x" + path[:20].hex(), int.from_bytes(path[20:23], "big"), "0x" + path[23:43].hex()
+       amount_out = synthetic_amount_out(token_in, token_out, fee, amount_in)
+       return True, encode(["uint256", "uint160[]", "uint32[]", "uint256"], [amount_out, [2**96], [1], 110000])
+   if name == "slot0" and target.lower() == uq.NETWORK_CONFIGS[NETWORK_KEY]["eth_usd_pool_address"].lower():
+       # USDC (token0, 6 decimals) / WETH (token1, 18 decimals) at ETH_PRICE_USD
+       sqrt_price_x96 = math.isqrt(10**18 * 2**192 // (ETH_PRICE_USD * 10**6))
+       return True, encode(["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"], [sqrt_price_x96, 0, 0, 1, 1, 0, True])
+   if name == "decimals":
+       return True, encode(["uint8"], [18])
+   if name == "symbol":
+       return True, encode(["string"], [f"TK{target[2:6].upper()}"])
+   return False, b""
+
+class  MockNode:
+   """
+   Stand-in Ethereum node state: replays recorded eth_call results (keyed by target and calldata,
+   whatever the block), falls back to synthetic answers, and injects latency and errors
+   """
+   def  __init__ (self, args):
+       self.args = args
+       self.block_number = START_BLOCK
+       self.lock = threading.Lock()
+       self.fixture = {}
+       self.recorded = False
+       if args.fixture and os.path.isfile(args.fixture):
+           with open(args.fixture) as f:
+               self.fixture = json.load(f)
+
+   def  save_fixture (self):
+       """Write recorded responses (record mode only)"""
+       if self.args.record_from and self.recorded:
+           with open(self.args.fixture, "w") as f:
+               json.dump(self.fixture, f, indent=1, sort_keys=True)
+
+   def  upstream (self, method, params):
+       """Forward a request to the node being recorded"""
+       response = requests.post(self.args.record_from, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params}, timeout=30)
+       response.raise_for_status()
+       return response.json()
+
+   def  call (self, target, calldata, block):
+       """One eth_call: (success, return data bytes), replaying the fixture when it has the read"""
+       key = f"{target.lower()}:{calldata}"
+       if key in self.fixture:
+           success, return_data = self.fixture[key]
+           return success, bytes.fromhex(return_data[2:])
+
+       if self.args.record_from:
+           if SELECTORS.get(calldata[:10]) == "aggregate3":
+               # Record the inner reads so they replay whether or not the collector batches them
+               reply = self.upstream("eth_call", [{"to": target, "data": calldata}, block])
+               if "error" in reply:
+                   return False, b""
+               (calls,) = decode(["(address,bool,bytes)[]"], bytes.fromhex(calldata[10:]))
+               (results,) = decode(["(bool,bytes)[]"], bytes.fromhex(reply["result"][2:]))
+               with self.lock:
+                   for (inner_target, _, inner_calldata), (success, return_data) in zip(calls, results):
+                       self.fixture[f"{inner_target.lower()}:0x{inner_calldata.hex()}"] = [success, "0x" + return_data.hex()]
+                   self.recorded = True
+               return True, bytes.fromhex(reply["result"][2:])
+           reply = self.upstream("eth_call", [{"to": target, "data": calldata}, block])
+           success = "error" not in reply
+           return_data = bytes.fromhex(reply["result"][2:]) if success else b""
+           with self.lock:
+               self.fixture[key] = [success, "0x" + return_data.hex()]
+               self.recorded = True
+           return success, return_data
+
+       if SELECTORS.get(calldata[:10]) == "aggregate3":
+           (calls,) = decode(["(address,bool,bytes)[]"], bytes.fromhex(calldata[10:]))
+           results = [self.call(inner_target, "0x" + inner_calldata.hex(), block) for inner_target, _, inner_calldata in calls]
+           return True, encode(["(bool,bytes)[]"], [results])
+       return synthetic_call(target, calldata)
+
+   def  handle (self, request):
+       """Answer one JSON-RPC request object"""
+       method, params = request.get("method"), request.get("params", [])
+       reply = {"jsonrpc": "2.0", "id": request.get("id")}
+       if method not in HANDSHAKE_METHODS and random.random() < self.args.error_rate:
+           reply["error"] = {"code": -32603, "message": "injected error"}
+           return reply
+
+       if method == "eth_blockNumber":
+           with self.lock:
+               self.block_number += 1  # A new block per cycle, so the collector's block memo starts cold
+               reply["result"] = hex(self.block_number)
+       elif method == "eth_chainId":
+           reply["result"] = "0x1"
+       elif method == "net_version":
+           reply["result"] = "1"
+       elif method == "web3_clientVersion":
+           reply["result"] = "benchmark-mock-node/1.0"
+       elif method == "eth_gasPrice":
+           reply["result"] = hex(GAS_PRICE_WEI)
+       elif method == "eth_getBlockByNumber":
+           number = self.block_number if params[0] == "latest" else int(params[0], 16)
+           reply["result"] = {"number": hex(number), "timestamp": hex(START_BLOCK_TIMESTAMP + 12 * (number - START_BLOCK)),
+                              "baseFeePerGas": hex(GAS_PRICE_WEI * 9 // 10), "transactions": []}
+       elif method == "eth_feeHistory":
+           newest = self.block_number if params[1] == "latest" else int(params[1], 16)
+           reply["result"] = {"oldestBlock": hex(newest), "baseFeePerGas": [hex(GAS_PRICE_WEI * 9 // 10)] * 2,
+                              "gasUsedRatio": [0.5], "reward": [[hex(GAS_PRICE_WEI // 10)] * len(params[2])]}
+       elif method == "eth_getCode":
+           reply["result"] = SYNTHETIC_POOL_CODE
+       elif method == "eth_getLogs":
+           reply["result"] = []
+       elif method == "eth_call":
+           success, return_data = self.call(params[0]["to"], params[0].get("data") or params[0].get("input"), params[1] if len(params) > 1 else "latest")
+           if success:
+               reply["result"] = "0x" + return_data.hex()
+           else:
+               reply["error"] = {"code": 3, "message": "execution reverted", "data": "0x"}
+       else:
+           reply["error"] = {"code": -32601, "message": f"method {method} not supported by the mock node"}
+       return reply
+
+def  serve_mock_node (args, port_queue):
+   """Run the mock node until terminated (in its own process, so its CPU is not charged to the collector)"""
+   node = MockNode(args)
+
+   class  Handler (BaseHTTPRequestHandler):
+       protocol_version = "HTTP/1.1"  # Keep-alive, like a real node, so connection reuse shows in the timings
+       disable_nagle_algorithm = True  # Headers and body are separate writes
+
+       def  do_POST (self):
+           body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+           time.sleep(max(0.0, random.gauss(args.latency_ms, args.jitter_ms)) / 1000)
+           methods = {request.get("method") for request in (body if isinstance(body, list) else [body])}
+           if not methods <= HANDSHAKE_METHODS and random.random() < args.rate_limit_rate:
+               self.send_response(429)
+               self.send_header("Retry-After", "1")
+               self.send_header("Content-Length", "0")
+               self.end_headers()
+               return
+           reply = [node.handle(request) for request in body] if isinstance(body, list) else node.handle(body)
+           payload = json.dumps(reply).encode()
+           self.send_response(200)
+           self.send_header("Content-Type", "application/json")
+           self.send_header("Content-Length", str(len(payload)))
+           self.end_headers()
+           try:
+               self.wfile.write(payload)
+           except (BrokenPipeError, ConnectionResetError):
+               pass  # The collector dropped a hedged request it no longer needed
+
+       def  log_message (self, format, *args):
+           pass
+
+   server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+   server.daemon_threads = True
+   signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+   port_queue.put(server.server_address[1])
+   try:
+       server.serve_forever()
+   finally:
+       node.save_fixture()
+
+############################
+# BENCHMARK
+############################
+
+def  instrument_provider (provider, stats, is_async=False):
+   """Time every request the provider sends: stats gets per-method counts and call latencies"""
+   make_request = provider.make_request
+
+   def  record (method, start):
+       with stats["lock"]:
+           stats["calls"][method] += 1
+           stats["latencies"].append(time.perf_counter() - start)
+
+   if is_async:
+       async def  timed_request (method, params):
+           start = time.perf_counter()
+           try:
+               return await make_request(method, params)
+           finally:
+               record(method, start)
+   else:
+       def  timed_request (method, params):
+           start = time.perf_counter()
+           try:
+               return make_request(method, params)
+           finally:
+               record(method, start)
+
+   provider.make_request = timed_request
+   provider._request_func_cache = (None, None)  # Rebuild the middleware chain around the timed request
+
+def  percentile (values, pct):
+   """Nearest rank percentile"""
+   if not values:
+       return float("nan")
+   ordered = sorted(values)
+   return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+def  run_engine (uq, engine, cycles, stats, quote_count):
+   """Run cycles of the collector with one quote engine, from a cold read cache and pool registry"""
+   config = uq.NETWORK_CONFIGS[NETWORK_KEY]
+   uq.QUOTE_ENGINE = engine
+   uq.ENABLE_PARALLEL_PROCESSING = engine == "threaded"
+   with uq.read_cache_lock:
+       uq.read_cache.clear()
+   with uq.pool_registry_lock:
+       uq.pool_registry["pools"].clear()
+       uq.pool_registry["loaded"] = True
+
+   results = []
+   for cycle in range(cycles):
+       with stats["lock"]:
+           stats["calls"].clear()
+           stats["latencies"].clear()
+       quote_count[0] = 0
+       wall_start, cpu_start = time.perf_counter(), time.process_time()
+       uq.run_network_cycle(NETWORK_KEY, config, dt.datetime.now(dt.UTC).isoformat())
+       wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+       with stats["lock"]:
+           results.append({
+               "wall": wall,
+               "cpu": cpu,
+               "quotes": quote_count[0],
+               "calls": sum(stats["calls"].values()),
+               "eth_calls": stats["calls"]["eth_call"],
+               "by_method": dict(stats["calls"]),
+               "latencies": list(stats["latencies"])
+           })
+   return results
+
+def  report (engine, results):
+   """One summary line per engine; the first cycle is cold (pool discovery), the others warm"""
+   quotes = sum(result["quotes"] for result in results)
+   calls = sum(result["calls"] for result in results)
+   latencies = [latency for result in results for latency in result["latencies"]]
+   per_quote = lambda value: value / quotes if quotes else float("nan")
+   print(f"{engine:<12} {statistics.median(result['wall'] for result in results):>9.3f} {results[0]['wall']:>9.3f} "
+         f"{quotes / len(results):>8.1f} {per_quote(calls):>9.2f} {per_quote(sum(result['eth_calls'] for result in results)):>9.2f} "
+         f"{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 99) * 1000:>8.2f} "
+         f"{per_quote(sum(result['cpu'] for result in results)) * 1000:>10.2f}")
+   by_method = collections.Counter()
+   for result in results:
+       by_method.update(result["by_method"])
+   print(f"{'':<12} RPC calls per cycle: {', '.join(f'{method} {count / len(results):.1f}' for method, count in by_method.most_common())}")
+
+def  main ():
+   parser = argparse.ArgumentParser(description="Benchmark the Uniswap quote collector's cycle against a local mock JSON-RPC node")
+   parser.add_argument("--engines", default=",".join(ENGINES), help="Comma separated quote engines to compare")
+   parser.add_argument("--cycles", type=int, default=3, help="Cycles per engine (the first one is cold)")
+   parser.add_argument("--latency-ms", type=float, default=20.0, help="Mean injected latency per HTTP request")
+   parser.add_argument("--jitter-ms", type=float, default=5.0, help="Standard deviation of the injected latency")
+   parser.add_argument("--error-rate", type=float, default=0.0, help="Share of JSON-RPC requests answered with an error")
+   parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of HTTP requests answered with 429")
+   parser.add_argument("--nodes", type=int, default=1, help="Mock nodes to pool as the collector's endpoints")
+   parser.add_argument("--slow-node-latency-ms", type=float, help="Mean latency of the first node, to stand in for a degraded endpoint")
+   parser.add_argument("--multicall", choices=["on", "off"], default="on", help="Batch reads through Multicall3")
+   parser.add_argument("--quote-source", choices=["quoter", "local"], default="quoter")
+   parser.add_argument("--fee-tier-selection", choices=["first_liquid", "best_execution"], default="first_liquid")
+   parser.add_argument("--fixture", help="Recorded eth_call responses to replay (synthetic answers for anything missing)")
+   parser.add_argument("--record-from", help="Real node URL: proxy eth_calls to it and record them into --fixture")
+   parser.add_argument("--port", type=int, default=0, help="Mock node port (0 picks a free port)")
+   parser.add_argument("--tokens", type=int, default=0, help="Synthetic tokens added through a token list, to benchmark larger pair universes")
+   parser.add_argument("--serve", action="store_true",
+                       help="Only run the mock node(s) until interrupted, e.g. as an archive node stand-in for uniswap_quotes.py --backfill")
+   args = parser.parse_args()
+   if args.record_from and not args.fixture:
+       parser.error("--record-from needs --fixture to record into")
+   if args.record_from and args.nodes > 1:
+       parser.error("--record-from records through a single mock node")
+
+   port_queue = multiprocessing.Queue()
+   node_processes = []
+   for index in range(args.nodes):
+       node_args = argparse.Namespace(**vars(args))
+       if index == 0 and args.slow_node_latency_ms is not None:
+           node_args.latency_ms = args.slow_node_latency_ms
+       if index > 0:
+           node_args.port = 0
+       node_processes.append(multiprocessing.Process(target=serve_mock_node, args=(node_args, port_queue), daemon=True))
+       node_processes[-1].start()
+   os.environ["ETHEREUM_RPC_URL"] = ",".join(f"http://127.0.0.1:{port_queue.get(timeout=30)}" for _ in node_processes)
+   if args.serve:
+       print(f"Mock node at {os.environ['ETHEREUM_RPC_URL']} (answers reads at any block); Ctrl-C to stop")
+       try:
+           for node_process in node_processes:
+               node_process.join()
+       except KeyboardInterrupt:
+           pass
+       return
+
+   output_dir = tempfile.mkdtemp(prefix="uniswap_benchmark_")
+   uq.OUTPUT_FILE_PREFIXES = {table: os.path.join(output_dir, os.path.basename(prefix)) for table, prefix in uq.OUTPUT_FILE_PREFIXES.items()}
+   uq.POOL_REGISTRY_FILE = os.path.join(output_dir, "pool_registry.json")
+   uq.METRICS_FILE = os.path.join(output_dir, "uniswap_quotes.prom")
+   uq.TOKEN_REGISTRY_FILE = os.path.join(output_dir, "token_registry.json")
+   token_list_file = uq.NETWORK_CONFIGS[NETWORK_KEY]["token_list_file"] = os.path.join(output_dir, "tokens.txt")
+   with open(token_list_file, "w") as f:
+       f.writelines("0x" + keccak(text=f"token {index}")[12:].hex() + "\n" for index in range(args.tokens))
+   uq.configure_logging()
+   collector = uq.QuoteCollector(NETWORK_KEY, os.environ["ETHEREUM_RPC_URL"], {
+       "ENABLE_MULTICALL": args.multicall == "on", "QUOTE_SOURCE": args.quote_source, "FEE_TIER_SELECTION": args.fee_tier_selection
+   })
+
+   config = collector.initialize()
+   stats = {"lock": threading.Lock(), "calls": collections.Counter(), "latencies": []}
+   instrument_provider(config["w3"].provider, stats)
+   instrument_provider(config["async_w3"].provider, stats, is_async=True)
+   quote_count = [0]
+   write_quote_rows = uq.write_quote_rows
+
+   def  counted_write_quote_rows (rows, table="quotes"):
+       if table == "quotes":
+           quote_count[0] += len(rows)
+       write_quote_rows(rows, table)
+
+   uq.write_quote_rows = counted_write_quote_rows
+
+   print(f"Mock node at {os.environ['ETHEREUM_RPC_URL']}: latency {args.latency_ms}±{args.jitter_ms} ms, "
+         f"error rate {args.error_rate}, 429 rate {args.rate_limit_rate}, multicall {args.multicall}, quote source {args.quote_source}")
+   print(f"{'engine':<12} {'wall p50':>9} {'wall cold':>9} {'quotes':>8} {'rpc/quote':>9} {'call/quote':>9} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms/qt':>10}")
+   uq.start_output_writer()
+   try:
+       with uq.overridden_settings(collector.settings):
+           for engine in args.engines.split(","):
+               report(engine, run_engine(uq, engine, args.cycles, stats, quote_count))
+   finally:
+       uq.stop_output_writer()
+       for node_process in node_processes:
+           node_process.terminate()
+           node_process.join()
+
+if __name__ == "__main__":
+   main()
+
+# python3 benchmark_uniswap_quotes.py --engines sequential,threaded,async --cycles 3 --latency-ms 20
+# python3 benchmark_uniswap_quotes.py --serve --port 18545, then python3 uniswap_quotes.py --rpc-url http://127.0.0.1:18545 --backfill 20000000:20000100:10
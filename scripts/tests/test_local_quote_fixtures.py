@@ -0,0 +1,60 @@
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uniswap_quotes as uq
+import uniswap_v3_math as v3
+
+# Recorded with: python uniswap_quotes.py --record-local-fixture [--fixture-pool TOKEN_A/TOKEN_B[/FEE]] (needs a mainnet node)
+FIXTURES = sorted(glob.glob(os.path.join(uq.LOCAL_FIXTURE_DIR, "*.json")))
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def  test_local_quotes_match_recorded_quoter_v2 (path):
+   assert uq.verify_local_quote_fixture(path) > 0
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def  test_fixture_covers_multi_tick_swaps_in_both_directions (path):
+   with open(path) as f:
+       quotes = json.load(f)["quotes"]
+   for zero_for_one in (True, False):
+       assert max(quote["ticks_crossed"] for quote in quotes if quote["zero_for_one"] == zero_for_one) >= 2
+
+def  test_fixtures_cover_every_fee_tier ():
+   if not FIXTURES:
+       pytest.skip(f"no recorded fixtures in {uq.LOCAL_FIXTURE_DIR}")
+   fee_tiers = set()
+   for path in FIXTURES:
+       with open(path) as f:
+           fee_tiers.add(json.load(f)["snapshot"]["fee"])
+   assert fee_tiers == set(uq.POOL_FEE_TIERS)
+
+def  synthetic_fixture (tmp_path, off_by=0):
+   """A fixture over a made-up pool whose expected amounts come from the local math itself, optionally off by some wei"""
+   tick_spacing = v3.FEE_TICK_SPACING[500]
+   snapshot = {"pool": "0x0000000000000000000000000000000000000001", "block": 1, "fee": 500, "tick_spacing": tick_spacing,
+               "sqrt_price_x96": v3.get_sqrt_ratio_at_tick(5), "tick": 5, "liquidity": 10**22, "min_word": -4, "max_word": 4,
+               "tick_bitmap": {word_pos: 0 for word_pos in range(-4, 5)}, "liquidity_net": {}}
+   for tick, liquidity_net in [(-200, 4 * 10**21), (300, -4 * 10**21)]:
+       compressed = tick // tick_spacing
+       snapshot["tick_bitmap"][compressed >> 8] |= 1 << (compressed % 256)
+       snapshot["liquidity_net"][tick] = liquidity_net
+   quotes = []
+   for zero_for_one in (True, False):
+       for amount_in in (10**15, 10**18, 10**19):
+           swap = v3.simulate_exact_input(snapshot, zero_for_one, amount_in)
+           quotes.append({"zero_for_one": zero_for_one, "amount_in": amount_in, "amount_out": swap["amount_out"] + off_by,
+                          "ticks_crossed": swap["ticks_crossed"]})
+   path = tmp_path / "fixture.json"
+   path.write_text(json.dumps({"network": "ethereum", "pair": ["ETH", "USDC"], "snapshot": snapshot, "quotes": quotes}))
+   return str(path)
+
+def  test_verifier_reads_back_a_fixture (tmp_path):
+   assert uq.verify_local_quote_fixture(synthetic_fixture(tmp_path)) == 6
+
+def  test_verifier_fails_on_a_one_wei_difference (tmp_path):
+   with pytest.raises(Exception, match="differ from QuoterV2"):
+       uq.verify_local_quote_fixture(synthetic_fixture(tmp_path, off_by=1))
@@ -8,11 +8,36 @@ import signal
 import sys
 from dotenv import load_dotenv
 import json
-from web3 import Web3
+import eth_abi
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import ContractLogicError
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import concurrent.futures
+import multiprocessing
 import threading
+import queue
+import atexit
+import asyncio
+import collections
+import contextlib
+import contextvars
+import decimal
+import dataclasses
+import functools
+import bisect
+import mmap
+import struct
+import argparse
+import urllib.parse
+import urllib3
+import aiohttp
+import numpy as np
+from uniswap_v3_math import (FEE_TICK_SPACING, SWAP_GAS_BASE, SWAP_GAS_PER_TICK_CROSSED, SnapshotRangeError,
+                             build_swap_segments, simulate_exact_input)
 
 ############################
 # CONFIGURATION
@@ -26,6 +51,11 @@ SAVE_DIR = "/Users/{}}/Documents/uniswap_quotes/"
 FILE_VERSION = "v1" # Updated file version
 LOG_DIR = "/Users/{}}/Documents/uniswap_quotes/logs"
 
+# Logging - callers only queue records; a listener thread formats and writes them
+LOG_LEVEL = logging.INFO  # logging.DEBUG adds the per-call detail of the quote path (sampled)
+LOG_DEBUG_SAMPLE_RATE = 0.01  # Share of DEBUG records kept; INFO and above are always written
+LOG_FORMAT = "text"  # "text", or "json" (one object per line, with the structured fields of records such as the cycle summary)
+
 # Quotes configuration (excluding pairs)
 USD_NOTIONALS = [500, 2000, 10000]
 POOL_FEE_TIERS = [100, 500, 3000, 10000]  # 0.01%, 0.05%, 0.3%, 1%
@@ -36,12 +66,137 @@ INTERFACE_FEE_PCT = 0.0025  # Uniswap interface fee (0.25%)
 ETHEREUM_URL_TEMPLATE = "https://mainnet.infura.io/v3/{}"
 BASE_URL_TEMPLATE = "https://base-mainnet.infura.io/v3/{}"
 
+# Depth curves - price impact over many sizes per pair, computed from one state snapshot per pool
+ENABLE_DEPTH_CURVES = False
+CURVE_NOTIONALS = np.logspace(np.log10(100), np.log10(5000000), 200)  # $100 to $5M, log-spaced
+CURVE_SNAPSHOT_TICK_WORDS = 4  # Wider tick window than single quotes so large sizes stay inside the snapshot
+
 # Parallelization
 MAX_WORKERS_ETHEREUM = 4 
 ENABLE_PARALLEL_PROCESSING = True
+QUOTE_ENGINE = "threaded"  # "threaded" (pairs on a thread pool), "sequential", or "async" (every independent call in flight at once)
+ASYNC_MAX_CONCURRENCY = 16  # Global limit on in-flight RPC calls for the async engine
+ASYNC_BATCH_WINDOW = 0.002  # Seconds the async engine gathers reads issued together into one aggregate3 call
+
+# Fee tier selection - "first_liquid" quotes the lowest fee tier with liquidity and falls back to the others on failure,
+# "best_execution" quotes every fee tier in one batch and keeps the lowest effective price (after fees and gas)
+FEE_TIER_SELECTION = "first_liquid"
+RECORD_FEE_TIER_PROBES = False  # Write every fee tier's quote in best execution mode to the fee_tier_probes table
+
+# Multicall3 batching - send each cycle's contract reads as a few aggregate3 eth_calls
+ENABLE_MULTICALL = True
+MULTICALL_BATCH_SIZE = 50  # Reads per aggregate3 call (keeps quoter-heavy batches under the node's eth_call gas cap)
+MULTICALL_STATE_BATCH_SIZE = 500  # Reads per aggregate3 call for cheap pool state reads (slot0, ticks...)
+NO_RETURN_DATA_ERROR = "returned no data"  # Multicall error for reads against addresses without code
+
+# Per-block memo cache - repeated reads at a cycle's pinned block are served from memory (LRU eviction)
+READ_CACHE_MAX_ENTRIES = 50000
+
+# Quote source - "quoter" asks the Quoter contracts, "local" runs the V3 swap math over pool state snapshots
+QUOTE_SOURCE = "quoter"
+SNAPSHOT_TICK_WORDS = 1  # Tick bitmap words loaded on each side of the current price's word
+LOCAL_QUOTE_VERIFY_SAMPLE_RATE = 0.05  # Share of local quotes cross-checked against QuoterV2 (QuoterV2's amount is used on a mismatch)
+LOCAL_FIXTURE_AMOUNTS = 12  # Amounts per direction in a recorded fixture, each LOCAL_FIXTURE_AMOUNT_GROWTH times the last
+LOCAL_FIXTURE_AMOUNT_GROWTH = 4  # From the smallest notional up to swaps crossing many ticks (stops at the snapshot's edge)
+LOCAL_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "local_quotes")
+
+# Snapshot store - each cycle's pool states (slot0, liquidity, initialized ticks) kept on disk for offline requoting
+# (replay_quotes); a pool's records are delta-encoded against its previous stored block
+ENABLE_SNAPSHOT_STORE = False
+SNAPSHOT_STORE_DIR = os.path.join(SAVE_DIR, "snapshots")
+SNAPSHOT_KEYFRAME_INTERVAL = 100  # Records between full states of a pool, bounding the deltas decoded to reach a block
+
+# Pool registry - Uniswap V3 pool addresses never change once deployed
+POOL_REGISTRY_REFRESH_INTERVAL = 6 * 3600  # Re-check fee tiers without a pool every 6 hours
+
+# Token registry - symbols and decimals of listed tokens, read on-chain once and kept on disk
+TOKEN_REGISTRY_RETRY_INTERVAL = 24 * 3600  # Re-read tokens whose metadata could not be read after a day
+
+# Output writer - rows are queued by the workers and written in batches by a single writer thread
+OUTPUT_QUEUE_MAX_ROWS = 10000  # Producers block when the writer falls this far behind (in messages: a pair's rows, or a single row)
+OUTPUT_BATCH_SIZE = 500  # Rows buffered before a write
+OUTPUT_FLUSH_INTERVAL = 2.0  # Seconds before a partial batch is written anyway
+OUTPUT_FORMAT = "csv"  # "csv", or "parquet" (typed columns, one row group per cycle; requires pyarrow)
+PARQUET_COMPRESSION = "zstd"
+PARQUET_FILE_ROLLOVER_SECONDS = 3600  # A Parquet file is only readable once closed (footer), so start a new one at the first cycle boundary past this age; 0 for a file per cycle
+
+# Collection mode - "interval" requotes every pair then sleeps 15-30 minutes, "events" polls the tracked pools
+# Swap/Mint/Burn logs and requotes only the pairs whose pools changed, "blocks" starts a cycle on each new block
+# head for the pairs whose refresh interval has elapsed
+COLLECTION_MODE = "interval"
+EVENT_POLL_INTERVAL = 12  # Seconds between eth_getLogs polls (about one block)
+EVENT_MAX_BLOCK_RANGE = 2000  # Blocks per eth_getLogs request (ranges are halved when the node rejects them)
+EVENT_MAX_CATCHUP_BLOCKS = 7200  # Requote everything instead of scanning logs when further behind than this (~1 day)
+EVENT_FULL_REQUOTE_INTERVAL = 1800  # Requote every pair at least this often, even without pool events
+
+# Block scheduler (COLLECTION_MODE = "blocks")
+BLOCK_POLL_INTERVAL = 1.0  # Seconds between eth_blockNumber polls for a new head
+PAIR_DEADLINE = 10.0  # Seconds from a cycle's start by which each pair must be quoted; later work is cancelled and counted as missed
+MAX_OVERLAPPING_CYCLES = 2  # Cycles per network still running when a new head arrives; further heads are skipped
+DEFAULT_PAIR_REFRESH_INTERVAL = 300  # Seconds between quotes of pairs not listed in PAIR_REFRESH_INTERVALS
+PAIR_REFRESH_INTERVALS = {"USDC/ETH": 0, "USDT/ETH": 0, "USDC/WBTC": 0, "USDT/WBTC": 0}  # "A/B" -> seconds; 0 = every block
+
+# Historical backfill - quotes at past blocks on a process pool (blocks older than ~128 need an archive node)
+BACKFILL_WORKERS = 4  # Worker processes, each with its own connections
+BACKFILL_CHECKPOINT_INTERVAL = 10  # Blocks written between checkpoints of the backfill's progress
+BACKFILL_PRIORITY_FEE_PERCENTILE = 50  # Priority fee percentile added to the block's base fee for the gas price
+
+# ETH/USD of gas costs - read from the WETH/stablecoin pool at each block; fallbacks when that read fails
+ETH_PRICE_CACHE_BLOCKS = 256  # Priced blocks kept, across chains
+ETH_PRICE_FALLBACK_BLOCKS = 25  # A failed read reuses the price of an earlier block of the same chain at most this far back (~5 min on mainnet)
+ETH_PRICE_LIVE_BLOCKS = 5  # Blocks this close to the last polled head may fall back to CoinGecko's current price; older ones fail instead
+
+# Network supervisor - with several networks configured, each network's collector runs in its own process, so a slow
+# or failing chain does not hold back the others; the workers' rows are merged into the output files by the parent
+ENABLE_NETWORK_PROCESSES = True
+NETWORK_SINK_QUEUE_MAX_MESSAGES = 1000  # Row batches in flight from the network workers to the parent's writer
+NETWORK_SUPERVISOR_POLL_INTERVAL = 1.0  # Seconds between worker liveness checks
+NETWORK_RESTART_BACKOFF = 30  # Seconds before a crashed network worker is restarted, doubled per consecutive crash
+NETWORK_RESTART_BACKOFF_MAX = 600  # Also the uptime after which a worker's crash count is reset
+NETWORK_STOP_TIMEOUT = 120  # Seconds a stopping worker has to finish its cycle and hand over its rows before it is terminated
+
+# RPC limiter - shared token bucket with AIMD concurrency control; throttled requests (429) are retried with backoff
+ENABLE_RPC_LIMITER = True
+RPC_RATE_LIMIT = 50  # Requests per second ceiling (halved on throttling, recovered additively)
+RPC_MIN_RATE_LIMIT = 1
+RPC_RATE_INCREASE = 1  # Requests per second regained per window of healthy requests
+RPC_BURST = 20  # Token bucket size
+RPC_INITIAL_CONCURRENCY = 4
+RPC_MIN_CONCURRENCY = 1
+RPC_MAX_CONCURRENCY = 32  # Also the worker thread count of the threaded engine
+RPC_LATENCY_TARGET = 1.0  # Seconds; slower requests shrink the concurrency limit
+RPC_SLOW_DECREASE = 0.9
+RPC_THROTTLE_DECREASE = 0.5
+RPC_MAX_RETRIES = 5
+RPC_BACKOFF_BASE = 0.5  # Seconds, doubled per retry, with jitter
+RPC_BACKOFF_MAX = 30
+RPC_SLOT_POLL_INTERVAL = 0.005  # Seconds between checks for a free concurrency slot
+RPC_THROTTLE_ERROR_CODES = {429, -32005}  # JSON-RPC error codes nodes use for rate limiting
+
+# RPC endpoint pool - routing across a network's endpoints by moving latency and error rate, with hedged reads
+RPC_ENDPOINT_INITIAL_LATENCY = 0.2  # Seconds, assumed for endpoints without samples yet
+RPC_ENDPOINT_EWMA_ALPHA = 0.1  # Weight of each new request in the moving latency and error rate
+RPC_ENDPOINT_ERROR_PENALTY = 10  # Score = latency * (1 + penalty * error rate)
+RPC_ENDPOINT_EXPLORE_RATE = 0.02  # Share of requests sent to a random other endpoint to refresh its score
+RPC_ENDPOINT_LATENCY_WINDOW = 200  # Recent latencies per endpoint for the p95 hedge delay
+RPC_HEDGE_MIN_SAMPLES = 20
+RPC_HEDGE_MIN_DELAY = 0.05  # Seconds
+RPC_HEDGE_WORKERS = 64  # Threads for sync requests that may be hedged
+RPC_HEDGE_METHODS = {"eth_call", "eth_blockNumber", "eth_gasPrice", "eth_getCode", "eth_getLogs", "eth_chainId"}  # Read-only, safe to duplicate
+
+# HTTP sessions - pooled keep-alive connections shared by all threads, kept across cycles
+HTTP_POOL_HEADROOM = 8  # Connections on top of the limiter's in-flight ceiling, for hedged duplicates
+HTTP_TIMEOUT = 10  # Seconds per request
+HTTP_KEEPALIVE_TIMEOUT = 60  # Seconds an idle async connection is kept
+HTTP_STALE_CONNECTION_RETRIES = 1  # Resends after a pooled connection was found closed
+HTTP_WARMUP_CONNECTIONS = 8  # Connections opened per endpoint before a cycle that follows a long idle period
+HTTP_WARMUP_IDLE_TIME = 60  # Seconds idle after which pooled connections are assumed closed by the server
+
+# Metrics - RPC and cycle metrics in the Prometheus text format, as a file and/or a local HTTP endpoint
+ENABLE_METRICS = True
+METRICS_HTTP_PORT = None  # e.g. 9108 to serve http://127.0.0.1:9108/metrics
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # Seconds
 
-# ETH price cache configuration
-ETH_PRICE_CACHE_DURATION = 300  # 5 minutes in seconds
 
 # Higher slippage tolerance for lower liquidity tokens
 SLIPPAGE_TOLERANCE_BY_TOKEN = {
@@ -52,46 +207,383 @@ SLIPPAGE_TOLERANCE_BY_TOKEN = {
 
 # Generate timestamped filenames
 current_date = dt.datetime.now().strftime("%Y%m%d")
-csv_filename = f"uniswap_quotes_{FILE_VERSION}_{current_date}.csv"
-CSV_FILE = os.path.join(SAVE_DIR, csv_filename)
+OUTPUT_FILE_PREFIXES = {  # Output table -> file path prefix, completed with the date of each row's write
+   "quotes": os.path.join(SAVE_DIR, f"uniswap_quotes_{FILE_VERSION}_"),
+   "curves": os.path.join(SAVE_DIR, f"uniswap_curves_{FILE_VERSION}_"),
+   "fee_tier_probes": os.path.join(SAVE_DIR, f"uniswap_fee_tier_probes_{FILE_VERSION}_")
+}
+CSV_FILE = f"{OUTPUT_FILE_PREFIXES['quotes']}{current_date}.{OUTPUT_FORMAT}"
+CURVE_CSV_FILE = f"{OUTPUT_FILE_PREFIXES['curves']}{current_date}.{OUTPUT_FORMAT}"
 log_file = os.path.join(LOG_DIR, f"uniswap_quotes_{FILE_VERSION}_{current_date}.log")
-
-# Ensure directories exist
-os.makedirs(SAVE_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
+POOL_REGISTRY_FILE = os.path.join(SAVE_DIR, "pool_registry.json")
+TOKEN_REGISTRY_FILE = os.path.join(SAVE_DIR, "token_registry.json")
+EVENT_STATE_FILE = os.path.join(SAVE_DIR, "event_state.json")
+METRICS_FILE = os.path.join(SAVE_DIR, "uniswap_quotes.prom")  # None to disable the file export
 
 ##################
 # LOGGING
 ##################
 
-# Create logger with rotating file handler
+# Library use leaves log handlers to the application; the CLI logs to a rotating file (configure_logging)
 logger = logging.getLogger("uniswap_quotes")
 logger.setLevel(logging.INFO)
+logger.addHandler(logging.NullHandler())
+
+# Records are formatted by the listener thread, so the quote path only pays for the enqueue
+log_queue = queue.SimpleQueue()
+log_listener = {"listener": None}
+
+# Attributes every LogRecord has; any other attribute came from the extra argument
+LOG_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class  DeferredQueueHandler(QueueHandler):
+   """QueueHandler that leaves formatting to the listener (records stay in-process, so they need not be flattened)"""
+   def  prepare (self, record):
+       return record
+
+class  ForwardedLogHandler(logging.Handler):
+   """Hands records from worker processes (sampled there) to this process's listener, which owns the log file"""
+   def  emit (self, record):
+       if log_listener["listener"] is not None:
+           log_queue.put(record)
+
+class  JsonLogFormatter(logging.Formatter):
+   """One JSON object per record: time, level, thread and message, plus the fields passed as extra"""
+   def  format (self, record):
+       entry = {"time": self.formatTime(record), "level": record.levelname, "thread": record.threadName, "message": record.getMessage()}
+       entry.update({key: value for key, value in vars(record).items() if key not in LOG_RECORD_ATTRIBUTES})
+       if record.exc_info:
+           entry["exception"] = self.formatException(record.exc_info)
+       return json.dumps(entry, default=str)
+
+def  sample_log_record (record):
+   """Queue filter: keep every INFO and above record, and a LOG_DEBUG_SAMPLE_RATE share of DEBUG ones"""
+   return record.levelno > logging.DEBUG or random.random() < LOG_DEBUG_SAMPLE_RATE
+
+def  configure_logging ():
+   """
+   Log to the rotating file under LOG_DIR through a queue: records are sampled and queued by the
+   calling threads, then formatted and written by a listener thread
+   """
+   if log_listener["listener"] is not None:
+       return
+   os.makedirs(LOG_DIR, exist_ok=True)
+   handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
+   formatter = JsonLogFormatter() if LOG_FORMAT == "json" else logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+   handler.setFormatter(formatter)
+   queue_handler = DeferredQueueHandler(log_queue)
+   queue_handler.addFilter(sample_log_record)
+   logger.addHandler(queue_handler)
+   logger.setLevel(LOG_LEVEL)
+   log_listener["listener"] = QueueListener(log_queue, handler)
+   log_listener["listener"].start()
+
+def  configure_worker_logging (worker_log_queue):
+   """
+   Log from a worker process through a multiprocessing queue to the parent's listener (ForwardedLogHandler),
+   so a single process writes and rotates the log file
+   """
+   queue_handler = QueueHandler(worker_log_queue)
+   queue_handler.addFilter(sample_log_record)
+   logger.addHandler(queue_handler)
+   logger.setLevel(LOG_LEVEL)
 
-handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+def  stop_log_listener ():
+   """Write out every queued record and stop the listener"""
+   if log_listener["listener"] is not None:
+       log_listener["listener"].stop()
+       log_listener["listener"] = None
+
+atexit.register(stop_log_listener)  # Registered before the output writer's shutdown, so it runs after it and writes its records
 
 ############################
-# ENVIRONMENT AND WEB3 SETUP
+# RPC ENDPOINT POOL
 ############################
 
-# Load environment variables
-load_dotenv(dotenv_path="../.env")
-infura_api_key = os.getenv("INFURA_API_KEY")
-logger.info(f"Infura API key loaded: {bool(infura_api_key)}")
+def  new_rpc_endpoints (urls):
+   """Routing state for a network's endpoint URLs, shared by its sync and async providers"""
+   return [{"url": url, "label": urllib.parse.urlsplit(url).netloc or url,  # Host only, URLs may carry API keys
+            "latency": RPC_ENDPOINT_INITIAL_LATENCY, "errors": 0.0, "recent": collections.deque(maxlen=RPC_ENDPOINT_LATENCY_WINDOW),
+            "requests": collections.Counter(), "hedged": 0}
+           for url in urls]
+
+def  rank_endpoints (endpoints):
+   """
+   Endpoints best first by score: moving latency scaled up by the moving error rate; endpoints
+   never tried yet go first so each one gets measured. Now and then a random endpoint goes first, so a recovered endpoint gets traffic (and a fresh score) again
+   """
+   with rpc_endpoints_lock:
+       ranked = sorted(endpoints, key=lambda endpoint: endpoint["latency"] * (1 + RPC_ENDPOINT_ERROR_PENALTY * endpoint["errors"])
+                       if endpoint["recent"] or endpoint["errors"] else 0.0)
+   if len(ranked) > 1 and random.random() < RPC_ENDPOINT_EXPLORE_RATE:
+       ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+   return ranked
+
+def  record_endpoint_result (endpoint, latency, failed):
+   """Update an endpoint's moving latency and error rate with one request"""
+   with rpc_endpoints_lock:
+       endpoint["errors"] += RPC_ENDPOINT_EWMA_ALPHA * (failed - endpoint["errors"])
+       if not failed:
+           # The first sample replaces the assumed latency outright
+           endpoint["latency"] += (RPC_ENDPOINT_EWMA_ALPHA if endpoint["recent"] else 1) * (latency - endpoint["latency"])
+           endpoint["recent"].append(latency)
+       endpoint["requests"]["error" if failed else "ok"] += 1
+
+def  record_hedge (endpoint):
+   """Count a request hedged because the endpoint was slower than its p95"""
+   with rpc_endpoints_lock:
+       endpoint["hedged"] += 1
+
+def  hedge_delay (endpoint):
+   """How long to wait on an endpoint before hedging: its p95 latency, once it has enough samples"""
+   with rpc_endpoints_lock:
+       recent = sorted(endpoint["recent"])
+   if len(recent) < RPC_HEDGE_MIN_SAMPLES:
+       return max(RPC_HEDGE_MIN_DELAY, 4 * endpoint["latency"])
+   return max(RPC_HEDGE_MIN_DELAY, recent[int(len(recent) * 0.95)])
+
+def  endpoint_response_failed (response):
+   """Whether a JSON-RPC response is the endpoint's fault (rate limited) rather than the call's (e.g. a revert)"""
+   rpc_error = response.get("error") if isinstance(response, dict) else None
+   return isinstance(rpc_error, dict) and rpc_error.get("code") in RPC_THROTTLE_ERROR_CODES
+
+def  http_pool_size ():
+   """Connections per endpoint, from the limits in effect when a session is built (settings may change them)"""
+   return RPC_MAX_CONCURRENCY + HTTP_POOL_HEADROOM
+
+def  new_http_session (pool_size):
+   """
+   A requests session shared by every thread: keep-alive connections pooled up to pool_size, gzip,
+   and a retry when a pooled connection turns out to have been closed by the server while idle
+   """
+   session = requests.Session()
+   adapter = requests.adapters.HTTPAdapter(
+       pool_connections=1, pool_maxsize=pool_size,
+       max_retries=urllib3.util.Retry(total=HTTP_STALE_CONNECTION_RETRIES, connect=HTTP_STALE_CONNECTION_RETRIES,
+                                      read=HTTP_STALE_CONNECTION_RETRIES, status=0, allowed_methods=None)  # JSON-RPC reads are idempotent POSTs
+   )
+   session.mount("https://", adapter)
+   session.mount("http://", adapter)
+   session.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+   return session
+
+class  RpcEndpointPool(JSONBaseProvider):
+   """
+   Web3 provider over several endpoints of one network: each request goes to the best scoring endpoint,
+   fails over to the next one on errors, and read-only requests still pending after the endpoint's
+   p95 latency are hedged with a duplicate to the next endpoint (first answer wins)
+   """
+   def  __init__ (self, endpoints):
+       super().__init__()
+       self.endpoints = endpoints
+       # One session per endpoint for all threads (web3's own sessions are per thread, so every new
+       # worker thread would open new connections)
+       self.sessions, self.sessions_size = {}, None
+       self.sessions_lock = threading.Lock()
+       self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=RPC_HEDGE_WORKERS, thread_name_prefix="rpc_hedge")
+       self.last_request = 0.0
+  
+   def  warm_up (self):
+       """
+       After a long idle period (the server has closed the pooled connections), reopen a few
+       connections per endpoint in parallel so the cycle's first burst of requests finds them open
+       """
+       if time.monotonic() - self.last_request < HTTP_WARMUP_IDLE_TIME:
+           return
+       futures = [self.executor.submit(self.send, endpoint, "eth_chainId", [])
+                  for endpoint in self.endpoints for _ in range(HTTP_WARMUP_CONNECTIONS)]
+       concurrent.futures.wait(futures)
+  
+   def  send (self, endpoint, method, params):
+       self.last_request = time.monotonic()
+       start = time.perf_counter()
+       try:
+           request_body = self.encode_rpc_request(method, params)
+           http_response = self.session(endpoint).post(
+               endpoint["url"], data=request_body, headers={"Content-Type": "application/json"}, timeout=HTTP_TIMEOUT
+           )
+           record_rpc_bytes(method, len(request_body), len(http_response.content))
+           http_response.raise_for_status()
+           response = self.decode_rpc_response(http_response.content)
+       except Exception:
+           record_endpoint_result(endpoint, time.perf_counter() - start, True)
+           raise
+       record_endpoint_result(endpoint, time.perf_counter() - start, endpoint_response_failed(response))
+       return response
+  
+   def  session (self, endpoint):
+       """
+       The endpoint's session, with a pool sized to the limits in effect. The sessions are rebuilt when the
+       settings change that size; requests already sent on the old ones finish there
+       """
+       pool_size = http_pool_size()
+       if pool_size != self.sessions_size:
+           with self.sessions_lock:
+               if pool_size != self.sessions_size:
+                   self.sessions = {endpoint["url"]: new_http_session(pool_size) for endpoint in self.endpoints}
+                   self.sessions_size = pool_size
+       return self.sessions[endpoint["url"]]
+  
+   def  make_request (self, method, params):
+       ranked = rank_endpoints(self.endpoints)
+       if len(ranked) == 1 or method not in RPC_HEDGE_METHODS:
+           return self.send_with_failover(ranked, method, params)
+      
+       primary = self.executor.submit(self.send, ranked[0], method, params)
+       done, _ = concurrent.futures.wait([primary], timeout=hedge_delay(ranked[0]))
+       if done:
+           try:
+               response = primary.result()
+               if not endpoint_response_failed(response):
+                   return response
+           except Exception:
+               pass
+           return self.send_with_failover(ranked[1:], method, params)
+      
+       record_hedge(ranked[0])
+       pending = {primary, self.executor.submit(self.send_with_failover, ranked[1:], method, params)}
+       last_error = None
+       while pending:
+           done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+           for future in done:
+               try:
+                   response = future.result()
+               except Exception as e:
+                   last_error = e
+                   continue
+               if not endpoint_response_failed(response) or not pending:
+                   return response
+       raise last_error
+  
+   def  send_with_failover (self, endpoints, method, params):
+       for index, endpoint in enumerate(endpoints):
+           try:
+               response = self.send(endpoint, method, params)
+           except Exception:
+               if index == len(endpoints) - 1:
+                   raise
+               continue
+           if not endpoint_response_failed(response) or index == len(endpoints) - 1:
+               return response
+
+class  AsyncRpcEndpointPool(AsyncJSONBaseProvider):
+   """Async counterpart of RpcEndpointPool, sharing its endpoint scores"""
+   def  __init__ (self, endpoints):
+       super().__init__()
+       self.endpoints = endpoints
+       self.sessions = {}
+       self.sessions_loop, self.sessions_size = None, None
+       self.retired_sessions = []  # Sessions replaced after a pool size change, closed with the provider
+       self.last_request = 0.0
+  
+   async def  warm_up (self):
+       """Async counterpart of RpcEndpointPool.warm_up"""
+       if time.monotonic() - self.last_request < HTTP_WARMUP_IDLE_TIME:
+           return
+       await asyncio.gather(*[self.send(endpoint, "eth_chainId", []) for endpoint in self.endpoints for _ in range(HTTP_WARMUP_CONNECTIONS)],
+                            return_exceptions=True)
+  
+   async def  send (self, endpoint, method, params):
+       self.last_request = time.monotonic()
+       start = time.perf_counter()
+       try:
+           session = await self.session(endpoint)
+           request_body = self.encode_rpc_request(method, params)
+           async with session.post(endpoint["url"], data=request_body, headers={"Content-Type": "application/json"}) as http_response:
+               response_body = await http_response.read()
+           record_rpc_bytes(method, len(request_body), len(response_body))
+           response = self.decode_rpc_response(response_body)
+       except Exception:
+           record_endpoint_result(endpoint, time.perf_counter() - start, True)
+           raise
+       record_endpoint_result(endpoint, time.perf_counter() - start, endpoint_response_failed(response))
+       return response
+  
+   async def  make_request (self, method, params):
+       ranked = rank_endpoints(self.endpoints)
+       if len(ranked) == 1 or method not in RPC_HEDGE_METHODS:
+           return await self.send_with_failover(ranked, method, params)
+      
+       primary = asyncio.ensure_future(self.send(ranked[0], method, params))
+       done, _ = await asyncio.wait([primary], timeout=hedge_delay(ranked[0]))
+       if done:
+           if primary.exception() is None and not endpoint_response_failed(primary.result()):
+               return primary.result()
+           return await self.send_with_failover(ranked[1:], method, params)
+      
+       record_hedge(ranked[0])
+       pending = {primary, asyncio.ensure_future(self.send_with_failover(ranked[1:], method, params))}
+       last_error = None
+       try:
+           while pending:
+               done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+               for task in done:
+                   if task.exception() is not None:
+                       last_error = task.exception()
+                       continue
+                   if not endpoint_response_failed(task.result()) or not pending:
+                       return task.result()
+           raise last_error
+       finally:
+           for task in pending:
+               task.cancel()
+  
+   async def  close (self):
+       for session in list(self.sessions.values()) + self.retired_sessions:
+           await session.close()
+       self.sessions, self.retired_sessions = {}, []
+  
+   async def  session (self, endpoint):
+       """
+       The endpoint's aiohttp session for the running event loop, created with a pool sized to the limits in
+       effect and rebuilt when the settings change that size (the old one is closed with the provider)
+       """
+       loop = asyncio.get_running_loop()
+       if loop is not self.sessions_loop:
+           self.sessions, self.retired_sessions, self.sessions_loop = {}, [], loop
+       pool_size = http_pool_size()
+       if pool_size != self.sessions_size:
+           self.retired_sessions.extend(self.sessions.values())
+           self.sessions, self.sessions_size = {}, pool_size
+       session = self.sessions.get(endpoint["url"])
+       if session is None or session.closed:
+           connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+           session = aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip"},
+                                           timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT), raise_for_status=True)
+           self.sessions[endpoint["url"]] = session
+       return session
+  
+   async def  send_with_failover (self, endpoints, method, params):
+       for index, endpoint in enumerate(endpoints):
+           try:
+               response = await self.send(endpoint, method, params)
+           except Exception:
+               if index == len(endpoints) - 1:
+                   raise
+               continue
+           if not endpoint_response_failed(response) or index == len(endpoints) - 1:
+               return response
+
+############################
+# ENVIRONMENT AND WEB3 SETUP
+############################
 
-# Initialize Web3 connections
-ETHEREUM_URL = ETHEREUM_URL_TEMPLATE.format(infura_api_key)
-w3_ethereum = Web3(Web3.HTTPProvider(ETHEREUM_URL))
-# w3_base removed
+def  network_rpc_urls (config):
+   """
+   A network's RPC URLs from the environment (loading ../.env): its RPC URL variable overrides Infura,
+   e.g. for a local node, and several comma-separated URLs are pooled, with requests routed to the
+   fastest healthy one
+   """
+   load_dotenv(dotenv_path="../.env")
+   infura_api_key = os.getenv("INFURA_API_KEY")
+   logger.info(f"Infura API key loaded: {bool(infura_api_key)}")
+   return (os.getenv(config["rpc_url_env"]) or config["rpc_url_template"].format(infura_api_key)).split(",")
 
 ############################
 # TOKEN CONFIGURATION
 ############################
 
-# Token decimals (consistent across networks)
+# Token decimals (consistent across networks); tokens discovered from a token list are added on connection
 TOKEN_DECIMALS = {
    "ETH": 18, "USDC": 6, "USDT": 6, "WBTC": 8, "LINK": 18, "AAVE": 18 # 
 }
@@ -102,25 +594,28 @@ TOKEN_DECIMALS = {
 
 NETWORK_CONFIGS = {
    "ethereum": {
-       "w3": w3_ethereum,
+       "rpc_url_env": "ETHEREUM_RPC_URL",
+       "rpc_url_template": ETHEREUM_URL_TEMPLATE,
        "name": "Ethereum Mainnet",
-       "tokens": { # Reduced to relevant tokens
-           "ETH": w3_ethereum.to_checksum_address("0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"),   # WETH
-           "USDC": w3_ethereum.to_checksum_address("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"),  # USDC
-           "USDT": w3_ethereum.to_checksum_address("0xdAC17F958D2ee523a2206206994597C13D831ec7"),  # USDT 
-           "WBTC": w3_ethereum.to_checksum_address("0x2260FAC5E5542a773Aa44fBCfeDf7C193bc2C599"),  # WBTC
-           "LINK": w3_ethereum.to_checksum_address("0x514910771AF9Ca656af840dff83E8264EcF986CA"),  # LINK 
-           "AAVE": w3_ethereum.to_checksum_address("0x7Fc66500c84A76Ad7e9c93437bFc5Ac33E2DDaE9")   # AAVE
+       "chain_id": 1,
+       "tokens": { # Named tokens; listed tokens are added under their on-chain symbols
+           "ETH": Web3.to_checksum_address("0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"),   # WETH
+           "USDC": Web3.to_checksum_address("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"),  # USDC
+           "USDT": Web3.to_checksum_address("0xdAC17F958D2ee523a2206206994597C13D831ec7"),  # USDT 
+           "WBTC": Web3.to_checksum_address("0x2260FAC5E5542a773Aa44fBCfeDf7C193bc2C599"),  # WBTC
+           "LINK": Web3.to_checksum_address("0x514910771AF9Ca656af840dff83E8264EcF986CA"),  # LINK 
+           "AAVE": Web3.to_checksum_address("0x7Fc66500c84A76Ad7e9c93437bFc5Ac33E2DDaE9")   # AAVE
        },
-       "trade_pairs": [ # Reduced to specified pairs
-           ("USDC", "ETH"), ("USDT", "ETH"),
-           ("USDC", "WBTC"), ("USDT", "WBTC"),
-           ("USDC", "LINK"), ("USDT", "LINK"), # 
-           ("USDC", "AAVE"), ("USDT", "AAVE")
-       ],
+       "token_list_file": os.path.join(SAVE_DIR, "tokens_ethereum.txt"),  # Optional: one address per line, or a Uniswap token list (.json)
+       "pair_quote_tokens": ["USDC", "USDT"],  # trade_pairs: each of these against every other token
        "factory_address": "0x1F98431c8aD98523631AE4a59f267346ea31F984",
+       "pool_init_code_hash": "0xe34f199b19b2b4f47f68442619d555527d244f78a3297ea89325f843f87b8b54", # For local CREATE2 pool addresses
        "quoter_address": "0xb27308f9F90D607463bb33eA1BeBb41C27CE5AB6",
-       "quoter_v2_address": "0x61fFE014bA17989E743c5F6cB21bF9697530B21e"
+       "quoter_v2_address": "0x61fFE014bA17989E743c5F6cB21bF9697530B21e",
+       "multicall3_address": "0xcA11bde05977b3631167028862bE2a173976CA11",
+       "eth_usd_pool_address": "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640",  # USDC/WETH 0.05%, priced for gas costs
+       "eth_usd_stable": "USDC",
+       "settings": {}  # Module settings for this network's collector, e.g. {"RPC_RATE_LIMIT": 25, "QUOTE_ENGINE": "async"}
    }
    # "base" network configuration removed 
 }
@@ -129,31 +624,121 @@ NETWORK_CONFIGS = {
 # GLOBAL STATE
 ############################
 
-# ETH price cache to avoid excessive API calls
-eth_price_cache = {"price": None, "timestamp": None, "cache_duration": ETH_PRICE_CACHE_DURATION}
+# ETH/USD per (chain_id, block) priced (from the WETH/stablecoin pool's slot0), oldest first
+eth_price_cache = {}
+eth_price_lock = threading.Lock()
+price_session = new_http_session(2)  # Reused CoinGecko connection (fallback pricing only)
+
+# Persistent event loop of the async engine, run by its own thread so cycles on several threads can share it
+async_engine = {"loop": None, "thread": None}
+async_engine_lock = threading.Lock()
+async_read_batches = {}  # Reads waiting for the async engine's next aggregate3 call, by (chain_id, block); loop thread only
+
+# Long-lived pair worker pool of the threaded engine per network, (max_workers, executor), shared by overlapping cycles
+pair_executors = {}
+pair_executors_lock = threading.Lock()
+
+# Blocks of the cycles in progress (cycles may overlap in the block scheduler), so one cycle does not drop another's snapshots
+active_cycle_blocks = collections.Counter()
+active_cycle_lock = threading.Lock()
+
+# Output writer: producers enqueue ("rows", table, rows, cycle); the writer thread owns the open files.
+# csv_lock guards the open handles so rows written after the writer stopped are still appended safely
+output_queue = queue.Queue(maxsize=OUTPUT_QUEUE_MAX_ROWS)
+output_writer = {"thread": None, "handles": {}}
+csv_lock = threading.RLock()
+
+# In a network worker process, rows go to the supervisor's queue instead of the output writer
+network_sink = {"queue": None}
+
+# Set to end the collection loop once its running cycles are done (a network worker asked to stop)
+collection_stop = threading.Event()
+
+# LRU memo of contract reads at pinned blocks: (chain_id, block, target, calldata) -> (success, value)
+read_cache = collections.OrderedDict()
+read_cache_lock = threading.Lock()
+
+# Metrics: counters and histograms keyed by (name, labels)
+metrics = {"counters": collections.Counter(), "histograms": {}, "gauges": {}}
+metrics_lock = threading.Lock()
+# Totals of the cycle the current thread or task works for, so overlapping cycles each count their own requests
+metrics_cycle = contextvars.ContextVar("metrics_cycle", default=None)
+
+# Endpoint scores are updated from every provider thread
+rpc_endpoints_lock = threading.Lock()
+
+# Shared RPC limiter state (token bucket + AIMD concurrency limit)
+rpc_limiter = {"lock": threading.Lock(), "tokens": RPC_BURST, "refilled_at": time.monotonic(), "rate": RPC_RATE_LIMIT,
+               "concurrency": RPC_INITIAL_CONCURRENCY, "in_flight": 0, "paused_until": 0.0}
+
+# Networks are connected on first use
+network_init_lock = threading.Lock()
+
+# Token registry: "chain_id:address" -> {"symbol", "decimals"}, or {"error", "checked_at": unix time} if unreadable
+token_registry = {"tokens": {}, "loaded": False, "dirty": False}
+token_registry_lock = threading.Lock()
+
+# Snapshot store: memory-mapped readers by file path, and each pool's last written state for the next delta
+snapshot_store = {"readers": {}, "writers": {}, "last_block": {}}
+snapshot_store_lock = threading.RLock()
+
+# Pool registry: "chain_id:token0:token1:fee" -> {"pool": address or None, "checked_at": unix time}
+pool_registry = {"pools": {}, "loaded": False, "dirty": False}
+pool_registry_lock = threading.Lock()
+
+def  apply_settings (settings):
+   """Override module settings by name, restarting the RPC limiter from the new limits when they change"""
+   limits = (RPC_BURST, RPC_RATE_LIMIT, RPC_INITIAL_CONCURRENCY)
+   globals().update(settings)
+   if (RPC_BURST, RPC_RATE_LIMIT, RPC_INITIAL_CONCURRENCY) != limits:
+       with rpc_limiter["lock"]:
+           rpc_limiter.update(tokens=RPC_BURST, rate=RPC_RATE_LIMIT, concurrency=RPC_INITIAL_CONCURRENCY)
 
-# Thread-safe CSV writing
-csv_lock = threading.Lock()
+@contextlib.contextmanager
+def  overridden_settings (settings):
+   """Apply settings for the duration of a with-block, then restore the previous values (and restart the limiter)"""
+   unknown_settings = [name for name in settings if not name.isupper() or name not in globals()]
+   if unknown_settings:
+       raise Exception(f"Unknown settings: {', '.join(unknown_settings)}")
+   previous = {name: globals()[name] for name in settings}
+   apply_settings(settings)
+   try:
+       yield
+   finally:
+       apply_settings(previous)
+
+@contextlib.contextmanager
+def  restored_entries (table, keys=None, lock=None):
+   """
+   Restore a dict's entries at keys (their values, or their absence) on leaving a with-block. keys None
+   restores the whole dict, dropping the entries added meanwhile
+   """
+   with lock or contextlib.nullcontext():
+       previous = dict(table) if keys is None else {key: table[key] for key in keys if key in table}
+   try:
+       yield
+   finally:
+       with lock or contextlib.nullcontext():
+           for key in list(table) if keys is None else keys:
+               if key not in previous:
+                   table.pop(key, None)
+           table.update(previous)
 
 ################################
 # NETWORK CONNECTION VALIDATION
 ################################
 
-def  validate_network_connections ():
-   """Validate connections to all configured networks"""
-   for network_key, network_info in NETWORK_CONFIGS.items():
-       try:
-           connected = network_info["w3"].is_connected()
-           logger.info(f"{network_info['name']} connection status: {connected}")
-           if not connected:
-               logger.error(f"Could not connect to {network_info['name']}. Please check your connection.") # 
-               sys.exit(1)
-       except Exception as e:
-           logger.error(f"Error connecting to {network_info['name']}: {e}")
-           sys.exit(1)
-
-# Validate connections
-validate_network_connections()
+def  validate_network_connection (network_info):
+   """Validate the connection to a network; raises if its node cannot be reached"""
+   try:
+       connected = network_info["w3"].is_connected()
+   except Exception as e:
+       logger.error(f"Error connecting to {network_info['name']}: {e}")
+       raise
+   logger.info(f"{network_info['name']} connection status: {connected}")
+   if not connected:
+       logger.error(f"Could not connect to {network_info['name']}. Please check your connection.") # 
+       raise Exception(f"Could not connect to {network_info['name']}")
 
 ###############################
 # SIGNAL HANDLERS FOR SHUTDOWN
@@ -162,10 +747,9 @@ validate_network_connections()
 def  signal_handler (sig, frame):
    """Handle graceful shutdown on interrupt"""
    logger.info("Shutting down quote collector...")
+   stop_output_writer()  # Write out every queued row before exiting
    sys.exit(0)
 
-signal.signal(signal.SIGINT, signal_handler)
-
 ############################
 # SET UP ABIs
 ############################
@@ -203,6 +787,44 @@ POOL_ABI = json.loads("""
    "outputs": [{"internalType": "uint128", "name": "", "type": "uint128"}],
    "stateMutability": "view",
    "type": "function"
+ },
+ {
+   "inputs": [],
+   "name": "slot0",
+   "outputs": [
+     {"internalType": "uint160", "name": "sqrtPriceX96", "type": "uint160"},
+     {"internalType": "int24", "name": "tick", "type": "int24"},
+     {"internalType": "uint16", "name": "observationIndex", "type": "uint16"},
+     {"internalType": "uint16", "name": "observationCardinality", "type": "uint16"},
+     {"internalType": "uint16", "name": "observationCardinalityNext", "type": "uint16"},
+     {"internalType": "uint8", "name": "feeProtocol", "type": "uint8"},
+     {"internalType": "bool", "name": "unlocked", "type": "bool"}
+   ],
+   "stateMutability": "view",
+   "type": "function"
+ },
+ {
+   "inputs": [{"internalType": "int16", "name": "wordPosition", "type": "int16"}],
+   "name": "tickBitmap",
+   "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+   "stateMutability": "view",
+   "type": "function"
+ },
+ {
+   "inputs": [{"internalType": "int24", "name": "tick", "type": "int24"}],
+   "name": "ticks",
+   "outputs": [
+     {"internalType": "uint128", "name": "liquidityGross", "type": "uint128"},
+     {"internalType": "int128", "name": "liquidityNet", "type": "int128"},
+     {"internalType": "uint256", "name": "feeGrowthOutside0X128", "type": "uint256"},
+     {"internalType": "uint256", "name": "feeGrowthOutside1X128", "type": "uint256"},
+     {"internalType": "int56", "name": "tickCumulativeOutside", "type": "int56"},
+     {"internalType": "uint160", "name": "secondsPerLiquidityOutsideX128", "type": "uint160"},
+     {"internalType": "uint32", "name": "secondsOutside", "type": "uint32"},
+     {"internalType": "bool", "name": "initialized", "type": "bool"}
+   ],
+   "stateMutability": "view",
+   "type": "function"
  }
 ]
 """)
@@ -261,499 +883,3757 @@ QUOTER_V2_ABI = json.loads("""
 ]
 """)
 
+# Multicall3 contract to batch contract reads, allowing individual calls to fail
+MULTICALL3_ABI = json.loads("""
+[
+ {
+   "inputs": [
+     {
+       "components": [
+         {"internalType": "address", "name": "target", "type": "address"},
+         {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+         {"internalType": "bytes", "name": "callData", "type": "bytes"}
+       ],
+       "internalType": "struct Multicall3.Call3[]",
+       "name": "calls",
+       "type": "tuple[]"
+     }
+   ],
+   "name": "aggregate3",
+   "outputs": [
+     {
+       "components": [
+         {"internalType": "bool", "name": "success", "type": "bool"},
+         {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+       ],
+       "internalType": "struct Multicall3.Result[]",
+       "name": "returnData",
+       "type": "tuple[]"
+     }
+   ],
+   "stateMutability": "payable",
+   "type": "function"
+ }
+]
+""")
+
+# ERC-20 metadata, read once per token for the token registry
+ERC20_ABI = json.loads("""
+[
+ {"inputs": [], "name": "decimals", "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"},
+ {"inputs": [], "name": "symbol", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"}
+]
+""")
+
+# Early tokens (MKR, SAI...) return their symbol as bytes32
+ERC20_BYTES32_SYMBOL_ABI = json.loads("""
+[
+ {"inputs": [], "name": "symbol", "outputs": [{"internalType": "bytes32", "name": "", "type": "bytes32"}], "stateMutability": "view", "type": "function"}
+]
+""")
+
+# Pool events that change the state a quote depends on (price, active liquidity or tick liquidity)
+POOL_EVENT_TOPICS = [Web3.to_hex(Web3.keccak(text=signature)) for signature in [
+   "Swap(address,address,int256,int256,uint160,uint128,int24)",
+   "Mint(address,address,int24,int24,uint128,uint256,uint256)",
+   "Burn(address,int24,int24,uint128,uint256,uint256)"
+]]
+
 ############################
-# CONTRACT INITIALIZATION
+# METRICS
 ############################
 
-def  initialize_network_contracts ():
-   """Initialize smart contracts for all configured networks"""
-   for network_key, config in NETWORK_CONFIGS.items():
-       w3_instance = config["w3"]
-      
-       # Factory contract
-       factory_address = w3_instance.to_checksum_address(config["factory_address"])
-       config["factory"] = w3_instance.eth.contract(address=factory_address, abi=FACTORY_ABI)
-      
-       # Quoter contract (only if address exists)
-       if config["quoter_address"]:
-           quoter_address = w3_instance.to_checksum_address(config["quoter_address"])
-           config["quoter"] = w3_instance.eth.contract(address=quoter_address, abi=QUOTER_ABI) # 
-           config["quoter_available"] = True
-       else:
-           config["quoter"] = None
-           config["quoter_available"] = False
-           logger.info(f"QuoterV1 not available for {config['name']} (using QuoterV2 only)")
-      
-       # QuoterV2 contract (with error handling)
+def  abi_type (abi_input):
+   """Canonical type of an ABI input, expanding tuples for selectors"""
+   if abi_input["type"].startswith("tuple"):
+       return "(" + ",".join(abi_type(component) for component in abi_input["components"]) + ")" + abi_input["type"][len("tuple"):]
+   return abi_input["type"]
+
+# 4-byte selector -> contract function name, to label eth_call metrics with the function being read
+FUNCTION_NAMES_BY_SELECTOR = {
+   Web3.to_hex(Web3.keccak(text=f"{item['name']}({','.join(abi_type(abi_input) for abi_input in item['inputs'])})")[:4]): item["name"]
+   for abi in [FACTORY_ABI, POOL_ABI, QUOTER_ABI, QUOTER_V2_ABI, MULTICALL3_ABI, ERC20_ABI]
+   for item in abi if item.get("type") == "function"
+}
+
+def  record_count (name, labels=(), value=1, cycle=None):
+   """Add to a counter (and to the cycle's total of that counter, by default the calling context's cycle)"""
+   cycle = cycle or metrics_cycle.get()
+   with metrics_lock:
+       metrics["counters"][(name, labels)] += value
+       if cycle is not None:
+           cycle["totals"][(name, labels)] += value
+
+def  record_rpc_request (method, params, response, error, start):
+   """Record one provider request: count, latency histogram and errors by type"""
+   elapsed = time.perf_counter() - start
+   function = "-"
+   if method == "eth_call" and params and isinstance(params[0], dict):
+       function = FUNCTION_NAMES_BY_SELECTOR.get(str(params[0].get("data") or params[0].get("input") or "")[:10], "unknown")
+   labels = (("method", method), ("function", function))
+  
+   error_type = None
+   if error is not None:
+       status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status", None)
+       error_type = f"http_{status}" if status else type(error).__name__
+   elif isinstance(response, dict) and "error" in response:
+       error_type = f"rpc_{response['error'].get('code', 'unknown')}" if isinstance(response["error"], dict) else "rpc_error"
+  
+   cycle = metrics_cycle.get()
+   with metrics_lock:
+       metrics["counters"][("rpc_requests_total", labels)] += 1
+       if cycle is not None:
+           cycle["totals"][("rpc_requests_total", labels)] += 1
+       if error_type:
+           metrics["counters"][("rpc_errors_total", labels + (("error", error_type),))] += 1
+       histogram = metrics["histograms"].setdefault(labels, [0] * len(METRICS_LATENCY_BUCKETS) + [0, 0.0])
+       for index, bucket in enumerate(METRICS_LATENCY_BUCKETS):
+           if elapsed <= bucket:
+               histogram[index] += 1
+       histogram[-2] += 1
+       histogram[-1] += elapsed
+
+def  record_rpc_bytes (method, request_bytes, response_bytes):
+   """Count the HTTP body bytes of one endpoint attempt (hedges and failovers included), as measured by the provider"""
+   if not ENABLE_METRICS:
+       return
+   with metrics_lock:
+       metrics["counters"][("rpc_request_bytes_total", (("method", method),))] += request_bytes
+       metrics["counters"][("rpc_response_bytes_total", (("method", method),))] += response_bytes
+
+def  rpc_metrics_middleware (make_request, w3):
+   """Web3 middleware (innermost layer, so it sees the raw JSON-RPC request and response) recording metrics"""
+   def  middleware (method, params):
+       start = time.perf_counter()
+       response, error = None, None
        try:
-           quoter_v2_address = w3_instance.to_checksum_address(config["quoter_v2_address"]) # 
-           config["quoter_v2"] = w3_instance.eth.contract(address=quoter_v2_address, abi=QUOTER_V2_ABI)
-           config["quoter_v2_available"] = True
-           logger.info(f"QuoterV2 contract initialized successfully for {config['name']}")
-       except Exception as e:
-           config["quoter_v2_available"] = False
-           logger.warning(f"Warning: QuoterV2 contract not available for {config['name']}: {e}")
+           response = make_request(method, params)
+           return response
+       except BaseException as e:
+           error = e
+           raise
+       finally:
+           record_rpc_request(method, params, response, error, start)
+   return middleware
+
+async def  async_rpc_metrics_middleware (make_request, w3):
+   """Async counterpart of rpc_metrics_middleware for AsyncWeb3"""
+   async def  middleware (method, params):
+       start = time.perf_counter()
+       response, error = None, None
+       try:
+           response = await make_request(method, params)
+           return response
+       except BaseException as e:
+           error = e
+           raise
+       finally:
+           record_rpc_request(method, params, response, error, start)
+   return middleware
+
+def  format_labels (labels):
+   """Prometheus label set: {name="value",...}"""
+   if not labels:
+       return ""
+   return "{" + ",".join(f'{name}="{str(value)}"' for name, value in labels) + "}"
+
+def  render_metrics ():
+   """All metrics in the Prometheus text exposition format"""
+   lines = []
+   with metrics_lock:
+       counters = dict(metrics["counters"])
+       histograms = {labels: list(histogram) for labels, histogram in metrics["histograms"].items()}
+       gauges = dict(metrics["gauges"])
+   with rpc_endpoints_lock:
+       for network_key, config in NETWORK_CONFIGS.items():
+           for endpoint in config.get("rpc_endpoints", []):
+               labels = (("network", network_key), ("endpoint", endpoint["label"]))
+               for outcome, count in endpoint["requests"].items():
+                   counters[("rpc_endpoint_requests_total", labels + (("outcome", outcome),))] = count
+               counters[("rpc_endpoint_hedged_requests_total", labels)] = endpoint["hedged"]
+               gauges[("rpc_endpoint_latency_seconds", labels)] = round(endpoint["latency"], 4)
+               gauges[("rpc_endpoint_error_rate", labels)] = round(endpoint["errors"], 4)
+  
+   for metric_name in sorted({name for name, _ in counters}):
+       lines.append(f"# TYPE uniswap_{metric_name} counter")
+       for (name, labels), value in sorted(counters.items()):
+           if name == metric_name:
+               lines.append(f"uniswap_{name}{format_labels(labels)} {value}")
+  
+   lines.append("# TYPE uniswap_rpc_request_duration_seconds histogram")
+   for labels, histogram in sorted(histograms.items()):
+       for bucket, count in zip(METRICS_LATENCY_BUCKETS, histogram):
+           lines.append(f"uniswap_rpc_request_duration_seconds_bucket{format_labels(labels + (('le', bucket),))} {count}")
+       lines.append(f"uniswap_rpc_request_duration_seconds_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram[-2]}")
+       lines.append(f"uniswap_rpc_request_duration_seconds_count{format_labels(labels)} {histogram[-2]}")
+       lines.append(f"uniswap_rpc_request_duration_seconds_sum{format_labels(labels)} {histogram[-1]}")
+  
+   for metric_name in sorted({name for name, _ in gauges}):
+       lines.append(f"# TYPE uniswap_{metric_name} gauge")
+       for (name, labels), value in sorted(gauges.items()):
+           if name == metric_name:
+               lines.append(f"uniswap_{name}{format_labels(labels)} {value}")
+   return "\n".join(lines) + "\n"
+
+def  start_metrics_cycle ():
+   """
+   Start the totals of a cycle in the calling context; threads and tasks started with a copy of it
+   (the cycle's pair workers and coroutines) add to them too. Returns the cycle for finish_metrics_cycle
+   """
+   cycle = {"totals": collections.Counter(), "start": time.time()}
+   cycle["token"] = metrics_cycle.set(cycle)
+   return cycle
 
-# Initialize contracts on startup
-initialize_network_contracts()
+def  finish_metrics_cycle (network_key, cycle):
+   """Publish the cycle's totals as last_cycle_* gauges, log them as the cycle's summary record and export the metrics"""
+   with metrics_lock:
+       gauges = metrics["gauges"]
+       for key in [key for key in gauges if key[0].startswith("last_cycle_") and key[1][:1] == (("network", network_key),)]:
+           del gauges[key]
+       totals = collections.Counter({("rows_written_total", (("table", "quotes"),)): 0, ("fee_tier_fallbacks_total", ()): 0,
+                                     ("slippage_rejections_total", ()): 0})
+       for (name, labels), value in cycle["totals"].items():
+           totals[(name, tuple(label for label in labels if label[0] != "function"))] += value
+       for (name, labels), value in totals.items():
+           gauges[(f"last_cycle_{name}", (("network", network_key),) + labels)] = value
+       duration = time.time() - cycle["start"]
+       gauges[("last_cycle_duration_seconds", (("network", network_key),))] = duration
+       gauges[("last_cycle_timestamp_seconds", (("network", network_key),))] = time.time()
+   summary = {f"{name}{format_labels(labels)}": value for (name, labels), value in sorted(totals.items())}
+   logger.info("[%s] Cycle summary: %.2fs, %s", NETWORK_CONFIGS[network_key]["name"], duration,
+               ", ".join(f"{name}={value}" for name, value in summary.items()),
+               extra={"network": network_key, "duration_seconds": duration, "totals": summary})
+   metrics_cycle.reset(cycle["token"])
+   export_metrics()
+
+def  export_metrics ():
+   """Write the metrics file for a Prometheus textfile collector (atomic replace)"""
+   if not ENABLE_METRICS or not METRICS_FILE:
+       return
+   try:
+       tmp_file = METRICS_FILE + ".tmp"
+       os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+       with open(tmp_file, "w") as f:
+           f.write(render_metrics())
+       os.replace(tmp_file, METRICS_FILE)
+   except Exception as e:
+       logger.warning(f"Could not write metrics file {METRICS_FILE}: {e}")
+
+def  start_metrics_server ():
+   """Serve /metrics on METRICS_HTTP_PORT from a background thread"""
+   if not ENABLE_METRICS or not METRICS_HTTP_PORT:
+       return
+
+   class  MetricsHandler (BaseHTTPRequestHandler):
+       def  do_GET (self):
+           payload = render_metrics().encode()
+           self.send_response(200 if self.path == "/metrics" else 404)
+           self.send_header("Content-Type", "text/plain; version=0.0.4")
+           self.send_header("Content-Length", str(len(payload)))
+           self.end_headers()
+           self.wfile.write(payload)
+
+       def  log_message (self, format, *args):
+           pass
+
+   server = ThreadingHTTPServer(("127.0.0.1", METRICS_HTTP_PORT), MetricsHandler)
+   threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+   logger.info(f"Serving metrics on http://127.0.0.1:{METRICS_HTTP_PORT}/metrics")
 
 ############################
-# UTILITY FUNCTIONS # 
+# RPC RATE LIMITING
 ############################
 
-def  get_current_eth_price ():
+class  RpcThrottledError(Exception):
+   """The node kept throttling a request after all retries"""
+
+def  throttle_retry_after (response=None, error=None):
    """
-   Get current ETH price in USD from CoinGecko API and cache it
+   Whether a provider response or exception is a throttling error (HTTP 429 or a JSON-RPC rate limit
+   error). Returns the delay the node asked for (0.0 if it gave none), or None when not throttled
    """
-   current_time = time.time()
-  
-   # Check if we have a cached price that's still valid
-   if (eth_price_cache["price"] is not None and
-       eth_price_cache["timestamp"] is not None and
-       current_time - eth_price_cache["timestamp"] < eth_price_cache["cache_duration"]):
-       return eth_price_cache["price"]
+   if error is not None:
+       http_response = getattr(error, "response", None)
+       status = getattr(http_response, "status_code", None) or getattr(error, "status", None)
+       if status != 429:
+           return None
+       headers = getattr(http_response, "headers", None) or getattr(error, "headers", None) or {}
+       try:
+           return float(headers.get("Retry-After", 0))
+       except (TypeError, ValueError):
+           return 0.0
   
-   try:
-       # Fetch from CoinGecko API
-       response = requests.get( # 
-           "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd",
-           timeout=10
-       )
-       response.raise_for_status()
-       data = response.json()
-      
-       eth_price = data["ethereum"]["usd"]
-      
-       # Update cache
-       eth_price_cache["price"] = eth_price
-       eth_price_cache["timestamp"] = current_time
-       logger.info(f"Fetched current ETH price: ${eth_price}") # 
-       return eth_price
-      
-   except Exception as e:
-       logger.warning(f"Failed to fetch ETH price from CoinGecko: {e}")
-      
-       # Fallback to cached price if available
-       if eth_price_cache["price"] is not None:
-           logger.info(f"Using cached ETH price: ${eth_price_cache['price']}")
-           return eth_price_cache["price"] # 
-      
-       # Final fallback to approximate price
-       logger.warning("Using fallback ETH price of $3000")
-       return 3000
+   rpc_error = response.get("error") if isinstance(response, dict) else None
+   if not isinstance(rpc_error, dict):
+       return None
+   if rpc_error.get("code") in RPC_THROTTLE_ERROR_CODES or "rate limit" in str(rpc_error.get("message", "")).lower():
+       return 0.0
+   return None
 
-def  write_quote_row (row):
-   """Write a quote to the CSV file in a thread-safe manner"""
-   with csv_lock:
-       file_exists = os.path.isfile(CSV_FILE)
-       with open(CSV_FILE, "a", newline="") as f:
-           writer = csv.DictWriter(f, fieldnames=row.keys()) # 
-           if not file_exists:
-               writer.writeheader()
-           writer.writerow(row)
+def  limiter_try_acquire ():
+   """
+   Take a concurrency slot and a token from the shared limiter.
+   Returns 0.0 when acquired, otherwise the seconds to wait before trying again
+   """
+   with rpc_limiter["lock"]:
+       now = time.monotonic()
+       rpc_limiter["tokens"] = min(RPC_BURST, rpc_limiter["tokens"] + (now - rpc_limiter["refilled_at"]) * rpc_limiter["rate"])
+       rpc_limiter["refilled_at"] = now
+       if now < rpc_limiter["paused_until"]:
+           return rpc_limiter["paused_until"] - now
+       if rpc_limiter["in_flight"] >= int(rpc_limiter["concurrency"]):
+           return RPC_SLOT_POLL_INTERVAL
+       if rpc_limiter["tokens"] < 1:
+           return (1 - rpc_limiter["tokens"]) / rpc_limiter["rate"]
+       rpc_limiter["tokens"] -= 1
+       rpc_limiter["in_flight"] += 1
+       return 0.0
 
-def  detect_unreasonable_slippage (amount_in_small, amount_out_small, amount_in_large, amount_out_large, token_symbol=None):
+def  limiter_release (latency, throttled=False, failed=False, retry_after=0.0):
    """
-   Simulate slippage between small and large trades
+   Return a slot and adapt the limits (AIMD): add about one slot per window of healthy requests,
+   shrink on slow or failed requests, and halve concurrency and rate on throttling, pausing every
+   request for the backoff (with jitter) so the node can recover
    """
-   if amount_in_small == 0 or amount_out_small == 0:
-       return False # 
+   with rpc_limiter["lock"]:
+       rpc_limiter["in_flight"] -= 1
+       concurrency = rpc_limiter["concurrency"]
+       if throttled:
+           now = time.monotonic()
+           # One decrease per backoff window, however many requests were throttled together
+           if now >= rpc_limiter["paused_until"]:
+               rpc_limiter["concurrency"] = max(RPC_MIN_CONCURRENCY, concurrency * RPC_THROTTLE_DECREASE)
+               rpc_limiter["rate"] = max(RPC_MIN_RATE_LIMIT, rpc_limiter["rate"] * RPC_THROTTLE_DECREASE)
+               rpc_limiter["paused_until"] = now + max(retry_after, RPC_BACKOFF_BASE * random.uniform(0.5, 1.5))
+       elif failed or latency > RPC_LATENCY_TARGET:
+           rpc_limiter["concurrency"] = max(RPC_MIN_CONCURRENCY, concurrency * RPC_SLOW_DECREASE)
+       else:
+           rpc_limiter["concurrency"] = min(RPC_MAX_CONCURRENCY, concurrency + 1 / concurrency)
+           rpc_limiter["rate"] = min(RPC_RATE_LIMIT, rpc_limiter["rate"] + RPC_RATE_INCREASE / concurrency)
+       limits = rpc_limiter["concurrency"], rpc_limiter["rate"]
+   with metrics_lock:
+       metrics["gauges"][("rpc_concurrency_limit", ())] = round(limits[0], 2)
+       metrics["gauges"][("rpc_rate_limit", ())] = round(limits[1], 2)
+
+def  throttle_backoff (attempt, retry_after):
+   """Exponential backoff with jitter for a throttled request's retry"""
+   return max(retry_after, min(RPC_BACKOFF_MAX, RPC_BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1.5))
+
+def  raise_if_throttled (results):
+   """Re-raise a throttling error among gathered results, so it is not taken for a failed read"""
+   for result in results:
+       if isinstance(result, RpcThrottledError):
+           raise result
+
+def  rpc_limiter_middleware (make_request, w3):
+   """
+   Web3 middleware sending every request through the shared limiter. Throttled requests are retried
+   with backoff and raise RpcThrottledError once retries run out, so callers never mistake throttling
+   for a failed read
+   """
+   def  middleware (method, params):
+       for attempt in range(RPC_MAX_RETRIES + 1):
+           wait = limiter_try_acquire()
+           while wait > 0:
+               time.sleep(wait)
+               wait = limiter_try_acquire()
+          
+           # Release in finally so a cancelled request (CancelledError is not an Exception) still returns its slot
+           start = time.perf_counter()
+           retry_after, failed = None, False
+           try:
+               response = make_request(method, params)
+               retry_after = throttle_retry_after(response=response)
+           except Exception as e:
+               retry_after, failed = throttle_retry_after(error=e), True
+               if retry_after is None:
+                   raise
+           finally:
+               limiter_release(time.perf_counter() - start, throttled=retry_after is not None, failed=failed, retry_after=retry_after or 0.0)
+           if retry_after is None:
+               return response
+          
+           record_count("rpc_throttled_total", (("method", method),))
+           if attempt < RPC_MAX_RETRIES:
+               delay = throttle_backoff(attempt, retry_after)
+               logger.warning(f"RPC {method} throttled by the node, retrying in {delay:.2f}s")
+               time.sleep(delay)
+       raise RpcThrottledError(f"{method} throttled by the node after {RPC_MAX_RETRIES} retries")
+   return middleware
+
+async def  async_rpc_limiter_middleware (make_request, w3):
+   """Async counterpart of rpc_limiter_middleware, sharing the same limiter"""
+   async def  middleware (method, params):
+       for attempt in range(RPC_MAX_RETRIES + 1):
+           wait = limiter_try_acquire()
+           while wait > 0:
+               await asyncio.sleep(wait)
+               wait = limiter_try_acquire()
+          
+           # Release in finally so a cancelled request (CancelledError is not an Exception) still returns its slot
+           start = time.perf_counter()
+           retry_after, failed = None, False
+           try:
+               response = await make_request(method, params)
+               retry_after = throttle_retry_after(response=response)
+           except Exception as e:
+               retry_after, failed = throttle_retry_after(error=e), True
+               if retry_after is None:
+                   raise
+           finally:
+               limiter_release(time.perf_counter() - start, throttled=retry_after is not None, failed=failed, retry_after=retry_after or 0.0)
+           if retry_after is None:
+               return response
+          
+           record_count("rpc_throttled_total", (("method", method),))
+           if attempt < RPC_MAX_RETRIES:
+               delay = throttle_backoff(attempt, retry_after)
+               logger.warning(f"RPC {method} throttled by the node, retrying in {delay:.2f}s")
+               await asyncio.sleep(delay)
+       raise RpcThrottledError(f"{method} throttled by the node after {RPC_MAX_RETRIES} retries")
+   return middleware
+
+############################
+# CONTRACT INITIALIZATION
+############################
+
+def  initialize_network_contracts (config):
+   """Initialize a network's smart contracts and async connection"""
+   w3_instance = config["w3"]
   
-   # Get token-specific slippage tolerance
-   max_slippage_ratio = SLIPPAGE_TOLERANCE_BY_TOKEN.get(token_symbol, SLIPPAGE_TOLERANCE_BY_TOKEN['default'])
+   # Factory contract
+   factory_address = w3_instance.to_checksum_address(config["factory_address"])
+   config["factory"] = PrecompiledContract(factory_address, FACTORY_ABI)
   
-   # Calculate price per unit for both trades
-   price_small = amount_out_small / amount_in_small
-   price_large = amount_out_large / amount_in_large
+   # Quoter contract (only if address exists)
+   if config["quoter_address"]:
+       quoter_address = w3_instance.to_checksum_address(config["quoter_address"])
+       config["quoter"] = PrecompiledContract(quoter_address, QUOTER_ABI) # 
+       config["quoter_available"] = True
+   else:
+       config["quoter"] = None
+       config["quoter_available"] = False
+       logger.info(f"QuoterV1 not available for {config['name']} (using QuoterV2 only)")
   
-   # Calculate the ratio of input amounts
-   input_ratio = amount_in_large / amount_in_small
+   # QuoterV2 contract (with error handling)
+   try:
+       quoter_v2_address = w3_instance.to_checksum_address(config["quoter_v2_address"]) # 
+       config["quoter_v2"] = PrecompiledContract(quoter_v2_address, QUOTER_V2_ABI)
+       config["quoter_v2_available"] = True
+       logger.info(f"QuoterV2 contract initialized successfully for {config['name']}")
+   except Exception as e:
+       config["quoter_v2_available"] = False
+       logger.warning(f"Warning: QuoterV2 contract not available for {config['name']}: {e}")
   
-   # Calculate the ratio of output amounts
-   output_ratio = amount_out_large / amount_out_small
+   # Multicall3 contract (only if address exists)
+   if config.get("multicall3_address"):
+       multicall3_address = w3_instance.to_checksum_address(config["multicall3_address"])
+       config["multicall3"] = PrecompiledContract(multicall3_address, MULTICALL3_ABI)
+       config["multicall3_available"] = True
+   else:
+       config["multicall3"] = None
+       config["multicall3_available"] = False
+       logger.info(f"Multicall3 not available for {config['name']} (reads will be sent individually)")
   
-   # If output ratio is significantly less than input ratio, we have excessive slippage
-   slippage_ratio = 1 - (output_ratio / input_ratio) # 
+   # Async Web3 connection for the async quote engine
+   config["async_w3"] = AsyncWeb3(AsyncRpcEndpointPool(config["rpc_endpoints"]))
   
-   logger.info(f"Slippage analysis for {token_symbol or 'unknown'}: input_ratio={input_ratio:.2f}, output_ratio={output_ratio:.2f}, slippage_ratio={slippage_ratio:.4f}, tolerance={max_slippage_ratio:.2f}")
+   # Every request is a read without a chainId, so the validation middleware's eth_chainId
+   # request ahead of each eth_call would only double the requests
+   w3_instance.middleware_onion.remove("validation")
+   config["async_w3"].middleware_onion.remove("validation")
   
-   return slippage_ratio > max_slippage_ratio
+   # Shared adaptive limiter around every provider request (outside the metrics layer, so each attempt is measured)
+   if ENABLE_RPC_LIMITER:
+       w3_instance.middleware_onion.inject(rpc_limiter_middleware, "rpc_limiter", layer=0)
+       config["async_w3"].middleware_onion.inject(async_rpc_limiter_middleware, "rpc_limiter", layer=0)
+  
+   # Record every provider request
+   if ENABLE_METRICS:
+       w3_instance.middleware_onion.inject(rpc_metrics_middleware, "rpc_metrics", layer=0)
+       config["async_w3"].middleware_onion.inject(async_rpc_metrics_middleware, "rpc_metrics", layer=0)
+  
+   # WETH/stablecoin pool pricing ETH for gas costs
+   config["eth_usd_pool"] = PrecompiledContract(w3_instance.to_checksum_address(config["eth_usd_pool_address"]), POOL_ABI)
+  
+   # Pool state snapshots for local quoting, keyed by (block, pool address)
+   config["pool_snapshots"] = {}
+
+def  initialize_network (network_key, rpc_urls=None):
+   """
+   Connect a network and set up its contracts on first use; later calls return the ready config.
+   rpc_urls overrides the URLs from the environment. Raises if the node cannot be reached
+   """
+   config = NETWORK_CONFIGS[network_key]
+   if config.get("initialized"):
+       return config
+   with network_init_lock:
+       if not config.get("initialized"):
+           urls = rpc_urls or network_rpc_urls(config)
+           config["rpc_url"] = urls[0]
+           config["rpc_endpoints"] = new_rpc_endpoints(urls)
+           config["w3"] = Web3(RpcEndpointPool(config["rpc_endpoints"]))
+           validate_network_connection(config)
+           initialize_network_contracts(config)
+           initialize_tokens(config)
+           config["initialized"] = True
+   return config
 
 ############################
-# UNISWAP FUNCTIONS
+# QUOTE RECORDS
 ############################
 
-def  find_best_pool_with_liquidity (token_in, token_out, amount_in, token_in_symbol, network="ethereum"):
+@dataclasses.dataclass(slots=True)
+class  QuoteRecord:
    """
-   Find the pool with the lowest fee tier that has sufficient liquidity based on slippage check
+   One quote, in output column order, with native values: raw token amounts as ints, prices and
+   costs as floats, None where a value is missing. Values are only formatted by the output writer
    """
-   config = NETWORK_CONFIGS[network]
-   w3_instance = config["w3"]
-   factory_contract = config["factory"]
-  
-   decimals_in = TOKEN_DECIMALS[token_in_symbol]
-   # notional_amount = amount_in / (10 ** decimals_in) # This was for logging only, can be removed if not used
-  
-   logger.info(f"[{config['name']}] Looking for available pools for {token_in_symbol}")
-  
-   # Check all fee tiers from lowest to highest
-   for fee in POOL_FEE_TIERS:
-       try:
-           pool_address = factory_contract.functions.getPool(token_in, token_out, fee).call()
-           if pool_address != "0x0000000000000000000000000000000000000000":
-               logger.info(f"[{config['name']}] Found pool with fee tier {fee/10000}% at {pool_address}") # 
-              
+   timestamp: dt.datetime
+   block_number: int | None
+   quoter: str
+   aggregator: str
+   network: str
+   token_in_chain_id: int
+   token_out_chain_id: int
+   direction: str
+   notional: float
+   selling: float
+   token_in_symbol: str
+   token_in_address: str
+   receiving: float
+   token_out_symbol: str
+   token_out_address: str
+   amount_in: int
+   amount_out: int
+   amount_out_decimals: float
+   price: float
+   fee: float
+   interface_fee: float
+   gas_compute: int
+   gas_cost_eth: float
+   gas_cost_usd: float
+   effective_price: float
+   pool_address: str | None
+   fee_tier: int
+   pool_fee: float
+   fetch_time: str | None
+   slippage_percentage: float | None
+
+QUOTE_COLUMNS = [field.name for field in dataclasses.fields(QuoteRecord)]
+CSV_MISSING_VALUES = {"pool_address": "unknown", "fetch_time": "N/A", "slippage_percentage": "Missing"}  # Written for None, else empty
+
+def  row_columns (row):
+   """Output columns of a row: a QuoteRecord, or a dict for the other tables"""
+   return QUOTE_COLUMNS if isinstance(row, QuoteRecord) else list(row.keys())
+
+def  row_value (row, column):
+   return getattr(row, column) if isinstance(row, QuoteRecord) else row.get(column)
+
+def  csv_values (row, columns):
+   """A row's values as written to CSV"""
+   values = []
+   for column in columns:
+       value = row_value(row, column)
+       if value is None:
+           value = CSV_MISSING_VALUES.get(column, "")
+       elif isinstance(value, dt.datetime):
+           value = value.isoformat()
+       values.append(value)
+   return values
+
+############################
+# OUTPUT WRITER
+############################
+
+# Parquet column types per output table; columns not listed are stored as strings.
+# uint256 amounts are decimal256(76, 0), which covers any real token amount exactly
+PARQUET_COLUMN_TYPES = {
+   "quotes": {
+       "timestamp": "timestamp", "block_number": "int", "quoter": "category", "aggregator": "category", "network": "category",
+       "token_in_chain_id": "int", "token_out_chain_id": "int", "direction": "category",
+       "notional": "float", "selling": "float", "token_in_symbol": "category", "token_in_address": "category",
+       "receiving": "float", "token_out_symbol": "category", "token_out_address": "category",
+       "amount_in": "uint256", "amount_out": "uint256", "amount_out_decimals": "float", "price": "float",
+       "fee": "float", "interface_fee": "float", "gas_compute": "int", "gas_cost_eth": "float",
+       "gas_cost_usd": "float", "effective_price": "float", "pool_address": "category", "fee_tier": "int",
+       "pool_fee": "float", "fetch_time": "category", "slippage_percentage": "float"
+   },
+   "curves": {
+       "timestamp": "timestamp", "network": "category", "direction": "category", "token_in_symbol": "category",
+       "token_out_symbol": "category", "points": "int", "notionals": "float_list", "amount_out": "uint256_list",
+       "effective_price": "float_list", "slippage_percentage": "float_list", "gas_cost_usd": "float_list",
+       "fee_tier": "int_list"
+   },
+   "fee_tier_probes": {
+       "timestamp": "timestamp", "network": "category", "direction": "category", "notional": "float",
+       "fee_tier": "int", "pool_address": "category", "status": "category", "amount_out": "uint256",
+       "gas_compute": "int", "effective_price": "float", "slippage_percentage": "float", "error": "string"
+   }
+}
+PARQUET_SORT_COLUMNS = ["direction", "notional", "timestamp"]  # Row order inside each row group, for tighter page statistics
+
+def  import_pyarrow ():
+   """Import pyarrow on first use, so it is only required for OUTPUT_FORMAT = "parquet" """
+   try:
+       import pyarrow
+       import pyarrow.parquet
+   except ImportError:
+       raise Exception("OUTPUT_FORMAT 'parquet' requires pyarrow (pip install pyarrow)")
+   return pyarrow, pyarrow.parquet
+
+def  parquet_type (pa, kind):
+   """Arrow type for a PARQUET_COLUMN_TYPES kind"""
+   scalar_types = {
+       "timestamp": pa.timestamp("us", tz="UTC"),
+       "category": pa.dictionary(pa.int32(), pa.string()),
+       "int": pa.int64(),
+       "float": pa.float64(),
+       "uint256": pa.decimal256(76, 0),
+       "string": pa.string()
+   }
+   if kind.endswith("_list"):
+       return pa.list_(scalar_types[kind[:-len("_list")]])
+   return scalar_types[kind]
+
+def  parquet_value (kind, value):
+   """Convert a row value (CSV rows carry numbers as strings) to the Python value Arrow expects"""
+   if value is None or value in ("", "Missing", "N/A", "unknown") and kind not in ("category", "string"):
+       return None
+   if kind.endswith("_list"):
+       values = json.loads(value) if isinstance(value, str) else value
+       return [parquet_value(kind[:-len("_list")], item) for item in values]
+   if kind == "timestamp":
+       return dt.datetime.fromisoformat(value) if isinstance(value, str) else value
+   if kind == "int":
+       return int(value)
+   if kind == "float":
+       return float(value)
+   if kind == "uint256":
+       return decimal.Decimal(int(value))
+   return str(value)
+
+def  open_output_handle (table, date, fieldnames):
+   """
+   Open the table's file for a date. CSV files are appended to, writing the header if the file
+   is new; Parquet files cannot be appended to, so a restart on the same day starts a new file,
+   as does a CSV file whose header has other columns
+   """
+   path = f"{OUTPUT_FILE_PREFIXES[table]}{date}.{OUTPUT_FORMAT}"
+   os.makedirs(os.path.dirname(path), exist_ok=True)
+   if OUTPUT_FORMAT == "parquet":
+       pa, pq = import_pyarrow()
+       column_types = PARQUET_COLUMN_TYPES.get(table, {})
+       schema = pa.schema([(column, parquet_type(pa, column_types.get(column, "string"))) for column in fieldnames])
+       part = 0
+       while os.path.exists(path):
+           part += 1
+           path = f"{OUTPUT_FILE_PREFIXES[table]}{date}_{dt.datetime.now().strftime('%H%M%S')}{f'_{part}' if part > 1 else ''}.{OUTPUT_FORMAT}"
+       f = open(path, "wb")
+       writer = pq.ParquetWriter(f, schema, compression=PARQUET_COMPRESSION)
+       return {"date": date, "file": f, "writer": writer, "table": table, "schema": schema, "rows": [], "sources": [],
+               "opened_at": time.time()}
+  
+   if os.path.isfile(path) and os.path.getsize(path) > 0:
+       with open(path, newline="") as existing:
+           if next(csv.reader(existing), None) != list(fieldnames):
+               path = f"{OUTPUT_FILE_PREFIXES[table]}{date}_{dt.datetime.now().strftime('%H%M%S')}.{OUTPUT_FORMAT}"
+   f = open(path, "a", newline="")
+   writer = csv.writer(f)
+   if f.tell() == 0:
+       writer.writerow(fieldnames)
+   return {"date": date, "file": f, "writer": writer, "columns": list(fieldnames)}
+
+def  write_parquet_row_group (handle):
+   """Write the rows buffered since the last cycle boundary as one sorted row group"""
+   rows, sources = handle.pop("rows"), handle.pop("sources")
+   handle["rows"], handle["sources"] = [], []
+   if not rows:
+       return
+   pa, _ = import_pyarrow()
+   sort_columns = [column for column in PARQUET_SORT_COLUMNS if column in handle["schema"].names]
+   column_types = PARQUET_COLUMN_TYPES.get(handle["table"], {})
+   rows.sort(key=lambda row: tuple(parquet_value(column_types.get(column, "string"), row_value(row, column)) for column in sort_columns))
+   columns = {
+       field.name: pa.array([parquet_value(column_types.get(field.name, "string"), row_value(row, field.name)) for row in rows], type=field.type)
+       for field in handle["schema"]
+   }
+   handle["writer"].write_table(pa.Table.from_pydict(columns, schema=handle["schema"]), row_group_size=len(rows))
+   for cycle, count in sources:
+       record_count("rows_written_total", (("table", handle["table"]),), count, cycle)
+
+def  write_output_rows (batches, sources=None):
+   """
+   Append buffered rows, {table: [row]}, keeping each table's file open between batches.
+   Parquet rows are held until the cycle boundary so each cycle is one row group.
+   Rolls over to a new file when the date changes. sources, {table: [(cycle, row count)]}, tells which
+   cycles the rows came from (by default the calling context's), so they are counted once written
+   """
+   date = dt.datetime.now().strftime("%Y%m%d")
+   sources = sources or {table: [(metrics_cycle.get(), len(rows))] for table, rows in batches.items()}
+   with csv_lock:
+       handles = output_writer["handles"]
+       for table, rows in batches.items():
+           if not rows:
+               continue
+           handle = handles.get(table)
+           if handle is not None and handle["date"] != date:
+               close_output_handle(handles.pop(table))
+               handle = None
+           if handle is None:
+               handle = handles[table] = open_output_handle(table, date, row_columns(rows[0]))
+           if "rows" in handle:
+               handle["rows"].extend(rows)
+               handle["sources"].extend(sources[table])
+           else:
+               handle["writer"].writerows(csv_values(row, handle["columns"]) for row in rows)
+               handle["file"].flush()
+               for cycle, count in sources[table]:
+                   record_count("rows_written_total", (("table", table),), count, cycle)
+
+def  close_output_handle (handle):
+   """fsync and close one table's file (for Parquet, after writing the pending row group and footer)"""
+   if "rows" in handle:
+       write_parquet_row_group(handle)
+       handle["writer"].close()
+   handle["file"].flush()
+   os.fsync(handle["file"].fileno())
+   handle["file"].close()
+
+def  sync_output_handles (close=False):
+   """
+   fsync every open output file to disk, closing them when the writer shuts down. Parquet files past
+   PARQUET_FILE_ROLLOVER_SECONDS are closed too (the next rows start a new file), so a crash only loses
+   the file still open
+   """
+   with csv_lock:
+       handles = output_writer["handles"]
+       for table in list(handles):
+           if close or ("rows" in handles[table] and time.time() - handles[table]["opened_at"] >= PARQUET_FILE_ROLLOVER_SECONDS):
+               close_output_handle(handles.pop(table))
+               continue
+           if "rows" in handles[table]:
+               write_parquet_row_group(handles[table])
+           handles[table]["file"].flush()
+           os.fsync(handles[table]["file"].fileno())
+
+def  output_writer_loop ():
+   """
+   Single writer: drain the queue of ("rows", table, rows, cycle) messages into per-table batches, writing
+   when a batch is full or OUTPUT_FLUSH_INTERVAL has passed. "sync" and "stop" messages write
+   everything queued before them
+   """
+   batches = collections.defaultdict(list)
+   sources = collections.defaultdict(list)
+   pending = 0
+   last_write = time.time()
+   while True:
+       try:
+           message = output_queue.get(timeout=OUTPUT_FLUSH_INTERVAL)
+       except queue.Empty:
+           message = None
+      
+       if message is not None and message[0] == "rows":
+           _, table, rows, cycle = message
+           batches[table].extend(rows)
+           sources[table].append((cycle, len(rows)))
+           pending += len(rows)
+           if pending < OUTPUT_BATCH_SIZE and time.time() - last_write < OUTPUT_FLUSH_INTERVAL:
+               continue
+      
+       try:
+           write_output_rows(batches, sources)
+       except Exception as e:
+           logger.error(f"Output writer failed to write {pending} rows: {e}")
+       batches.clear()
+       sources.clear()
+       pending = 0
+       last_write = time.time()
+      
+       if message is not None and message[0] in ("sync", "stop"):
+           try:
+               sync_output_handles(close=message[0] == "stop")
+           except Exception as e:
+               logger.error(f"Output writer failed to sync files: {e}")
+           message[1].set()
+           if message[0] == "stop":
+               return
+
+def  start_output_writer ():
+   """Start the writer thread"""
+   if OUTPUT_FORMAT == "parquet":
+       import_pyarrow()  # Fail at startup rather than on the first write
+   if output_writer["thread"] is not None and output_writer["thread"].is_alive():
+       return
+   output_writer["thread"] = threading.Thread(target=output_writer_loop, name="output-writer", daemon=True)
+   output_writer["thread"].start()
+
+def  sync_output_writer ():
+   """
+   Cycle boundary: wait until every queued row is written and fsynced. A network worker only asks the
+   supervisor to sync once its rows so far are written, without waiting for it
+   """
+   if network_sink["queue"] is not None:
+       network_sink["queue"].put(("sync",))
+       return
+   writer_thread = output_writer["thread"]
+   if writer_thread is None or not writer_thread.is_alive():
+       sync_output_handles()
+       return
+   done = threading.Event()
+   output_queue.put(("sync", done))
+   done.wait()
+
+def  stop_output_writer ():
+   """Drain the queue, fsync and close the files. Safe to call more than once"""
+   writer_thread = output_writer["thread"]
+   if writer_thread is not None and writer_thread.is_alive():
+       done = threading.Event()
+       output_queue.put(("stop", done))
+       done.wait()
+       writer_thread.join()
+   sync_output_handles(close=True)
+
+atexit.register(stop_output_writer)
+
+############################
+# UTILITY FUNCTIONS # 
+############################
+
+def  eth_price_from_slot0 (config, sqrt_price_x96):
+   """ETH/USD from the sqrtPriceX96 of the network's WETH/stablecoin pool"""
+   weth, stable = config["tokens"]["ETH"], config["tokens"][config["eth_usd_stable"]]
+   raw_price = sqrt_price_x96 ** 2 / 2**192  # token1 per token0, in raw units
+   stable_per_weth = raw_price if sort_tokens(weth, stable)[0] == weth else 1 / raw_price
+   return stable_per_weth * 10 ** (TOKEN_DECIMALS["ETH"] - TOKEN_DECIMALS[config["eth_usd_stable"]])
+
+def  cached_eth_price (config, block_identifier):
+   """The ETH price already read at a pinned block, or None"""
+   if block_identifier == "latest":
+       return None
+   return eth_price_cache.get((config["chain_id"], block_identifier))
+
+def  cache_eth_price (config, block_identifier, eth_price):
+   """Keep eth_price as the price of a block of the network's chain, dropping the oldest blocks past ETH_PRICE_CACHE_BLOCKS"""
+   with eth_price_lock:
+       eth_price_cache[(config["chain_id"], block_identifier)] = eth_price
+       while len(eth_price_cache) > ETH_PRICE_CACHE_BLOCKS:
+           del eth_price_cache[next(iter(eth_price_cache))]
+
+def  record_eth_price (config, slot0, block_identifier):
+   """Price the slot0 read and keep it as the price of its block"""
+   eth_price = eth_price_from_slot0(config, slot0[0])
+   if block_identifier != "latest":
+       cache_eth_price(config, block_identifier, eth_price)
+   return eth_price
+
+def  nearest_cached_eth_price (config, block_identifier):
+   """
+   (block, price) of the latest block of the network's chain priced at or before block_identifier
+   ("latest": any block), within ETH_PRICE_FALLBACK_BLOCKS of it for a pinned block; None if there is none
+   """
+   with eth_price_lock:
+       priced = [(block, price) for (chain_id, block), price in eth_price_cache.items() if chain_id == config["chain_id"]]
+   if block_identifier != "latest":
+       priced = [(block, price) for block, price in priced if block_identifier - ETH_PRICE_FALLBACK_BLOCKS <= block <= block_identifier]
+   return max(priced, key=lambda item: item[0], default=None)
+
+def  fallback_eth_price (config, block_identifier, error):
+   """
+   ETH price when the pool read failed: the price of a recent earlier block of the same chain, else
+   CoinGecko's current price for a live block. A historical block (backfill, or a cycle pinned to a past
+   block) raises instead, since a wrong price corrupts every gas cost
+   """
+   logger.warning(f"[{config['name']}] Could not read ETH/USD from the pool at block {block_identifier}: {error}")
+   nearest = nearest_cached_eth_price(config, block_identifier)
+   if nearest is not None:
+       logger.info(f"[{config['name']}] Using ETH price ${nearest[1]:.2f} from block {nearest[0]}")
+       return nearest[1]
+   head_block = config.get("head_block")
+   if block_identifier != "latest" and (head_block is None or block_identifier < head_block - ETH_PRICE_LIVE_BLOCKS):
+       raise Exception(f"No ETH price for historical block {block_identifier}: {error}")
+  
+   # Fetch from CoinGecko API
+   response = price_session.get( # 
+       "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd",
+       timeout=10
+   )
+   response.raise_for_status()
+   eth_price = response.json()["ethereum"]["usd"]
+   logger.info(f"Fetched current ETH price from CoinGecko: ${eth_price}") # 
+   return eth_price
+
+def  get_eth_price_usd (config, block_identifier="latest"):
+   """
+   ETH price in USD from the slot0 price of the network's WETH/stablecoin pool at the quotes' block,
+   so gas costs are priced at the same state as the quotes. The read is batched with the cycle's
+   prefetch and the price is cached per block
+   """
+   eth_price = cached_eth_price(config, block_identifier)
+   if eth_price is not None:
+       return eth_price
+   try:
+       slot0 = contract_read(config, config["eth_usd_pool"], "slot0", [], block_identifier)
+   except RpcThrottledError:
+       raise
+   except Exception as e:
+       return fallback_eth_price(config, block_identifier, e)
+   return record_eth_price(config, slot0, block_identifier)
+
+def  write_quote_rows (rows, table="quotes"):
+   """
+   Queue rows for the output writer as one message, with the cycle they count toward once written;
+   written directly when the writer is not running
+   """
+   if not rows:
+       return
+   writer_thread = output_writer["thread"]
+   if network_sink["queue"] is not None:
+       network_sink["queue"].put(("rows", table, rows))  # Counted by the supervisor, which writes them
+   elif writer_thread is not None and writer_thread.is_alive():
+       output_queue.put(("rows", table, rows, metrics_cycle.get()))
+   else:
+       write_output_rows({table: rows})
+
+def  write_quote_row (row, table="quotes"):
+   """Queue a single row for the output writer"""
+   write_quote_rows([row], table)
+
+def  calculate_quote_costs (notional_amount, receiving, fee_tier, gas_estimate, gas_price, eth_price_usd):
+   """
+   Price, fee and gas cost figures for a quote. Accepts scalars, or NumPy arrays for depth curves
+   """
+   pool_fee_pct = fee_tier / 1000000 # Uniswap pool fee is fee_tier / 1,000,000 (e.g. 3000 / 1M = 0.3%)
+   pool_fee_amount = notional_amount * pool_fee_pct
+   interface_fee_amount = notional_amount * INTERFACE_FEE_PCT
+   gas_cost_eth = (gas_estimate * gas_price) / 10**18
+   gas_cost_usd = gas_cost_eth * eth_price_usd
+  
+   if np.ndim(receiving) == 0:
+       price = notional_amount / receiving if receiving > 0 else 0
+       effective_price = (notional_amount + interface_fee_amount + gas_cost_usd)/receiving if receiving > 0 else 0
+   else:
+       with np.errstate(divide="ignore", invalid="ignore"):
+           price = np.where(receiving > 0, notional_amount / receiving, 0.0)
+           effective_price = np.where(receiving > 0, (notional_amount + interface_fee_amount + gas_cost_usd) / receiving, 0.0)
+  
+   return {
+       "price": price,
+       "pool_fee": pool_fee_amount,
+       "interface_fee": interface_fee_amount,
+       "gas_cost_eth": gas_cost_eth,
+       "gas_cost_usd": gas_cost_usd,
+       "effective_price": effective_price
+   }
+
+@functools.lru_cache(maxsize=None)
+def  build_v2_path (token_in, fee_tier, token_out):
+   """Encode a single-hop QuoterV2 path (tokenIn | fee | tokenOut) as bytes, once per pair and fee tier"""
+   return bytes.fromhex(token_in[2:]) + fee_tier.to_bytes(3, byteorder='big') + bytes.fromhex(token_out[2:])
+
+def  calculate_slippage (amount_in, amount_out, small_amount_in, small_amount_out, token_in_symbol):
+   """
+   Compare a quote against a quote for 10% of its size; returns (is_reasonable, slippage_percentage)
+   """
+   input_ratio = amount_in / small_amount_in
+   output_ratio = amount_out / small_amount_out
+   slippage_ratio = 1 - (output_ratio / input_ratio)
+   slippage_percentage = slippage_ratio * 100  # Convert to percentage
+  
+   max_slippage_ratio = SLIPPAGE_TOLERANCE_BY_TOKEN.get(token_in_symbol, SLIPPAGE_TOLERANCE_BY_TOKEN['default'])
+   return slippage_ratio <= max_slippage_ratio, slippage_percentage
+
+def  detect_unreasonable_slippage (amount_in_small, amount_out_small, amount_in_large, amount_out_large, token_symbol=None):
+   """
+   Simulate slippage between small and large trades
+   """
+   if amount_in_small == 0 or amount_out_small == 0:
+       return False # 
+  
+   # Get token-specific slippage tolerance
+   max_slippage_ratio = SLIPPAGE_TOLERANCE_BY_TOKEN.get(token_symbol, SLIPPAGE_TOLERANCE_BY_TOKEN['default'])
+  
+   # Calculate price per unit for both trades
+   price_small = amount_out_small / amount_in_small
+   price_large = amount_out_large / amount_in_large
+  
+   # Calculate the ratio of input amounts
+   input_ratio = amount_in_large / amount_in_small
+  
+   # Calculate the ratio of output amounts
+   output_ratio = amount_out_large / amount_out_small
+  
+   # If output ratio is significantly less than input ratio, we have excessive slippage
+   slippage_ratio = 1 - (output_ratio / input_ratio) # 
+  
+   logger.debug("Slippage analysis for %s: input_ratio=%.2f, output_ratio=%.2f, slippage_ratio=%.4f, tolerance=%.2f",
+                token_symbol or 'unknown', input_ratio, output_ratio, slippage_ratio, max_slippage_ratio)
+  
+   return slippage_ratio > max_slippage_ratio
+
+############################
+# TOKEN REGISTRY
+############################
+
+def  load_token_registry ():
+   """Load the on-disk token registry once per process"""
+   with token_registry_lock:
+       if token_registry["loaded"]:
+           return
+       if os.path.isfile(TOKEN_REGISTRY_FILE):
+           try:
+               with open(TOKEN_REGISTRY_FILE) as f:
+                   token_registry["tokens"].update(json.load(f))
+               logger.info(f"Loaded {len(token_registry['tokens'])} token registry entries from {TOKEN_REGISTRY_FILE}")
+           except Exception as e:
+               logger.warning(f"Could not load token registry from {TOKEN_REGISTRY_FILE}: {e}")
+       token_registry["loaded"] = True
+
+def  save_token_registry ():
+   """Persist the token registry if new tokens were read (atomic replace)"""
+   with token_registry_lock:
+       if not token_registry["dirty"]:
+           return
+       tmp_file = TOKEN_REGISTRY_FILE + ".tmp"
+       os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+       with open(tmp_file, "w") as f:
+           json.dump(token_registry["tokens"], f, indent=1, sort_keys=True)
+       os.replace(tmp_file, TOKEN_REGISTRY_FILE)
+       token_registry["dirty"] = False
+
+def  token_list_addresses (config):
+   """Token addresses of the network's token list file, if it exists"""
+   path = config.get("token_list_file")
+   if not path or not os.path.isfile(path):
+       return []
+   with open(path) as f:
+       if path.endswith(".json"):
+           return [token["address"] for token in json.load(f)["tokens"] if token.get("chainId", config["chain_id"]) == config["chain_id"]]
+       return [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+
+def  fetch_token_metadata (config, addresses):
+   """
+   Read decimals() and symbol() of many tokens in a few batched reads (bytes32 symbols are retried
+   as such). Returns {address: {"symbol", "decimals"}}, or {"error", "checked_at"} for unreadable tokens
+   """
+   contracts = [PrecompiledContract(address, ERC20_ABI) for address in addresses]
+   results = batch_read(config, [(contract, fn_name, []) for contract in contracts for fn_name in ["decimals", "symbol"]],
+                        MULTICALL_STATE_BATCH_SIZE)
+   decimals_results, symbol_results = results[0::2], results[1::2]
+  
+   bytes32_addresses = [address for address, (success, _) in zip(addresses, symbol_results) if not success]
+   bytes32_contracts = [PrecompiledContract(address, ERC20_BYTES32_SYMBOL_ABI) for address in bytes32_addresses]
+   bytes32_symbols = dict(zip(bytes32_addresses, batch_read(config, [(contract, "symbol", []) for contract in bytes32_contracts],
+                                                            MULTICALL_STATE_BATCH_SIZE)))
+  
+   metadata = {}
+   for address, (decimals_ok, decimals), (symbol_ok, symbol) in zip(addresses, decimals_results, symbol_results):
+       if not symbol_ok:
+           symbol_ok, symbol = bytes32_symbols[address]
+           if symbol_ok:
+               symbol = symbol.rstrip(b"\0").decode("utf-8", errors="replace")
+       if not decimals_ok or not symbol_ok or not symbol.strip():
+           metadata[address] = {"error": str(symbol if decimals_ok else decimals), "checked_at": time.time()}
+           continue
+       metadata[address] = {"symbol": symbol.strip(), "decimals": decimals}
+   return metadata
+
+def  initialize_tokens (config):
+   """
+   Set up a network's tokens and trade pairs: the named tokens of its config, plus every token of its
+   token list under its on-chain symbol (suffixed with the address's last digits if already taken).
+   Metadata comes from the token registry, so only tokens not seen before are read, in one batch.
+   trade_pairs are each of pair_quote_tokens against every other token
+   """
+   load_token_registry()
+   chain_id = config["chain_id"]
+   named = {Web3.to_checksum_address(address): symbol for symbol, address in config["tokens"].items()}
+   addresses = list(dict.fromkeys(list(named) + [Web3.to_checksum_address(address) for address in token_list_addresses(config)]))
+  
+   entries = token_registry["tokens"]
+   now = time.time()
+   missing = []
+   for address in addresses:
+       entry = entries.get(f"{chain_id}:{address}", {})
+       if named.get(address) not in TOKEN_DECIMALS and "decimals" not in entry and now - entry.get("checked_at", 0) > TOKEN_REGISTRY_RETRY_INTERVAL:
+           missing.append(address)
+   if missing:
+       batch_start = time.time()
+       metadata = fetch_token_metadata(config, missing)
+       with token_registry_lock:
+           entries.update({f"{chain_id}:{address}": entry for address, entry in metadata.items()})
+           token_registry["dirty"] = True
+       logger.info(f"[{config['name']}] Read metadata of {len(missing)} tokens in {time.time() - batch_start:.2f}s")
+       try:
+           save_token_registry()
+       except Exception as e:
+           logger.warning(f"[{config['name']}] Could not save token registry: {e}")
+  
+   tokens = {}
+   for address in addresses:
+       entry = entries.get(f"{chain_id}:{address}", {})
+       symbol = named.get(address)
+       if symbol not in TOKEN_DECIMALS:
+           if "decimals" not in entry:
+               logger.warning(f"[{config['name']}] Skipping token {address}: no ERC-20 metadata ({entry.get('error')})")
+               continue
+           symbol = symbol or entry["symbol"]
+           if symbol in tokens:
+               symbol = f"{symbol}_{address[-4:]}"
+           TOKEN_DECIMALS[symbol] = entry["decimals"]
+       tokens[symbol] = address
+  
+   quote_tokens = [symbol for symbol in config["pair_quote_tokens"] if symbol in tokens]
+   config["tokens"] = tokens
+   config["trade_pairs"] = [(quote_token, token) for token in tokens if token not in quote_tokens for quote_token in quote_tokens]
+   logger.info(f"[{config['name']}] Tracking {len(tokens)} tokens in {len(config['trade_pairs'])} trade pairs")
+
+############################
+# POOL REGISTRY
+############################
+
+def  load_pool_registry ():
+   """Load the on-disk pool registry once per process"""
+   with pool_registry_lock:
+       if pool_registry["loaded"]:
+           return
+       if os.path.isfile(POOL_REGISTRY_FILE):
+           try:
+               with open(POOL_REGISTRY_FILE) as f:
+                   pool_registry["pools"].update(json.load(f))
+               logger.info(f"Loaded {len(pool_registry['pools'])} pool registry entries from {POOL_REGISTRY_FILE}")
+           except Exception as e:
+               logger.warning(f"Could not load pool registry from {POOL_REGISTRY_FILE}: {e}")
+       pool_registry["loaded"] = True
+
+def  save_pool_registry ():
+   """Persist the pool registry if new pools were learned (atomic replace)"""
+   with pool_registry_lock:
+       if not pool_registry["dirty"]:
+           return
+       tmp_file = POOL_REGISTRY_FILE + ".tmp"
+       os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+       with open(tmp_file, "w") as f:
+           json.dump(pool_registry["pools"], f, indent=1, sort_keys=True)
+       os.replace(tmp_file, POOL_REGISTRY_FILE)
+       pool_registry["dirty"] = False
+
+def  sort_tokens (token_a, token_b):
+   """Order two token addresses the way the Uniswap V3 factory does (token0 < token1)"""
+   return (token_a, token_b) if int(token_a, 16) < int(token_b, 16) else (token_b, token_a)
+
+def  pool_registry_key (config, token_a, token_b, fee):
+   token0, token1 = sort_tokens(token_a, token_b)
+   return f"{config['chain_id']}:{token0}:{token1}:{fee}"
+
+def  compute_pool_address (config, token_a, token_b, fee):
+   """
+   Compute a V3 pool address locally from the factory's CREATE2 parameters
+   """
+   token0, token1 = sort_tokens(token_a, token_b)
+   # salt = keccak256(abi.encode(token0, token1, fee))
+   salt = Web3.keccak(
+       bytes(12) + Web3.to_bytes(hexstr=token0) + bytes(12) + Web3.to_bytes(hexstr=token1) + fee.to_bytes(32, byteorder='big')
+   )
+   digest = Web3.keccak(
+       b"\xff" + Web3.to_bytes(hexstr=config["factory_address"]) + salt + Web3.to_bytes(hexstr=config["pool_init_code_hash"])
+   )
+   return Web3.to_checksum_address(digest[12:])
+
+def  lookup_pool_address (config, token_a, token_b, fee):
+   """
+   Look up a pool in the registry; returns (known, pool_address) where pool_address is None
+   for fee tiers without a pool. Missing pools become unknown again after the refresh interval.
+   """
+   load_pool_registry()
+   entry = pool_registry["pools"].get(pool_registry_key(config, token_a, token_b, fee))
+   if entry is None:
+       return False, None
+   if entry["pool"] is None and time.time() - entry["checked_at"] > POOL_REGISTRY_REFRESH_INTERVAL:
+       return False, None
+   return True, entry["pool"]
+
+def  record_pool_address (config, token_a, token_b, fee, pool_address):
+   """Learn a pool address (or the absence of a pool) for a fee tier"""
+   with pool_registry_lock:
+       pool_registry["pools"][pool_registry_key(config, token_a, token_b, fee)] = {
+           "pool": pool_address, "checked_at": int(time.time())
+       }
+       pool_registry["dirty"] = True
+
+def  get_pool_address (config, token_a, token_b, fee):
+   """
+   Resolve a pool address from the registry, discovering and recording it on a miss.
+   Returns None when no pool exists for the fee tier.
+   """
+   known, pool_address = lookup_pool_address(config, token_a, token_b, fee)
+   if known:
+       return pool_address
+  
+   if config.get("pool_init_code_hash"):
+       # Cold start: compute the address locally and only check that it has been deployed
+       candidate = compute_pool_address(config, token_a, token_b, fee)
+       pool_address = candidate if len(config["w3"].eth.get_code(candidate)) > 0 else None
+   else:
+       pool_address = contract_read(config, config["factory"], "getPool", [token_a, token_b, fee])
+       if pool_address == "0x0000000000000000000000000000000000000000":
+           pool_address = None
+  
+   record_pool_address(config, token_a, token_b, fee, pool_address)
+   return pool_address
+
+############################
+# PRECOMPILED CONTRACT CALLS
+############################
+
+# id(abi) -> {fn_name: compiled function}; the ABIs are module constants, so each is compiled once
+compiled_abis = {}
+
+def  compile_abi (abi):
+   """4-byte selector and eth_abi input/output types of every function of an ABI, built once per ABI"""
+   compiled = compiled_abis.get(id(abi))
+   if compiled is None:
+       compiled = {}
+       for item in abi:
+           if item.get("type") != "function":
+               continue
+           input_types = [abi_type(abi_input) for abi_input in item["inputs"]]
+           compiled[item["name"]] = {
+               "selector": Web3.keccak(text=f"{item['name']}({','.join(input_types)})")[:4],
+               "inputs": input_types,
+               "outputs": [abi_type(output) for output in item["outputs"]]
+           }
+       compiled_abis[id(abi)] = compiled
+   return compiled
+
+class  PrecompiledContract:
+   """
+   A contract address with its ABI compiled once. Reads encode only their arguments behind the
+   selector and decode with eth_abi, instead of going through web3 Contract objects, which are
+   slow to build (per pool) and to encode and decode with (per call)
+   """
+   __slots__ = ("address", "functions")
+  
+   def  __init__ (self, address, abi):
+       self.address = address
+       self.functions = compile_abi(abi)
+
+def  encode_contract_call (contract, fn_name, args):
+   """Return the (target, calldata) key for a contract read"""
+   function = contract.functions[fn_name]
+   return contract.address, function["selector"] + eth_abi.encode(function["inputs"], args)
+
+def  decode_contract_result (contract, fn_name, return_data):
+   """Decode raw return data the same way ContractFunction.call() would"""
+   output_types = contract.functions[fn_name]["outputs"]
+   values = eth_abi.decode(output_types, return_data)
+   values = [Web3.to_checksum_address(value) if output_type == "address" else value
+             for output_type, value in zip(output_types, values)]
+   return values[0] if len(values) == 1 else values
+
+############################
+# MULTICALL BATCHING
+############################
+
+def  cached_read_result (config, block_identifier, target, calldata):
+   """
+   Look up a memoized read; returns (success, value) or None. Only reads pinned to a block number are cached
+   """
+   if not isinstance(block_identifier, int):
+       return None
+   key = (config["chain_id"], block_identifier, target, calldata)
+   with read_cache_lock:
+       result = read_cache.get(key)
+       if result is not None:
+           read_cache.move_to_end(key)
+   if result is not None:
+       record_count("read_cache_hits_total")
+   return result
+
+def  cache_read_result (config, block_identifier, target, calldata, result):
+   """Memoize a read at a pinned block, evicting the least recently used entries"""
+   if not isinstance(block_identifier, int):
+       return
+   with read_cache_lock:
+       read_cache[(config["chain_id"], block_identifier, target, calldata)] = result
+       while len(read_cache) > READ_CACHE_MAX_ENTRIES:
+           read_cache.popitem(last=False)
+
+def  decode_multicall_result (contract, fn_name, success, return_data):
+   """Decode one aggregate3 result into (success, value), value being the error for failed calls"""
+   if not success:
+       return False, f"{fn_name} reverted"
+   if not return_data:
+       # Calls to addresses without code succeed with empty return data
+       return False, f"{fn_name} {NO_RETURN_DATA_ERROR}"
+   try:
+       return True, decode_contract_result(contract, fn_name, return_data)
+   except Exception as decode_error:
+       return False, f"{fn_name} returned undecodable data: {decode_error}"
+
+def  multicall_read (config, calls, batch_size=MULTICALL_BATCH_SIZE, block_identifier="latest"):
+   """
+   Execute contract reads through Multicall3 aggregate3 with per-call failure allowed.
+   calls is a list of (contract, fn_name, args); returns {(target, calldata): (success, value)}
+   where value is the decoded result, or the error for calls that failed.
+   Reads already memoized for the block are not sent again.
+   """
+   w3_instance = config["w3"]
+   multicall_contract = config["multicall3"]
+   results = {}
+  
+   pending = {}
+   for contract, fn_name, args in calls:
+       key = encode_contract_call(contract, fn_name, args)
+       cached = cached_read_result(config, block_identifier, *key)
+       if cached is not None:
+           results[key] = cached
+       else:
+           pending[key] = (contract, fn_name)
+   pending = list(pending.items())
+  
+   for start in range(0, len(pending), batch_size):
+       chunk = pending[start:start + batch_size]
+       try:
+           target, calldata = encode_contract_call(multicall_contract, "aggregate3", [[(target, True, calldata) for (target, calldata), _ in chunk]])
+           raw_results = decode_contract_result(multicall_contract, "aggregate3", w3_instance.eth.call({"to": target, "data": calldata}, block_identifier))
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           # Leave the whole chunk out of the results so those reads are retried individually
+           logger.warning(f"[{config['name']}] Multicall batch of {len(chunk)} reads failed: {e}")
+           continue
+      
+       for (key, (contract, fn_name)), (success, return_data) in zip(chunk, raw_results):
+           record_count("multicall_reads_total", (("function", fn_name),))
+           results[key] = decode_multicall_result(contract, fn_name, success, return_data)
+           cache_read_result(config, block_identifier, *key, results[key])
+  
+   return results
+
+def  single_read (config, contract, fn_name, args, block_identifier="latest"):
+   """
+   Send one contract read as its own eth_call and memoize the outcome; reverts are cached too
+   since they are deterministic at a pinned block
+   """
+   target, calldata = encode_contract_call(contract, fn_name, args)
+   try:
+       return_data = config["w3"].eth.call({"to": target, "data": calldata}, block_identifier)
+   except ContractLogicError as e:
+       cache_read_result(config, block_identifier, target, calldata, (False, str(e)))
+       raise
+   if not return_data:
+       # Calls to addresses without code succeed with empty return data
+       cache_read_result(config, block_identifier, target, calldata, (False, f"{fn_name} {NO_RETURN_DATA_ERROR}"))
+       raise Exception(f"{fn_name} {NO_RETURN_DATA_ERROR}")
+   value = decode_contract_result(contract, fn_name, return_data)
+   cache_read_result(config, block_identifier, target, calldata, (True, value))
+   return value
+
+def  batch_read (config, calls, batch_size=MULTICALL_BATCH_SIZE, block_identifier="latest"):
+   """
+   Read many contract values at once, through Multicall3 when available.
+   Returns [(success, value)] in call order; reads missing from the batch are sent individually
+   """
+   results = {}
+   if ENABLE_MULTICALL and config.get("multicall3_available"):
+       results = multicall_read(config, calls, batch_size, block_identifier)
+  
+   values = []
+   for contract, fn_name, args in calls:
+       key = encode_contract_call(contract, fn_name, args)
+       if key in results:
+           values.append(results[key])
+           continue
+       try:
+           values.append((True, single_read(config, contract, fn_name, args, block_identifier)))
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           values.append((False, str(e)))
+   return values
+
+def  prefetched_result (config, contract, fn_name, args, block_identifier):
+   """Look up a prefetched read without falling back to the node; returns (success, value)"""
+   return cached_read_result(config, block_identifier, *encode_contract_call(contract, fn_name, args)) or (False, None)
+
+def  contract_read (config, contract, fn_name, args, block_identifier="latest"):
+   """
+   Read a contract value at a block, serving it from the per-block memo cache when it was
+   already read (or prefetched through Multicall3)
+   """
+   cached = cached_read_result(config, block_identifier, *encode_contract_call(contract, fn_name, args))
+   if cached is not None:
+       success, value = cached
+       if not success:
+           raise Exception(value)
+       return value
+   return single_read(config, contract, fn_name, args, block_identifier)
+
+############################
+# POOL STATE SNAPSHOTS
+############################
+
+def  fetch_pool_snapshots (config, pools, tick_words=SNAPSHOT_TICK_WORDS, block_identifier="latest"):
+   """
+   Load slot0, active liquidity and the initialized ticks around the current price of each pool,
+   in two batched rounds. pools maps pool address -> fee tier; returns {pool_address: snapshot}
+   """
+   pool_contracts = {pool_address: PrecompiledContract(pool_address, POOL_ABI) for pool_address in pools}
+  
+   # Round 1: price, active liquidity and the tick bitmap words around the current tick
+   state_reads = []
+   for pool_address, pool_contract in pool_contracts.items():
+       state_reads.extend([(pool_contract, "slot0", []), (pool_contract, "liquidity", [])])
+   state_results = batch_read(config, state_reads, MULTICALL_STATE_BATCH_SIZE, block_identifier)
+  
+   snapshots = {}
+   bitmap_reads = []
+   for index, (pool_address, fee) in enumerate(pools.items()):
+       (slot0_success, slot0), (liquidity_success, liquidity) = state_results[2 * index:2 * index + 2]
+       if not (slot0_success and liquidity_success):
+           logger.warning(f"[{config['name']}] Could not load state for pool {pool_address}: {slot0 if not slot0_success else liquidity}")
+           continue
+       tick_spacing = FEE_TICK_SPACING[fee]
+       current_word = (slot0[1] // tick_spacing) >> 8
+       snapshots[pool_address] = {
+           "pool": pool_address,
+           "block": block_identifier,
+           "fee": fee,
+           "tick_spacing": tick_spacing,
+           "sqrt_price_x96": slot0[0],
+           "tick": slot0[1],
+           "liquidity": liquidity,
+           "min_word": current_word - tick_words,
+           "max_word": current_word + tick_words,
+           "tick_bitmap": {},
+           "liquidity_net": {}
+       }
+       for word_pos in range(current_word - tick_words, current_word + tick_words + 1):
+           bitmap_reads.append((pool_contracts[pool_address], "tickBitmap", [word_pos]))
+  
+   bitmap_results = batch_read(config, bitmap_reads, MULTICALL_STATE_BATCH_SIZE, block_identifier)
+   failed_pools = set()
+   tick_reads = []
+   for (pool_contract, _, (word_pos,)), (success, word) in zip(bitmap_reads, bitmap_results):
+       pool_address = pool_contract.address
+       if not success:
+           failed_pools.add(pool_address)
+           continue
+       snapshot = snapshots[pool_address]
+       snapshot["tick_bitmap"][word_pos] = word
+       for bit_pos in range(256):
+           if word >> bit_pos & 1:
+               tick = ((word_pos << 8) + bit_pos) * snapshot["tick_spacing"]
+               tick_reads.append((pool_contract, "ticks", [tick]))
+  
+   # Round 2: net liquidity of every initialized tick found in the bitmap words
+   tick_results = batch_read(config, tick_reads, MULTICALL_STATE_BATCH_SIZE, block_identifier)
+   for (pool_contract, _, (tick,)), (success, tick_info) in zip(tick_reads, tick_results):
+       if not success:
+           failed_pools.add(pool_contract.address)
+           continue
+       snapshots[pool_contract.address]["liquidity_net"][tick] = tick_info[1]
+  
+   # An incomplete tick map would give wrong quotes, so those pools are left to the quoter
+   for pool_address in failed_pools:
+       logger.warning(f"[{config['name']}] Incomplete tick data for pool {pool_address}, skipping its snapshot")
+       snapshots.pop(pool_address, None)
+   return snapshots
+
+def  quote_from_snapshot (config, token_in, token_out, fee_tier, amount_in, default_gas_estimate, block_identifier="latest"):
+   """
+   Quote an exact input swap locally from the pool's state snapshot.
+   Returns (amount_out, gas_estimate), or (None, default_gas_estimate) when the swap moves past
+   the ticks covered by the snapshot and the quoter has to be used instead
+   """
+   pool_address = get_pool_address(config, token_in, token_out, fee_tier)
+   if pool_address is None:
+       raise Exception(f"No pool for fee tier {fee_tier/10000}%")
+  
+   snapshot = config["pool_snapshots"].get((block_identifier, pool_address))
+   if snapshot is None:
+       snapshot = fetch_pool_snapshots(config, {pool_address: fee_tier}, block_identifier=block_identifier).get(pool_address)
+       if snapshot is None:
+           raise Exception(f"Could not load state snapshot for pool {pool_address}")
+       config["pool_snapshots"][(block_identifier, pool_address)] = snapshot
+  
+   try:
+       swap = simulate_exact_input(snapshot, int(token_in, 16) < int(token_out, 16), amount_in)
+   except SnapshotRangeError as e:
+       logger.debug("[%s] Swap of %s leaves the snapshot of pool %s (%s), using the quoter", config['name'], amount_in, pool_address, e)
+       return None, default_gas_estimate
+  
+   if config.get("quoter_v2_available") and random.random() < LOCAL_QUOTE_VERIFY_SAMPLE_RATE:
+       return verify_local_quote(config, token_in, token_out, fee_tier, amount_in, swap, block_identifier), swap["gas_estimate"]
+   return swap["amount_out"], swap["gas_estimate"]
+
+def  verify_local_quote (config, token_in, token_out, fee_tier, amount_in, swap, block_identifier="latest"):
+   """
+   Cross-check a local quote against QuoterV2, which must agree to the wei. Returns the amount out to use:
+   QuoterV2's on a mismatch (counted in local_quote_mismatches_total), the local one otherwise
+   """
+   try:
+       path_bytes = build_v2_path(token_in, fee_tier, token_out)
+       quoter_amount_out, _, ticks_crossed_list, quoter_gas_estimate = contract_read(
+           config, config["quoter_v2"], "quoteExactInput", [path_bytes, amount_in], block_identifier
+       )
+   except Exception as e:
+       logger.warning(f"[{config['name']}] Could not verify local quote against QuoterV2: {e}")
+       return swap["amount_out"]
+  
+   if quoter_amount_out != swap["amount_out"]:
+       record_count("local_quote_mismatches_total", (("fee_tier", str(fee_tier)),))
+       logger.error(f"[{config['name']}] Local quote mismatch at fee tier {fee_tier/10000}% for amount {amount_in}: local={swap['amount_out']}, QuoterV2={quoter_amount_out}")
+       return quoter_amount_out
+   else:
+       logger.debug("[%s] Local quote matches QuoterV2 (%s); ticks crossed local=%s quoter=%s, gas local=%s quoter=%s", config['name'],
+                    quoter_amount_out, swap['ticks_crossed'], ticks_crossed_list[0], swap['gas_estimate'], quoter_gas_estimate)
+   return swap["amount_out"]
+
+def  record_local_quote_fixture (network_key, token_a, token_b, fee_tier, directory=LOCAL_FIXTURE_DIR, block_number=None):
+   """
+   Record a pool's state snapshot at a block (the latest by default) and QuoterV2's amountOut and
+   initialized ticks crossed for a ladder of amounts in both directions, up to swaps crossing many
+   ticks, into a JSON fixture for verify_local_quote_fixture. Returns the fixture's path
+   """
+   config = initialize_network(network_key)
+   tokens = config["tokens"]
+   if block_number is None:
+       block_number = config["w3"].eth.block_number
+   pool_address = get_pool_address(config, tokens[token_a], tokens[token_b], fee_tier)
+   if pool_address is None:
+       raise Exception(f"No {token_a}/{token_b} pool for fee tier {fee_tier/10000}%")
+   snapshot = fetch_pool_snapshots(config, {pool_address: fee_tier}, CURVE_SNAPSHOT_TICK_WORDS, block_number).get(pool_address)
+   if snapshot is None:
+       raise Exception(f"Could not load state snapshot for pool {pool_address} at block {block_number}")
+  
+   quotes = []
+   for token_in_symbol, token_out_symbol in [(token_a, token_b), (token_b, token_a)]:
+       token_in, token_out = tokens[token_in_symbol], tokens[token_out_symbol]
+       zero_for_one = int(token_in, 16) < int(token_out, 16)
+       amount_in = int(min(USD_NOTIONALS) * 10**TOKEN_DECIMALS[token_in_symbol])
+       for _ in range(LOCAL_FIXTURE_AMOUNTS):
+           # The local math only picks where the ladder stops; the recorded amounts are QuoterV2's
+           try:
+               simulate_exact_input(snapshot, zero_for_one, amount_in)
+           except SnapshotRangeError:
+               break
+           amount_out, _, ticks_crossed_list, _ = contract_read(
+               config, config["quoter_v2"], "quoteExactInput", [build_v2_path(token_in, fee_tier, token_out), amount_in], block_number
+           )
+           quotes.append({"zero_for_one": zero_for_one, "amount_in": amount_in, "amount_out": amount_out, "ticks_crossed": ticks_crossed_list[0]})
+           amount_in *= LOCAL_FIXTURE_AMOUNT_GROWTH
+  
+   # JSON object keys are strings; verify_local_quote_fixture turns the words and ticks back into ints
+   fixture = {"network": network_key, "pair": [token_a, token_b], "snapshot": snapshot, "quotes": quotes}
+   os.makedirs(directory, exist_ok=True)
+   path = os.path.join(directory, f"{network_key}_{token_a}_{token_b}_{fee_tier}_{block_number}.json")
+   with open(path, "w") as f:
+       json.dump(fixture, f, indent=1)
+   logger.info(f"[{config['name']}] Recorded {len(quotes)} QuoterV2 quotes of pool {pool_address} at block {block_number} into {path}")
+   return path
+
+def  verify_local_quote_fixture (path):
+   """
+   Replay a fixture from record_local_quote_fixture through the local swap math, which must match every
+   recorded QuoterV2 amountOut to the wei. Raises listing the mismatches; returns the number of quotes checked
+   """
+   with open(path) as f:
+       fixture = json.load(f)
+   snapshot = dict(fixture["snapshot"],
+                   tick_bitmap={int(word_pos): word for word_pos, word in fixture["snapshot"]["tick_bitmap"].items()},
+                   liquidity_net={int(tick): liquidity_net for tick, liquidity_net in fixture["snapshot"]["liquidity_net"].items()})
+  
+   mismatches = []
+   for quote in fixture["quotes"]:
+       try:
+           amount_out = simulate_exact_input(snapshot, quote["zero_for_one"], quote["amount_in"])["amount_out"]
+       except SnapshotRangeError as e:
+           mismatches.append(f"amount_in={quote['amount_in']} zero_for_one={quote['zero_for_one']} leaves the snapshot ({e})")
+           continue
+       if amount_out != quote["amount_out"]:
+           mismatches.append(f"amount_in={quote['amount_in']} zero_for_one={quote['zero_for_one']}: local={amount_out}, QuoterV2={quote['amount_out']}")
+   if mismatches:
+       raise Exception(f"Local quotes differ from QuoterV2 for pool {snapshot['pool']} at block {snapshot['block']}: {'; '.join(mismatches)}")
+   return len(fixture["quotes"])
+
+############################
+# UNISWAP FUNCTIONS
+############################
+
+def  find_best_pool_with_liquidity (token_in, token_out, amount_in, token_in_symbol, network="ethereum", block_identifier="latest"):
+   """
+   Find the pool with the lowest fee tier that has sufficient liquidity based on slippage check
+   """
+   config = NETWORK_CONFIGS[network]
+  
+   decimals_in = TOKEN_DECIMALS[token_in_symbol]
+   # notional_amount = amount_in / (10 ** decimals_in) # This was for logging only, can be removed if not used
+  
+   logger.debug("[%s] Looking for available pools for %s", config['name'], token_in_symbol)
+  
+   # Check all fee tiers from lowest to highest
+   for fee in POOL_FEE_TIERS:
+       try:
+           pool_address = get_pool_address(config, token_in, token_out, fee)
+           if pool_address is not None:
+               logger.debug("[%s] Found pool with fee tier %s%% at %s", config['name'], fee/10000, pool_address) # 
+              
                # For all trades, do a basic existence check and return the first available pool
                # The actual slippage validation will happen in get_uniswap_quote()
                try: # 
-                   pool_contract = w3_instance.eth.contract(address=pool_address, abi=POOL_ABI)
-                   total_liquidity = pool_contract.functions.liquidity().call()
+                   pool_contract = PrecompiledContract(pool_address, POOL_ABI)
+                   total_liquidity = contract_read(config, pool_contract, "liquidity", [], block_identifier)
                   
                    # Basic sanity check - just ensure liquidity > 0
                    if total_liquidity > 0: # 
-                       logger.info(f"[{config['name']}] Pool has liquidity ({total_liquidity}). Using fee tier {fee/10000}%") # 
+                       logger.debug("[%s] Pool has liquidity (%s). Using fee tier %s%%", config['name'], total_liquidity, fee/10000) # 
                        return fee, pool_address
                    else:
-                       logger.info(f"[{config['name']}] Pool has zero liquidity, trying next fee tier")
+                       logger.debug("[%s] Pool has zero liquidity, trying next fee tier", config['name'])
                        continue # 
                       
+               except RpcThrottledError:
+                   raise
                except Exception as liquidity_error:
                    logger.warning(f"[{config['name']}] Could not check liquidity for pool {pool_address}: {liquidity_error}")
                    # If we can't check liquidity, still try this pool
-                   logger.info(f"[{config['name']}] Using pool despite liquidity check error. Fee tier {fee/10000}%") # 
+                   logger.debug("[%s] Using pool despite liquidity check error. Fee tier %s%%", config['name'], fee/10000) # 
                    return fee, pool_address
                   
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           logger.error(f"[{config['name']}] Error checking pool for fee tier {fee}: {e}")
+  
+   # No pools found across all fee tiers 
+   logger.warning(f"[{config['name']}] No pools found for {token_in_symbol} across all fee tiers - skipping pair")
+   return None, None
+
+def  validate_quote_with_slippage_check (token_in, token_out, current_fee_tier, amount_in, amount_out,
+                                    token_in_symbol, quoter_contract, quoter_available,
+                                    quoter_v2_contract, quoter_v2_available, config, block_identifier="latest"): 
+   try:
+       # Test with 10% of the amount to check for slippage 
+       small_amount_in = int(amount_in * 0.1)
+       small_amount_out = None
+      
+       if QUOTE_SOURCE == "local":
+           # Use the pool's state snapshot for slippage check (None if the swap leaves the snapshot)
+           small_amount_out, _ = quote_from_snapshot(config, token_in, token_out, current_fee_tier, small_amount_in, None, block_identifier)
+      
+       if small_amount_out is None and not quoter_available and quoter_v2_available:
+           # Use QuoterV2 for slippage check 
+           path_bytes = build_v2_path(token_in, current_fee_tier, token_out)
+           small_amount_out, _, _, _ = contract_read( # 
+               config, quoter_v2_contract, "quoteExactInput", [path_bytes, small_amount_in], block_identifier
+           )
+       elif small_amount_out is None and quoter_available:
+           # Use QuoterV1 for slippage check
+           small_amount_out = contract_read(
+               config, quoter_contract, "quoteExactInputSingle",
+               [token_in, token_out, current_fee_tier, small_amount_in, 0], block_identifier
+           )
+      
+       if small_amount_out:
+           # Calculate slippage and check if it is unreasonable 
+           is_reasonable, slippage_percentage = calculate_slippage(
+               amount_in, amount_out, small_amount_in, small_amount_out, token_in_symbol
+           )
+          
+           if not is_reasonable:
+               logger.warning(f"[{config['name']}] Detected unreasonable slippage for {token_in_symbol} at fee tier {current_fee_tier/10000}%: {slippage_percentage:.2f}%")
+           return is_reasonable, slippage_percentage # 
+       else:
+           # If we can't get small quote, assume no slippage issue
+           return True, 0.0
+      
+   except RpcThrottledError:
+       raise
+   except Exception as slippage_check_error:
+       logger.warning(f"[{config['name']}] Could not perform slippage check: {slippage_check_error}")
+       # If we can't check slippage, assume the quote is valid and no slippage data
+       return True, None
+
+def  build_quote_row (network, token_in_symbol, token_out_symbol, notional_amount, amount_in, amount_out,
+                     gas_estimate, gas_price, eth_price_usd, pool_address, fee_tier, slippage_percentage, block_identifier="latest"):
+   """
+   Build the output record for a successful quote (block_number is None for unpinned reads)
+   """
+   config = NETWORK_CONFIGS[network]
+   receiving = amount_out / (10 ** TOKEN_DECIMALS[token_out_symbol])
+   costs = calculate_quote_costs(notional_amount, receiving, fee_tier, gas_estimate, gas_price, eth_price_usd)
+   chain_id = config["chain_id"]
+
+   return QuoteRecord(
+       timestamp=dt.datetime.now(dt.UTC),
+       block_number=block_identifier if isinstance(block_identifier, int) else None,
+       quoter="uniswap_quoter", # 
+       aggregator="uniswap",
+       network=network,
+       token_in_chain_id=chain_id,
+       token_out_chain_id=chain_id,
+       direction=f"{token_in_symbol}->{token_out_symbol}",
+       notional=notional_amount, # 
+       selling=notional_amount,
+       token_in_symbol=token_in_symbol,
+       token_in_address=config["tokens"][token_in_symbol],
+       receiving=receiving,
+       token_out_symbol=token_out_symbol,
+       token_out_address=config["tokens"][token_out_symbol], # 
+       amount_in=amount_in,
+       amount_out=amount_out,
+       amount_out_decimals=receiving,
+       price=costs["price"],
+       fee=0, # MetaMask specific, set to 0 for Uniswap
+       interface_fee=costs["interface_fee"], # 
+       gas_compute=gas_estimate,
+       gas_cost_eth=costs["gas_cost_eth"],
+       gas_cost_usd=costs["gas_cost_usd"],
+       effective_price=costs["effective_price"],
+       pool_address=pool_address or None,
+       fee_tier=fee_tier, # 
+       pool_fee=costs["pool_fee"],
+       fetch_time=None, # MetaMask specific
+       slippage_percentage=slippage_percentage
+   )
+
+def  get_uniswap_quote (token_in_symbol, token_out_symbol, notional_amount, gas_price=None, network="ethereum", block_identifier="latest"): # 
+   """
+   Get quote from Uniswap for a given token pair and amount, selecting the best pool
+   """
+   config = initialize_network(network)
+   w3_instance = config["w3"]
+   quoter_contract = config.get("quoter")
+   quoter_available = config.get("quoter_available", False)
+   quoter_v2_contract = config.get("quoter_v2")
+   quoter_v2_available = config.get("quoter_v2_available", False)
+   tokens = config["tokens"]
+  
+   # Check if we have at least one quoter available
+   if not quoter_available and not quoter_v2_available:
+       error_msg = f"[{config['name']}] No quoter contracts available" # 
+       logger.error(error_msg)
+       raise Exception(error_msg)
+  
+   token_in = tokens[token_in_symbol]
+   token_out = tokens[token_out_symbol]
+   decimals_in = TOKEN_DECIMALS[token_in_symbol]
+   amount_in = int(notional_amount * 10**decimals_in)
+  
+   # Best execution: quote every fee tier at once and keep the best net output
+   if FEE_TIER_SELECTION == "best_execution":
+       pool_addresses, tier_results = probe_fee_tiers(config, token_in, token_out, amount_in, token_in_symbol, network, block_identifier)
+       if gas_price is None:
+           gas_price = w3_instance.eth.gas_price
+       return select_best_fee_tier(network, token_in_symbol, token_out_symbol, notional_amount, amount_in,
+                                   pool_addresses, tier_results, gas_price, get_eth_price_usd(config, block_identifier), block_identifier)
+  
+   # Find the best pool with sufficient liquidity
+   fee_tier, pool_address = find_best_pool_with_liquidity(token_in, token_out, amount_in, token_in_symbol, network, block_identifier)
+  
+   # Check if any pools were found
+   if fee_tier is None:
+       error_msg = f"[{config['name']}] No pools available for {token_in_symbol}-{token_out_symbol} - skipping pair" # 
+       logger.warning(error_msg)
+       raise Exception(error_msg)
+  
+   # Try the selected fee tier first, then fallback to others if needed
+   fee_tiers_to_try = [fee_tier] + [f for f in POOL_FEE_TIERS if f != fee_tier]
+  
+   last_error = None
+   for current_fee_tier in fee_tiers_to_try:
+       if current_fee_tier != fee_tier:
+           record_count("fee_tier_fallbacks_total")
+       try:
+           amount_out = None
+           gas_estimate = 150000  # Default fallback 
+          
+           # Quote from the pool's state snapshot when local quoting is enabled
+           if QUOTE_SOURCE == "local":
+               amount_out, gas_estimate = quote_from_snapshot(config, token_in, token_out, current_fee_tier, amount_in, gas_estimate, block_identifier)
+          
+           if amount_out is not None:
+               logger.debug("[%s] Uniswap: Using local swap math for fee tier %s%% for %s-%s", config['name'], current_fee_tier/10000, token_in_symbol, token_out_symbol)
+          
+           # Use QuoterV2 if QuoterV1 is not available (e.g. on Base))
+           elif quoter_v2_available and (not quoter_available or network == "base"): # network == "base" part is now moot
+               # Create the path for QuoterV2
+               path_bytes = build_v2_path(token_in, current_fee_tier, token_out)
+              
+               # QuoterV2 returns (amountOut, sqrtPriceX96AfterList, initializedTicksCrossedList, gasEstimate)
+               amount_out, _, _, gas_estimate = contract_read( # 
+                   config, quoter_v2_contract, "quoteExactInput", [path_bytes, amount_in], block_identifier
+               )
+               logger.debug("[%s] Uniswap: Using QuoterV2 for fee tier %s%% for %s-%s", config['name'], current_fee_tier/10000, token_in_symbol, token_out_symbol)
+          
+           # Use QuoterV1 if available
+           elif quoter_available:
+               amount_out = contract_read( # 
+                   config, quoter_contract, "quoteExactInputSingle",
+                   [token_in, token_out, current_fee_tier, amount_in, 0], block_identifier
+               )
+               logger.debug("[%s] Uniswap: Using QuoterV1 for fee tier %s%% for %s-%s", config['name'], current_fee_tier/10000, token_in_symbol, token_out_symbol)
+              
+               # Try to get gas estimate from QuoterV2 if available and QuoterV1 was used for amount_out 
+               if quoter_v2_available and quoter_v2_contract:
+                   try:
+                       path_bytes = build_v2_path(token_in, current_fee_tier, token_out)
+                       _, _, _, gas_estimate_v2 = contract_read( # 
+                           config, quoter_v2_contract, "quoteExactInput", [path_bytes, amount_in], block_identifier
+                       )
+                       gas_estimate = gas_estimate_v2 # Update gas estimate if successful
+                       logger.debug("[%s] Uniswap: Gas estimate from QuoterV2: %s", config['name'], gas_estimate)
+                   except RpcThrottledError:
+                       raise
+                   except Exception:
+                       pass # Silently fall back to default estimate if QuoterV2 gas fails 
+          
+           if amount_out is None:
+               logger.error(f"[{config['name']}] Uniswap: Could not get amountOut using available quoters for {token_in_symbol}-{token_out_symbol} at fee {current_fee_tier/10000}%")
+               raise Exception("No quoter available or quoter failed to return amount out")
+          
+           # Validate quote with slippage check for all trades 
+           is_valid_quote, slippage_percentage = validate_quote_with_slippage_check(
+               token_in, token_out, current_fee_tier, amount_in, amount_out,
+               token_in_symbol, quoter_contract, quoter_available,
+               quoter_v2_contract, quoter_v2_available, config, block_identifier
+           )
+           
+           if not is_valid_quote: # 
+               record_count("slippage_rejections_total")
+               logger.warning(f"[{config['name']}] Quote failed slippage validation for {token_in_symbol}-{token_out_symbol} at fee tier {current_fee_tier/10000}%, trying next tier")
+               last_error = Exception(f"Slippage validation failed: {slippage_percentage:.2f}%") # Store this as a potential error
+               continue
+          
+           if gas_price is None: # 
+               gas_price = w3_instance.eth.gas_price
+              
+           eth_price_usd = get_eth_price_usd(config, block_identifier) # 
+           return build_quote_row(network, token_in_symbol, token_out_symbol, notional_amount, amount_in, amount_out,
+                                  gas_estimate, gas_price, eth_price_usd, pool_address, current_fee_tier, slippage_percentage, block_identifier)
+       except RpcThrottledError:
+           # Throttling says nothing about this fee tier; let the caller give up on the quote instead
+           raise
+       except Exception as e: # 
+           last_error = e
+           # Log error for this specific fee tier attempt, but continue to next tier
+           logger.warning(f"[{config['name']}] Uniswap: Error getting quote for {token_in_symbol}-{token_out_symbol} at fee {current_fee_tier/10000}%: {e}")
+           continue # Try next fee tier
+  
+   # If we've tried all fee tiers and none worked
+   error_msg = f"[{config['name']}] Failed to get Uniswap quote for {token_in_symbol}-{token_out_symbol} after trying all fee tiers: {last_error}"
+   logger.error(error_msg)
+   raise Exception(error_msg) # This will be caught by the calling function
+
+def  probe_fee_tiers (config, token_in, token_out, amount_in, token_in_symbol, network, block_identifier="latest"):
+   """
+   Quote every fee tier with a pool, sending all the quoter reads as one batch.
+   Returns ({fee_tier: pool_address}, {fee_tier: (amount_out, gas_estimate, is_valid_quote, slippage_percentage) or Exception})
+   """
+   pool_addresses = {}
+   tier_results = {}
+   tier_reads = {}
+   for fee in POOL_FEE_TIERS:
+       try:
+           pool_address = get_pool_address(config, token_in, token_out, fee)
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           tier_results[fee] = e
+           continue
+       if pool_address is None:
+           continue
+       pool_addresses[fee] = pool_address
+      
+       if QUOTE_SOURCE == "local":
+           try:
+               local_result = local_fee_tier_quote(config, token_in, token_out, fee, amount_in, token_in_symbol, block_identifier)
+           except Exception as e:
+               logger.warning(f"[{config['name']}] Local quote failed for fee tier {fee/10000}%, using the quoter: {e}")
+               local_result = None
+           if local_result is not None:
+               tier_results[fee] = local_result
+               continue
+       tier_reads[fee] = quote_reads_for_fee_tier(config, token_in, token_out, fee, amount_in, network)
+  
+   batch_results = batch_read(config, [read for reads in tier_reads.values() for read in reads], MULTICALL_BATCH_SIZE, block_identifier)
+   start = 0
+   for fee, reads in tier_reads.items():
+       results = [value if success else Exception(value) for success, value in batch_results[start:start + len(reads)]]
+       start += len(reads)
+       try:
+           tier_results[fee] = interpret_fee_tier_reads(config, reads, results, fee, amount_in, token_in_symbol)
+       except Exception as e:
+           tier_results[fee] = e
+   return pool_addresses, tier_results
+
+def  build_probe_row (network, token_in_symbol, token_out_symbol, notional_amount, fee_tier, pool_address, result, quote_row, status):
+   """Build a fee_tier_probes row for one fee tier's quote"""
+   failed = isinstance(result, Exception)
+   return {
+       "timestamp": dt.datetime.now(dt.UTC).isoformat(),
+       "network": network,
+       "direction": f"{token_in_symbol}->{token_out_symbol}",
+       "notional": notional_amount,
+       "fee_tier": fee_tier,
+       "pool_address": pool_address if pool_address else "unknown",
+       "status": status,
+       "amount_out": "" if failed else str(result[0]),
+       "gas_compute": "" if failed else str(result[1]),
+       "effective_price": quote_row.effective_price if quote_row else "",
+       "slippage_percentage": "" if failed or result[3] is None else str(result[3]),
+       "error": str(result) if failed else ""
+   }
+
+def  select_best_fee_tier (network, token_in_symbol, token_out_symbol, notional_amount, amount_in,
+                          pool_addresses, tier_results, gas_price, eth_price_usd, block_identifier="latest"):
+   """
+   Among the fee tiers that quoted and passed the slippage check, pick the one with the lowest
+   effective price (notional plus interface fee and gas, per token received) and return its row
+   """
+   config = NETWORK_CONFIGS[network]
+   raise_if_throttled(tier_results.values())
+   quote_rows = {}
+   for fee_tier, result in tier_results.items():
+       if isinstance(result, Exception) or not result[2]:
+           if not isinstance(result, Exception):
+               record_count("slippage_rejections_total")
+           continue
+       amount_out, gas_estimate, _, slippage_percentage = result
+       quote_rows[fee_tier] = build_quote_row(network, token_in_symbol, token_out_symbol, notional_amount, amount_in, amount_out,
+                                              gas_estimate, gas_price, eth_price_usd, pool_addresses[fee_tier], fee_tier, slippage_percentage, block_identifier)
+   priced_tiers = [fee_tier for fee_tier, row in quote_rows.items() if row.effective_price > 0]
+   best_fee_tier = min(priced_tiers, key=lambda fee_tier: quote_rows[fee_tier].effective_price, default=None)
+  
+   if RECORD_FEE_TIER_PROBES:
+       probe_rows = []
+       for fee_tier, result in tier_results.items():
+           if isinstance(result, Exception):
+               status = "failed"
+           elif not result[2]:
+               status = "rejected_slippage"
+           else:
+               status = "selected" if fee_tier == best_fee_tier else "quoted"
+           probe_rows.append(build_probe_row(network, token_in_symbol, token_out_symbol, notional_amount, fee_tier,
+                                             pool_addresses.get(fee_tier), result, quote_rows.get(fee_tier), status))
+       write_quote_rows(probe_rows, "fee_tier_probes")
+  
+   if best_fee_tier is None:
+       errors = "; ".join(f"{fee_tier/10000}%: {result if isinstance(result, Exception) else 'slippage check failed'}" for fee_tier, result in tier_results.items())
+       error_msg = f"[{config['name']}] Failed to get Uniswap quote for {token_in_symbol}-{token_out_symbol} on any fee tier: {errors or 'no pools'}"
+       logger.error(error_msg)
+       raise Exception(error_msg)
+  
+   logger.debug("[%s] Uniswap: Best execution for %s-%s at fee tier %s%% out of %s quoted tiers (effective price %s)", config['name'],
+                token_in_symbol, token_out_symbol, best_fee_tier/10000, len(quote_rows), quote_rows[best_fee_tier].effective_price)
+   return quote_rows[best_fee_tier]
+
+############################
+# DEPTH CURVES
+############################
+
+def  evaluate_swap_segments (segments, covered_amount_in, fee_tier, zero_for_one, amounts_in):
+   """
+   Vectorized exact input output for an array of input amounts, from the constant-liquidity
+   segments of build_swap_segments (float64 precision). Sizes past the snapshot are NaN.
+   Returns (amounts_out, ticks_crossed)
+   """
+   amounts_in_before = np.array([float(segment[0]) for segment in segments])
+   amounts_out_before = np.array([float(segment[1]) for segment in segments])
+   sqrt_prices = np.array([segment[2] / 2**96 for segment in segments])
+   liquidities = np.array([float(segment[3]) for segment in segments])
+   segment_ticks_crossed = np.array([segment[4] for segment in segments])
+  
+   index = np.clip(np.searchsorted(amounts_in_before, amounts_in, side="right") - 1, 0, len(segments) - 1)
+   remaining_less_fee = (amounts_in - amounts_in_before[index]) * (1000000 - fee_tier) / 1000000
+   sqrt_price = sqrt_prices[index]
+   liquidity = liquidities[index]
+  
+   with np.errstate(divide="ignore", invalid="ignore"):
+       if zero_for_one:
+           sqrt_price_next = liquidity * sqrt_price / (liquidity + remaining_less_fee * sqrt_price)
+           step_amount_out = liquidity * (sqrt_price - sqrt_price_next)
+       else:
+           sqrt_price_next = sqrt_price + remaining_less_fee / liquidity
+           step_amount_out = liquidity * (1 / sqrt_price - 1 / sqrt_price_next)
+   step_amount_out = np.where(liquidity > 0, step_amount_out, 0.0)
+  
+   amounts_out = np.floor(amounts_out_before[index] + step_amount_out)
+   amounts_out[amounts_in > covered_amount_in] = np.nan
+   return amounts_out, segment_ticks_crossed[index]
+
+def  get_depth_curve (token_in_symbol, token_out_symbol, notionals, gas_price=None, network="ethereum", block_identifier="latest"):
+   """
+   Price impact curve for a pair over an array of notionals, from one state snapshot per fee tier.
+   Picks the fee tier for each size the way get_uniswap_quote does (lowest tier that quotes and
+   passes the 10% slippage check) and returns arrays of amount_out, effective_price,
+   slippage_percentage and fee_tier, aligned with notionals
+   """
+   config = initialize_network(network)
+   tokens = config["tokens"]
+   token_in = tokens[token_in_symbol]
+   token_out = tokens[token_out_symbol]
+   decimals_out = TOKEN_DECIMALS[token_out_symbol]
+   notionals = np.asarray(notionals, dtype=float)
+   amounts_in = np.floor(notionals * 10**TOKEN_DECIMALS[token_in_symbol])
+   small_amounts_in = np.floor(amounts_in * 0.1)
+   zero_for_one = int(token_in, 16) < int(token_out, 16)
+  
+   if gas_price is None:
+       gas_price = config["w3"].eth.gas_price
+   eth_price_usd = get_eth_price_usd(config, block_identifier)
+  
+   pools = {}
+   for fee in POOL_FEE_TIERS:
+       pool_address = get_pool_address(config, token_in, token_out, fee)
+       if pool_address is not None:
+           pools[pool_address] = fee
+   snapshots = fetch_pool_snapshots(config, pools, CURVE_SNAPSHOT_TICK_WORDS, block_identifier)
+  
+   curve = {
+       "amount_out": np.full(len(notionals), np.nan),
+       "effective_price": np.full(len(notionals), np.nan),
+       "slippage_percentage": np.full(len(notionals), np.nan),
+       "gas_cost_usd": np.full(len(notionals), np.nan),
+       "fee_tier": np.zeros(len(notionals), dtype=int)
+   }
+   unfilled = np.ones(len(notionals), dtype=bool)
+  
+   for pool_address, fee in sorted(pools.items(), key=lambda item: item[1]):
+       snapshot = snapshots.get(pool_address)
+       if snapshot is None or not unfilled.any():
+           continue
+       segments, covered_amount_in = build_swap_segments(snapshot, zero_for_one, int(amounts_in.max()))
+       if not segments:
+           continue
+       amounts_out, ticks_crossed = evaluate_swap_segments(segments, covered_amount_in, fee, zero_for_one, amounts_in)
+       small_amounts_out, _ = evaluate_swap_segments(segments, covered_amount_in, fee, zero_for_one, small_amounts_in)
+      
+       with np.errstate(divide="ignore", invalid="ignore"):
+           is_reasonable, slippage_percentage = calculate_slippage(
+               amounts_in, amounts_out, small_amounts_in, small_amounts_out, token_in_symbol
+           )
+       gas_estimate = SWAP_GAS_BASE + SWAP_GAS_PER_TICK_CROSSED * ticks_crossed
+       costs = calculate_quote_costs(notionals, amounts_out / 10**decimals_out, fee, gas_estimate, gas_price, eth_price_usd)
+      
+       selected = unfilled & (amounts_out > 0) & is_reasonable
+       curve["amount_out"][selected] = amounts_out[selected]
+       curve["effective_price"][selected] = costs["effective_price"][selected]
+       curve["slippage_percentage"][selected] = slippage_percentage[selected]
+       curve["gas_cost_usd"][selected] = costs["gas_cost_usd"][selected]
+       curve["fee_tier"][selected] = fee
+       unfilled &= ~selected
+  
+   logger.debug("[%s] Depth curve for %s->%s: %s/%s sizes quoted across %s pools", config['name'], token_in_symbol, token_out_symbol,
+                int((~unfilled).sum()), len(notionals), len(snapshots))
+   return curve
+
+def  build_curve_row (token_in_symbol, token_out_symbol, notionals, curve, network):
+   """Flatten a depth curve into a single CSV row, one JSON array per column"""
+   return {
+       "timestamp": dt.datetime.now(dt.UTC).isoformat(),
+       "network": network,
+       "direction": f"{token_in_symbol}->{token_out_symbol}",
+       "token_in_symbol": token_in_symbol,
+       "token_out_symbol": token_out_symbol,
+       "points": len(notionals),
+       "notionals": json.dumps(np.round(notionals, 2).tolist()),
+       "amount_out": json.dumps([None if np.isnan(value) else int(value) for value in curve["amount_out"]]),
+       "effective_price": json.dumps([None if np.isnan(value) else float(value) for value in curve["effective_price"]]),
+       "slippage_percentage": json.dumps([None if np.isnan(value) else round(float(value), 6) for value in curve["slippage_percentage"]]),
+       "gas_cost_usd": json.dumps([None if np.isnan(value) else round(float(value), 6) for value in curve["gas_cost_usd"]]),
+       "fee_tier": json.dumps(curve["fee_tier"].tolist())
+   }
+
+############################
+# DATA PROCESSING FUNCTIONS
+############################
+
+def  fetch_uniswap_quote_data (token_a, token_b, notional, cached_gas_price, network_key, config, block_identifier="latest"): # 
+   """
+   Fetch Uniswap quote for a single trading pair and notional amount.
+   """
+   direction = f"{token_a}->{token_b}"
+   uniswap_quote = None
+   try:
+       uniswap_quote = get_uniswap_quote(token_a, token_b, notional, cached_gas_price, network_key, block_identifier) # 
+       if uniswap_quote: # Check if quote was successfully retrieved
+            logger.debug("[%s] Uniswap: Quote received for %s with $%s USD", config['name'], direction, notional)
+   except Exception as e:
+       # Error logging is handled within get_uniswap_quote if all tiers fail.
+       # This catch is for unexpected errors or if get_uniswap_quote re-raises.
+       # More specific logging from get_uniswap_quote should provide details.
+       logger.error(f"[{config['name']}] Uniswap: Error getting quote for {direction} with ${notional} USD in fetch_uniswap_quote_data: {e}") # , (adapted for uniswap only)
+       # No need to check for "No pools available" here as get_uniswap_quote handles that logging.
+   return uniswap_quote
+
+
+def  quote_reads_for_fee_tier (config, token_in, token_out, fee_tier, amount_in, network):
+   """
+   List the quoter reads get_uniswap_quote makes for one fee tier, in call order.
+   The first read returns amount_out and the last one is the 10% slippage probe.
+   """
+   quoter_contract = config.get("quoter")
+   quoter_available = config.get("quoter_available", False)
+   quoter_v2_contract = config.get("quoter_v2")
+   quoter_v2_available = config.get("quoter_v2_available", False)
+   path_bytes = build_v2_path(token_in, fee_tier, token_out)
+   small_amount_in = int(amount_in * 0.1)
+   reads = []
+  
+   if quoter_v2_available and (not quoter_available or network == "base"):
+       reads.append((quoter_v2_contract, "quoteExactInput", [path_bytes, amount_in]))
+   elif quoter_available:
+       reads.append((quoter_contract, "quoteExactInputSingle", [token_in, token_out, fee_tier, amount_in, 0]))
+       if quoter_v2_available and quoter_v2_contract:
+           reads.append((quoter_v2_contract, "quoteExactInput", [path_bytes, amount_in]))
+  
+   if not quoter_available and quoter_v2_available:
+       reads.append((quoter_v2_contract, "quoteExactInput", [path_bytes, small_amount_in]))
+   elif quoter_available:
+       reads.append((quoter_contract, "quoteExactInputSingle", [token_in, token_out, fee_tier, small_amount_in, 0]))
+  
+   return reads
+
+def  interpret_fee_tier_reads (config, reads, results, fee_tier, amount_in, token_in_symbol):
+   """
+   Turn the results of quote_reads_for_fee_tier (values, or exceptions for failed reads) into
+   (amount_out, gas_estimate, is_valid_quote, slippage_percentage); raises if the quote failed
+   """
+   raise_if_throttled(results)
+   gas_estimate = 150000  # Default fallback
+   amount_out = results[0]
+   if isinstance(amount_out, Exception):
+       raise amount_out
+   if isinstance(amount_out, list):
+       # QuoterV2 returns (amountOut, sqrtPriceX96AfterList, initializedTicksCrossedList, gasEstimate)
+       amount_out, gas_estimate = amount_out[0], amount_out[3]
+   elif len(reads) == 3 and not isinstance(results[1], Exception):
+       gas_estimate = results[1][3]  # Gas estimate from QuoterV2 alongside QuoterV1
+  
+   small_amount_out = results[-1]
+   if isinstance(small_amount_out, Exception):
+       logger.warning(f"[{config['name']}] Could not perform slippage check: {small_amount_out}")
+       return amount_out, gas_estimate, True, None
+   if isinstance(small_amount_out, list):
+       small_amount_out = small_amount_out[0]
+   if not small_amount_out:
+       return amount_out, gas_estimate, True, 0.0
+  
+   is_reasonable, slippage_percentage = calculate_slippage(amount_in, amount_out, int(amount_in * 0.1), small_amount_out, token_in_symbol)
+   if not is_reasonable:
+       logger.warning(f"[{config['name']}] Detected unreasonable slippage for {token_in_symbol} at fee tier {fee_tier/10000}%: {slippage_percentage:.2f}%")
+   return amount_out, gas_estimate, is_reasonable, slippage_percentage
+
+def  local_fee_tier_quote (config, token_in, token_out, fee_tier, amount_in, token_in_symbol, block_identifier):
+   """
+   Quote and slippage check one fee tier from its state snapshot, in the same shape as
+   interpret_fee_tier_reads. Returns None when either swap leaves the snapshot
+   """
+   amount_out, gas_estimate = quote_from_snapshot(config, token_in, token_out, fee_tier, amount_in, 150000, block_identifier)
+   small_amount_out, _ = quote_from_snapshot(config, token_in, token_out, fee_tier, int(amount_in * 0.1), None, block_identifier)
+   if amount_out is None or small_amount_out is None:
+       return None
+   is_reasonable, slippage_percentage = calculate_slippage(amount_in, amount_out, int(amount_in * 0.1), small_amount_out, token_in_symbol)
+   return amount_out, gas_estimate, is_reasonable, slippage_percentage
+
+def  prefetched_quote_is_valid (config, reads, amount_in, token_in_symbol, block_identifier):
+   """Check a prefetched fee tier quote the way get_uniswap_quote would, without logging"""
+   success, amount_out = prefetched_result(config, *reads[0], block_identifier)
+   if not success:
+       return False
+   if isinstance(amount_out, list):
+       amount_out = amount_out[0]
+  
+   success, small_amount_out = prefetched_result(config, *reads[-1], block_identifier)
+   if not success or not small_amount_out:
+       return True  # get_uniswap_quote accepts quotes it cannot slippage check
+   if isinstance(small_amount_out, list):
+       small_amount_out = small_amount_out[0]
+  
+   is_reasonable, _ = calculate_slippage(amount_in, amount_out, int(amount_in * 0.1), small_amount_out, token_in_symbol)
+   return is_reasonable
+
+def  prefetch_network_reads (network_key, config, block_number, trade_pairs=None):
+   """
+   Batch every contract read of a cycle through Multicall3 at the cycle's block, following the
+   same fee tier selection and fallback order as find_best_pool_with_liquidity and get_uniswap_quote,
+   so those functions are served from the per-block memo cache instead of one eth_call per read
+   """
+   if not ENABLE_MULTICALL or not config.get("multicall3_available"):
+       return
+  
+   factory_contract = config["factory"]
+   tokens = config["tokens"]
+   results = {}
+   batch_start = time.time()
+   pairs = [(token_a, token_b) for token_a, token_b in (trade_pairs or config["trade_pairs"])
+            if token_a in tokens and token_b in tokens]
+  
+   # Round 1: pool discovery, only for fee tiers the pool registry does not know yet
+   pool_addresses = {}
+   unknown_tiers = []
+   for token_a, token_b in pairs:
+       for fee in POOL_FEE_TIERS:
+           known, pool_address = lookup_pool_address(config, tokens[token_a], tokens[token_b], fee)
+           if not known:
+               unknown_tiers.append((token_a, token_b, fee))
+           elif pool_address is not None:
+               pool_addresses[(token_a, token_b, fee)] = pool_address
+  
+   candidates = {}
+   if config.get("pool_init_code_hash"):
+       # CREATE2 addresses are confirmed by the liquidity round below instead of asking the factory
+       for token_a, token_b, fee in unknown_tiers:
+           candidates[(token_a, token_b, fee)] = compute_pool_address(config, tokens[token_a], tokens[token_b], fee)
+   elif unknown_tiers:
+       pool_reads = [(factory_contract, "getPool", [tokens[token_a], tokens[token_b], fee]) for token_a, token_b, fee in unknown_tiers]
+       results.update(multicall_read(config, pool_reads, block_identifier=block_number))
+       for token_a, token_b, fee in unknown_tiers:
+           success, pool_address = prefetched_result(config, factory_contract, "getPool", [tokens[token_a], tokens[token_b], fee], block_number)
+           if not success:
+               continue
+           if pool_address == "0x0000000000000000000000000000000000000000":
+               pool_address = None
+           record_pool_address(config, tokens[token_a], tokens[token_b], fee, pool_address)
+           if pool_address is not None:
+               pool_addresses[(token_a, token_b, fee)] = pool_address
+  
+   # Round 2: liquidity of every pool, which also tells whether a CREATE2 candidate is deployed
+   pool_contracts = {tier: PrecompiledContract(pool_address, POOL_ABI)
+                     for tier, pool_address in {**pool_addresses, **candidates}.items()}
+   liquidity_reads = [(pool_contract, "liquidity", []) for pool_contract in pool_contracts.values()]
+   liquidity_reads.append((config["eth_usd_pool"], "slot0", []))  # ETH/USD for gas costs, at the same block
+   results.update(multicall_read(config, liquidity_reads, block_identifier=block_number))
+  
+   for (token_a, token_b, fee), candidate in candidates.items():
+       success, value = results.get(encode_contract_call(pool_contracts[(token_a, token_b, fee)], "liquidity", []), (False, ""))
+       if success:
+           record_pool_address(config, tokens[token_a], tokens[token_b], fee, candidate)
+           continue
+       if value.endswith(NO_RETURN_DATA_ERROR):
+           record_pool_address(config, tokens[token_a], tokens[token_b], fee, None)
+       # Unconfirmed tiers are left to find_best_pool_with_liquidity to resolve on demand
+       del pool_contracts[(token_a, token_b, fee)]
+  
+   # Round 3: quotes at the fee tier find_best_pool_with_liquidity will pick,
+   # or at every fee tier with a pool in best execution mode
+   quote_plans = []
+   selected_pools = {}
+   for token_a, token_b in pairs:
+       pool_fees = [fee for fee in POOL_FEE_TIERS if (token_a, token_b, fee) in pool_contracts]
+       if FEE_TIER_SELECTION == "best_execution":
+           quoted_fees = pool_fees
+       else:
+           quoted_fees = []
+           for fee in pool_fees:
+               success, total_liquidity = prefetched_result(config, pool_contracts[(token_a, token_b, fee)], "liquidity", [], block_number)
+               if not success or total_liquidity > 0:
+                   quoted_fees = [fee]
+                   break
+      
+       for fee in quoted_fees:
+           selected_pools[pool_contracts[(token_a, token_b, fee)].address] = fee
+           for notional in USD_NOTIONALS:
+               amount_in = int(notional * 10**TOKEN_DECIMALS[token_a])
+               reads = quote_reads_for_fee_tier(config, tokens[token_a], tokens[token_b], fee, amount_in, network_key)
+               quote_plans.append((token_a, token_b, fee, amount_in, reads))
+  
+   if QUOTE_SOURCE == "local":
+       # One state snapshot per pool replaces all quoter reads; other fee tiers are loaded on demand
+       snapshots = fetch_pool_snapshots(config, selected_pools, block_identifier=block_number)
+       config["pool_snapshots"].update({(block_number, pool_address): snapshot for pool_address, snapshot in snapshots.items()})
+       logger.info(f"[{config['name']}] Loaded {len(snapshots)} pool snapshots for local quoting at block {block_number} in {time.time() - batch_start:.2f}s")
+       return
+   results.update(multicall_read(config, [read for *_, reads in quote_plans for read in reads], block_identifier=block_number))
+  
+   # Round 4: remaining fee tiers for quotes that will fail or be rejected for slippage
+   fallback_reads = []
+   if FEE_TIER_SELECTION == "best_execution":
+       quote_plans = []  # Every fee tier was already quoted
+   for token_a, token_b, selected_fee, amount_in, reads in quote_plans:
+       if prefetched_quote_is_valid(config, reads, amount_in, token_a, block_number):
+           continue
+       for fee in POOL_FEE_TIERS:
+           if fee != selected_fee:
+               fallback_reads.extend(quote_reads_for_fee_tier(config, tokens[token_a], tokens[token_b], fee, amount_in, network_key))
+   if fallback_reads:
+       results.update(multicall_read(config, fallback_reads, block_identifier=block_number))
+  
+   logger.info(f"[{config['name']}] Prefetched {len(results)} contract reads via Multicall3 at block {block_number} in {time.time() - batch_start:.2f}s")
+
+def  process_trading_pair (pair_data, deadline=None):
+   """
+   Process a single trading pair with all its notional amounts. Past the deadline (a time.time()
+   value) the pair is abandoned without writing its rows and False is returned
+   """ # 
+   token_a, token_b, config, network_key, cached_gas_price, cycle_timestamp, block_number = pair_data
+     # cached_eth_price removed as it was for MetaMask
+  
+   # Skip pairs where tokens don't exist on this network (should not happen with current setup)
+   if token_a not in config["tokens"] or token_b not in config["tokens"]: # 
+       logger.warning(f"[{config['name']}] Skipping {token_a}/{token_b} - tokens not available on this network")
+       return
+  
+   # PEPE specific logic removed as PEPE is not in the new trade pairs 
+   notionals = USD_NOTIONALS # 
+   pair_rows = []
+  
+   for notional in notionals:
+       direction = f"{token_a}->{token_b}"
+       if deadline is not None and time.time() > deadline:
+           return False
+       logger.debug("[%s] [%s] Getting Uniswap quote for %s with $%s USD...", cycle_timestamp, config['name'], direction, notional)
+      
+       # Get Uniswap quote
+       uniswap_quote = fetch_uniswap_quote_data(token_a, token_b, notional, cached_gas_price, network_key, config, block_number)
+      
+       # Collect the pair's quotes, written below as one batch
+       if uniswap_quote:
+           pair_rows.append(uniswap_quote) # 
+           logger.debug("[%s] Uniswap: Quote collected for %s with $%s USD", config['name'], direction, notional)
+       else: # (adapted)
+           logger.warning(f"[{config['name']}] No Uniswap quote available for {direction} with ${notional} USD")
+      
+       # Base chain delay removed as Base network is removed 
+  
+   if deadline is not None and time.time() > deadline:
+       return False
+   write_quote_rows(pair_rows)
+  
+   # Full price impact curve for the pair, written as a single row
+   if ENABLE_DEPTH_CURVES:
+       try:
+           curve = get_depth_curve(token_a, token_b, CURVE_NOTIONALS, cached_gas_price, network_key, block_number)
+           write_quote_row(build_curve_row(token_a, token_b, CURVE_NOTIONALS, curve, network_key), "curves")
        except Exception as e:
-           logger.error(f"[{config['name']}] Error checking pool for fee tier {fee}: {e}")
+           logger.error(f"[{config['name']}] Error building depth curve for {token_a}->{token_b}: {e}")
+
+############################
+# ASYNC QUOTE ENGINE
+############################
+
+async def  async_multicall_chunk (config, limiter, chunk, block_identifier):
+   """
+   Send one chunk of batched reads as a single aggregate3 eth_call and resolve each read's future
+   with (success, value). Reads left unresolved (the batch failed) get None and are sent individually
+   """
+   multicall_contract = config["multicall3"]
+   try:
+       target, calldata = encode_contract_call(multicall_contract, "aggregate3", [[(target, True, calldata) for (target, calldata), _ in chunk]])
+       async with limiter:
+           return_data = await config["async_w3"].eth.call({"to": target, "data": calldata}, block_identifier)
+       raw_results = decode_contract_result(multicall_contract, "aggregate3", return_data)
+       for ((target, calldata), (contract, fn_name, future)), (success, return_data) in zip(chunk, raw_results):
+           record_count("multicall_reads_total", (("function", fn_name),))
+           result = decode_multicall_result(contract, fn_name, success, return_data)
+           cache_read_result(config, block_identifier, target, calldata, result)
+           if not future.done():
+               future.set_result(result)
+   except RpcThrottledError as e:
+       for _, (_, _, future) in chunk:
+           if not future.done():
+               future.set_exception(e)
+   except Exception as e:
+       logger.warning(f"[{config['name']}] Multicall batch of {len(chunk)} reads failed: {e}")
+   finally:
+       for _, (_, _, future) in chunk:
+           if not future.done():
+               future.set_result(None)
+
+async def  async_flush_reads (config, limiter, batch_key):
+   """Wait for the batch window, then send the reads gathered for a block through aggregate3"""
+   await asyncio.sleep(ASYNC_BATCH_WINDOW)
+   pending = list(async_read_batches.pop(batch_key)["reads"].items())
+   await asyncio.gather(*[async_multicall_chunk(config, limiter, pending[start:start + MULTICALL_BATCH_SIZE], batch_key[1])
+                          for start in range(0, len(pending), MULTICALL_BATCH_SIZE)])
+
+async def  async_batched_read (config, limiter, contract, fn_name, key, block_identifier):
+   """
+   Add a read to the next aggregate3 call for its block, so the reads every pair issues at the same
+   dependency level share one eth_call. Returns (success, value), or None if the batch failed
+   """
+   batch_key = (config["chain_id"], block_identifier)
+   batch = async_read_batches.get(batch_key)
+   if batch is None:
+       batch = async_read_batches[batch_key] = {"reads": {}}
+       batch["flush"] = asyncio.ensure_future(async_flush_reads(config, limiter, batch_key))
+   if key not in batch["reads"]:
+       batch["reads"][key] = (contract, fn_name, asyncio.get_running_loop().create_future())
+   # Shielded so a cancelled pair does not cancel the read for the other pairs waiting on it
+   return await asyncio.shield(batch["reads"][key][2])
+
+async def  async_contract_read (config, limiter, contract, fn_name, args, block_identifier="latest"):
+   """
+   Async counterpart of contract_read: batches the read through aggregate3 with the reads issued
+   alongside it (or sends it alone through AsyncWeb3) under the global concurrency limit, encoding
+   and decoding with the same contract objects as the sync path and sharing its per-block memo cache
+   """
+   target, calldata = encode_contract_call(contract, fn_name, args)
+   cached = cached_read_result(config, block_identifier, target, calldata)
+   if cached is not None:
+       success, value = cached
+       if not success:
+           raise Exception(value)
+       return value
+  
+   if ENABLE_MULTICALL and config.get("multicall3_available"):
+       batched = await async_batched_read(config, limiter, contract, fn_name, (target, calldata), block_identifier)
+       if batched is not None:
+           success, value = batched
+           if not success:
+               raise Exception(value)
+           return value
+  
+   try:
+       async with limiter:
+           return_data = await config["async_w3"].eth.call({"to": target, "data": calldata}, block_identifier)
+   except ContractLogicError as e:
+       cache_read_result(config, block_identifier, target, calldata, (False, str(e)))
+       raise
+   if not return_data:
+       raise Exception(f"{fn_name} {NO_RETURN_DATA_ERROR}")
+   value = decode_contract_result(contract, fn_name, return_data)
+   cache_read_result(config, block_identifier, target, calldata, (True, value))
+   return value
+
+async def  async_get_eth_price_usd (config, limiter, block_identifier="latest"):
+   """Async counterpart of get_eth_price_usd"""
+   eth_price = cached_eth_price(config, block_identifier)
+   if eth_price is not None:
+       return eth_price
+   try:
+       slot0 = await async_contract_read(config, limiter, config["eth_usd_pool"], "slot0", [], block_identifier)
+   except RpcThrottledError:
+       raise
+   except Exception as e:
+       return await asyncio.to_thread(fallback_eth_price, config, block_identifier, e)
+   return record_eth_price(config, slot0, block_identifier)
+
+async def  async_get_pool_address (config, limiter, token_a, token_b, fee, block_identifier="latest"):
+   """
+   Async counterpart of get_pool_address. A CREATE2 candidate is confirmed by reading its liquidity,
+   batched with the other fee tiers' reads, instead of an eth_getCode per fee tier
+   """
+   known, pool_address = lookup_pool_address(config, token_a, token_b, fee)
+   if known:
+       return pool_address
+  
+   if config.get("pool_init_code_hash"):
+       candidate = compute_pool_address(config, token_a, token_b, fee)
+       try:
+           await async_contract_read(config, limiter, PrecompiledContract(candidate, POOL_ABI), "liquidity", [], block_identifier)
+           pool_address = candidate
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           if not str(e).endswith(NO_RETURN_DATA_ERROR):
+               raise
+           pool_address = None
+   else:
+       pool_address = await async_contract_read(config, limiter, config["factory"], "getPool", [token_a, token_b, fee], block_identifier)
+       if pool_address == "0x0000000000000000000000000000000000000000":
+           pool_address = None
+  
+   record_pool_address(config, token_a, token_b, fee, pool_address)
+   return pool_address
+
+async def  async_find_best_pool_with_liquidity (config, limiter, token_in, token_out, token_in_symbol, block_identifier="latest"):
+   """
+   Same selection as find_best_pool_with_liquidity, with every fee tier's pool lookup and
+   liquidity read in flight at once
+   """
+   pool_addresses = await asyncio.gather(
+       *[async_get_pool_address(config, limiter, token_in, token_out, fee, block_identifier) for fee in POOL_FEE_TIERS],
+       return_exceptions=True
+   )
+   pool_contracts = {fee: PrecompiledContract(pool_address, POOL_ABI)
+                     for fee, pool_address in zip(POOL_FEE_TIERS, pool_addresses)
+                     if pool_address is not None and not isinstance(pool_address, Exception)}
+   liquidities = await asyncio.gather(
+       *[async_contract_read(config, limiter, pool_contract, "liquidity", [], block_identifier) for pool_contract in pool_contracts.values()],
+       return_exceptions=True
+   )
+   raise_if_throttled(pool_addresses)
+   raise_if_throttled(liquidities)
+   liquidity_by_fee = dict(zip(pool_contracts, liquidities))
+  
+   for fee, pool_address in zip(POOL_FEE_TIERS, pool_addresses):
+       if isinstance(pool_address, Exception):
+           logger.error(f"[{config['name']}] Error checking pool for fee tier {fee}: {pool_address}")
+           continue
+       if pool_address is None:
+           continue
+       total_liquidity = liquidity_by_fee[fee]
+       if isinstance(total_liquidity, Exception):
+           logger.warning(f"[{config['name']}] Could not check liquidity for pool {pool_address}: {total_liquidity}")
+           return fee, pool_address
+       if total_liquidity > 0:
+           logger.debug("[%s] Pool has liquidity (%s). Using fee tier %s%%", config['name'], total_liquidity, fee/10000)
+           return fee, pool_address
   
-   # No pools found across all fee tiers 
    logger.warning(f"[{config['name']}] No pools found for {token_in_symbol} across all fee tiers - skipping pair")
    return None, None
 
-def  validate_quote_with_slippage_check (token_in, token_out, current_fee_tier, amount_in, amount_out,
-                                    token_in_symbol, quoter_contract, quoter_available,
-                                    quoter_v2_contract, quoter_v2_available, config): 
+async def  async_quote_fee_tier (config, limiter, token_in, token_out, fee_tier, amount_in, token_in_symbol, network, block_identifier="latest"):
+   """
+   Quote one fee tier with the amount, gas estimate and 10% slippage probe reads in flight together.
+   Returns (amount_out, gas_estimate, is_valid_quote, slippage_percentage); raises if the quote fails
+   """
+   if QUOTE_SOURCE == "local":
+       local_result = await asyncio.to_thread(
+           local_fee_tier_quote, config, token_in, token_out, fee_tier, amount_in, token_in_symbol, block_identifier
+       )
+       if local_result is not None:
+           return local_result
+  
+   reads = quote_reads_for_fee_tier(config, token_in, token_out, fee_tier, amount_in, network)
+   results = await asyncio.gather(
+       *[async_contract_read(config, limiter, *read, block_identifier) for read in reads], return_exceptions=True
+   )
+   return interpret_fee_tier_reads(config, reads, results, fee_tier, amount_in, token_in_symbol)
+
+async def  async_get_uniswap_quote (config, limiter, token_in_symbol, token_out_symbol, notional_amount, fee_tier, pool_address, gas_price, network, block_identifier="latest"):
+   """
+   Async counterpart of get_uniswap_quote for an already selected pool. The selected fee tier is
+   quoted first; if it fails, all remaining tiers are quoted at once and the first valid one in
+   fallback order is used
+   """
+   tokens = config["tokens"]
+   token_in = tokens[token_in_symbol]
+   token_out = tokens[token_out_symbol]
+   amount_in = int(notional_amount * 10**TOKEN_DECIMALS[token_in_symbol])
+   fallback_tiers = [f for f in POOL_FEE_TIERS if f != fee_tier]
+  
    try:
-       # Test with 10% of the amount to check for slippage 
-       small_amount_in = int(amount_in * 0.1)
-       small_amount_out = None
+       selected_result = await async_quote_fee_tier(config, limiter, token_in, token_out, fee_tier, amount_in, token_in_symbol, network, block_identifier)
+   except RpcThrottledError:
+       raise
+   except Exception as e:
+       selected_result = e
+   attempts = [(fee_tier, selected_result)]
+   if isinstance(selected_result, Exception) or not selected_result[2]:
+       fallback_results = await asyncio.gather(
+           *[async_quote_fee_tier(config, limiter, token_in, token_out, fee, amount_in, token_in_symbol, network, block_identifier) for fee in fallback_tiers],
+           return_exceptions=True
+       )
+       raise_if_throttled(fallback_results)
+       attempts.extend(zip(fallback_tiers, fallback_results))
+  
+   last_error = None
+   for current_fee_tier, result in attempts:
+       if current_fee_tier != fee_tier:
+           record_count("fee_tier_fallbacks_total")
+       if isinstance(result, Exception):
+           last_error = result
+           logger.warning(f"[{config['name']}] Uniswap: Error getting quote for {token_in_symbol}-{token_out_symbol} at fee {current_fee_tier/10000}%: {result}")
+           continue
+       amount_out, gas_estimate, is_valid_quote, slippage_percentage = result
+       if not is_valid_quote:
+           record_count("slippage_rejections_total")
+           logger.warning(f"[{config['name']}] Quote failed slippage validation for {token_in_symbol}-{token_out_symbol} at fee tier {current_fee_tier/10000}%, trying next tier")
+           last_error = Exception(f"Slippage validation failed: {slippage_percentage:.2f}%")
+           continue
       
-       if not quoter_available and quoter_v2_available:
-           # Use QuoterV2 for slippage check 
-           fee_hex = current_fee_tier.to_bytes(3, byteorder='big').hex()
-           path = token_in.replace('0x', '') + fee_hex + token_out.replace('0x', '')
-           path = '0x' + path.lower()
-           path_bytes = Web3.to_bytes(hexstr=path)
-           small_amount_out, _, _, _ = quoter_v2_contract.functions.quoteExactInput( # 
-               path_bytes, small_amount_in
-           ).call()
-       elif quoter_available:
-           # Use QuoterV1 for slippage check
-           small_amount_out = quoter_contract.functions.quoteExactInputSingle(
-               token_in, token_out, current_fee_tier, small_amount_in, 0
-           ).call()
+       eth_price_usd = await async_get_eth_price_usd(config, limiter, block_identifier)
+       return build_quote_row(network, token_in_symbol, token_out_symbol, notional_amount, amount_in, amount_out,
+                              gas_estimate, gas_price, eth_price_usd, pool_address, current_fee_tier, slippage_percentage, block_identifier)
+  
+   raise Exception(f"[{config['name']}] Failed to get Uniswap quote for {token_in_symbol}-{token_out_symbol} after trying all fee tiers: {last_error}")
+
+async def  async_get_best_execution_quote (config, limiter, token_in_symbol, token_out_symbol, notional_amount, gas_price, network, block_identifier="latest"):
+   """
+   Async counterpart of the best execution mode of get_uniswap_quote: every fee tier's pool lookup,
+   then every fee tier's quote, in flight at once
+   """
+   token_in = config["tokens"][token_in_symbol]
+   token_out = config["tokens"][token_out_symbol]
+   amount_in = int(notional_amount * 10**TOKEN_DECIMALS[token_in_symbol])
+  
+   pool_lookups = await asyncio.gather(
+       *[async_get_pool_address(config, limiter, token_in, token_out, fee, block_identifier) for fee in POOL_FEE_TIERS],
+       return_exceptions=True
+   )
+   tier_results = {fee: lookup for fee, lookup in zip(POOL_FEE_TIERS, pool_lookups) if isinstance(lookup, Exception)}
+   pool_addresses = {fee: lookup for fee, lookup in zip(POOL_FEE_TIERS, pool_lookups)
+                     if lookup is not None and not isinstance(lookup, Exception)}
+   quotes = await asyncio.gather(
+       *[async_quote_fee_tier(config, limiter, token_in, token_out, fee, amount_in, token_in_symbol, network, block_identifier)
+         for fee in pool_addresses],
+       return_exceptions=True
+   )
+   tier_results.update(zip(pool_addresses, quotes))
+  
+   if gas_price is None:
+       async with limiter:
+           gas_price = await config["async_w3"].eth.gas_price
+   eth_price_usd = await async_get_eth_price_usd(config, limiter, block_identifier)
+   return select_best_fee_tier(network, token_in_symbol, token_out_symbol, notional_amount, amount_in,
+                               pool_addresses, tier_results, gas_price, eth_price_usd, block_identifier)
+
+async def  async_process_trading_pair (pair_data, limiter):
+   """
+   Async counterpart of process_trading_pair: pool selection once per pair, then every notional at once
+   """
+   token_a, token_b, config, network_key, cached_gas_price, cycle_timestamp, block_number = pair_data
+   direction = f"{token_a}->{token_b}"
+   if token_a not in config["tokens"] or token_b not in config["tokens"]:
+       logger.warning(f"[{config['name']}] Skipping {token_a}/{token_b} - tokens not available on this network")
+       return
+  
+   if FEE_TIER_SELECTION == "best_execution":
+       quotes = await asyncio.gather(
+           *[async_get_best_execution_quote(config, limiter, token_a, token_b, notional, cached_gas_price, network_key, block_number)
+             for notional in USD_NOTIONALS],
+           return_exceptions=True
+       )
+   else:
+       fee_tier, pool_address = await async_find_best_pool_with_liquidity(
+           config, limiter, config["tokens"][token_a], config["tokens"][token_b], token_a, block_number
+       )
+       if fee_tier is None:
+           logger.warning(f"[{config['name']}] No Uniswap quote available for {direction} - no pools found")
+           return
       
-       if small_amount_out:
-           # Calculate slippage 
-           input_ratio = amount_in / small_amount_in
-           output_ratio = amount_out / small_amount_out
-           slippage_ratio = 1 - (output_ratio / input_ratio)
-           slippage_percentage = slippage_ratio * 100  # Convert to percentage
-          
-           # Check if slippage is unreasonable 
-           max_slippage_ratio = SLIPPAGE_TOLERANCE_BY_TOKEN.get(token_in_symbol, SLIPPAGE_TOLERANCE_BY_TOKEN['default'])
-           is_reasonable = slippage_ratio <= max_slippage_ratio
-          
-           if not is_reasonable:
-               logger.warning(f"[{config['name']}] Detected unreasonable slippage for {token_in_symbol} at fee tier {current_fee_tier/10000}%: {slippage_percentage:.2f}%")
-           return is_reasonable, slippage_percentage # 
-       else:
-           # If we can't get small quote, assume no slippage issue
-           return True, 0.0
+       quotes = await asyncio.gather(
+           *[async_get_uniswap_quote(config, limiter, token_a, token_b, notional, fee_tier, pool_address, cached_gas_price, network_key, block_number)
+             for notional in USD_NOTIONALS],
+           return_exceptions=True
+       )
+   for notional, uniswap_quote in zip(USD_NOTIONALS, quotes):
+       if isinstance(uniswap_quote, Exception):
+           logger.error(f"[{config['name']}] Uniswap: Error getting quote for {direction} with ${notional} USD: {uniswap_quote}")
+   write_quote_rows([uniswap_quote for uniswap_quote in quotes if not isinstance(uniswap_quote, Exception)])
+   logger.debug("[%s] Uniswap: Quotes written for %s", config['name'], direction)
+
+def  run_async (coroutine):
+   """
+   Run a coroutine on the process's persistent event loop and wait for its result. The async
+   providers' sessions (and their pooled connections) are bound to the loop, so they carry over from
+   one cycle to the next; the loop runs in its own thread, so overlapping cycles can share it
+   """
+   with async_engine_lock:
+       if async_engine["loop"] is None:
+           async_engine["loop"] = asyncio.new_event_loop()
+           async_engine["thread"] = threading.Thread(target=async_engine["loop"].run_forever, name="async-engine", daemon=True)
+           async_engine["thread"].start()
+   return asyncio.run_coroutine_threadsafe(coroutine, async_engine["loop"]).result()
+
+def  close_async_engine ():
+   """Close the async providers' sessions and stop the event loop they are bound to"""
+   loop = async_engine["loop"]
+   if loop is None or loop.is_closed():
+       return
+   for config in NETWORK_CONFIGS.values():
+       if "async_w3" in config:
+           run_async(config["async_w3"].provider.close())
+   loop.call_soon_threadsafe(loop.stop)
+   async_engine["thread"].join()
+   loop.close()
+
+atexit.register(close_async_engine)
+
+async def  async_process_network (pair_tasks, deadline=None):
+   """
+   Run every trading pair of a network concurrently under one concurrency limit. Pairs still running
+   at the deadline (a time.time() value) are cancelled; returns their pair_data
+   """
+   limiter = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+   for config in {id(pair_data[2]): pair_data[2] for pair_data in pair_tasks}.values():
+       await config["async_w3"].provider.warm_up()
+   tasks = {asyncio.ensure_future(async_process_trading_pair(pair_data, limiter)): pair_data for pair_data in pair_tasks}
+   done, pending = await asyncio.wait(tasks, timeout=None if deadline is None else max(0, deadline - time.time()))
+   for task in pending:
+       task.cancel()
+   await asyncio.gather(*pending, return_exceptions=True)
+   for task in done:
+       if task.exception() is not None:
+           logger.error(f"Error processing a trading pair task: {task.exception()}")
+   return [tasks[task] for task in pending]
+
+############################
+# EVENT-DRIVEN REQUOTING
+############################
+
+def  load_event_state ():
+   """Load the last processed block per chain: {chain_id: block}"""
+   if not os.path.isfile(EVENT_STATE_FILE):
+       return {}
+   try:
+       with open(EVENT_STATE_FILE) as f:
+           return json.load(f)
+   except Exception as e:
+       logger.warning(f"Could not load event state from {EVENT_STATE_FILE}: {e}")
+       return {}
+
+def  save_event_state (event_state):
+   """Persist the last processed block per chain (atomic replace)"""
+   tmp_file = EVENT_STATE_FILE + ".tmp"
+   os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+   with open(tmp_file, "w") as f:
+       json.dump(event_state, f, indent=1, sort_keys=True)
+   os.replace(tmp_file, EVENT_STATE_FILE)
+
+def  tracked_pools (config):
+   """Map every pool of the network's trading pairs (all fee tiers) to the pairs it quotes: {pool_address: [pair]}"""
+   tokens = config["tokens"]
+   pools = collections.defaultdict(list)
+   for token_a, token_b in config["trade_pairs"]:
+       if token_a not in tokens or token_b not in tokens:
+           continue
+       for fee in POOL_FEE_TIERS:
+           try:
+               pool_address = get_pool_address(config, tokens[token_a], tokens[token_b], fee)
+           except Exception as e:
+               logger.warning(f"[{config['name']}] Could not look up pool for {token_a}/{token_b} at fee tier {fee/10000}%: {e}")
+               continue
+           if pool_address is not None:
+               pools[pool_address.lower()].append((token_a, token_b))
+   return pools
+
+def  fetch_changed_pools (config, pool_addresses, from_block, to_block):
+   """
+   Addresses (lowercase) of the pools that emitted Swap, Mint or Burn between two blocks (inclusive).
+   Requests cover EVENT_MAX_BLOCK_RANGE blocks and are split in half when the node rejects them
+   """
+   changed = set()
+   ranges = [(start, min(start + EVENT_MAX_BLOCK_RANGE - 1, to_block)) for start in range(from_block, to_block + 1, EVENT_MAX_BLOCK_RANGE)]
+   while ranges:
+       start, end = ranges.pop()
+       try:
+           logs = config["w3"].eth.get_logs({
+               "fromBlock": start,
+               "toBlock": end,
+               "address": [Web3.to_checksum_address(pool_address) for pool_address in pool_addresses],
+               "topics": [POOL_EVENT_TOPICS]
+           })
+       except RpcThrottledError:
+           raise
+       except Exception as e:
+           if start == end:
+               raise
+           logger.info(f"[{config['name']}] eth_getLogs for blocks {start}-{end} failed ({e}), splitting the range")
+           middle = (start + end) // 2
+           ranges.extend([(start, middle), (middle + 1, end)])
+           continue
+       changed.update(log["address"].lower() for log in logs)
+   return changed
+
+def  poll_network_events (network_key, config, event_state):
+   """
+   One incremental step for a network: requote the pairs whose pools emitted events since the
+   last processed block, pinned to the newest block. Falls back to a full cycle on the first run,
+   after a long gap, or every EVENT_FULL_REQUOTE_INTERVAL
+   """
+   chain_key = str(config["chain_id"])
+   now = dt.datetime.now(dt.UTC).isoformat()
+   head = config["w3"].eth.block_number
+   last_block = event_state.get(chain_key)
+   last_full_requote = config.setdefault("last_full_requote", time.time())
+  
+   if (last_block is None or head - last_block > EVENT_MAX_CATCHUP_BLOCKS or
+       time.time() - last_full_requote >= EVENT_FULL_REQUOTE_INTERVAL):
+       logger.info(f"[{config['name']}] Full requote at block {head} (last processed block: {last_block})")
+       run_network_cycle(network_key, config, now, block_number=head)
+       config["last_full_requote"] = time.time()
+       event_state[chain_key] = head
+       return
+   if head <= last_block:
+       return
+  
+   pools = tracked_pools(config)
+   changed_pools = fetch_changed_pools(config, list(pools), last_block + 1, head)
+   changed_pairs = {pair for pool_address in changed_pools for pair in pools[pool_address]}
+   trade_pairs = [pair for pair in config["trade_pairs"] if pair in changed_pairs]
+   logger.info(f"[{config['name']}] Blocks {last_block + 1}-{head}: {len(changed_pools)} of {len(pools)} pools changed, requoting {len(trade_pairs)} pairs")
+   if trade_pairs:
+       run_network_cycle(network_key, config, now, trade_pairs, head)
+   event_state[chain_key] = head
+
+def  run_event_loop (network_keys=None):
+   """Incremental collection: poll every network (or those of network_keys) for pool events about once per block"""
+   event_state = load_event_state()
+   while True:
+       for network_key in network_keys or list(NETWORK_CONFIGS):
+           config = NETWORK_CONFIGS[network_key]
+           try:
+               initialize_network(network_key)
+               poll_network_events(network_key, config, event_state)
+           except Exception as e:
+               logger.error(f"[{config['name']}] Error polling pool events: {e}")
+       save_event_state(event_state)
       
-   except Exception as slippage_check_error:
-       logger.warning(f"[{config['name']}] Could not perform slippage check: {slippage_check_error}")
-       # If we can't check slippage, assume the quote is valid and no slippage data
-       return True, None
+       if not TOGGLE:
+           logger.info("TOGGLE is set to False, terminating script after one event poll...")
+           break
+       if collection_stop.wait(EVENT_POLL_INTERVAL):
+           logger.info("Stop requested, terminating after the last event poll...")
+           break
+
+############################
+# BLOCK SCHEDULER
+############################
+
+def  pair_refresh_interval (token_a, token_b):
+   """Seconds between quotes of a pair (0 = every block)"""
+   return PAIR_REFRESH_INTERVALS.get(f"{token_a}/{token_b}", DEFAULT_PAIR_REFRESH_INTERVAL)
+
+def  due_trade_pairs (config, last_quoted, now_ts):
+   """Pairs of a network whose refresh interval has elapsed since they were last quoted"""
+   return [(token_a, token_b) for token_a, token_b in config["trade_pairs"]
+           if now_ts - last_quoted.get((token_a, token_b), 0) >= pair_refresh_interval(token_a, token_b)]
+
+def  run_scheduled_cycle (network_key, config, trade_pairs, block_number, last_quoted):
+   """One block-aligned cycle (in its own thread); missed pairs become due again on the next head"""
+   start = time.time()
+   try:
+       missed = run_network_cycle(network_key, config, dt.datetime.now(dt.UTC), trade_pairs, block_number, start + PAIR_DEADLINE)
+   except Exception as e:
+       logger.error(f"[{config['name']}] Error in the cycle for block {block_number}: {e}")
+       missed = trade_pairs
+   for pair in missed:
+       last_quoted.pop(pair, None)
+
+def  run_block_scheduler (network_keys=None):
+   """
+   Block-aligned collection over every network (or those of network_keys): start a cycle on every new
+   block head for the pairs that are due. Cycles run in their own threads, so a slow cycle does not hold
+   back the next head; heads arriving while MAX_OVERLAPPING_CYCLES cycles of a network are still running
+   are skipped
+   """
+   network_keys = network_keys or list(NETWORK_CONFIGS)
+   last_heads = {}
+   last_quoted = {network_key: {} for network_key in network_keys}
+   cycles = {network_key: [] for network_key in network_keys}
+   while True:
+       for network_key in network_keys:
+           config = NETWORK_CONFIGS[network_key]
+           try:
+               initialize_network(network_key)
+               head = config["head_block"] = config["w3"].eth.block_number
+           except Exception as e:
+               logger.error(f"[{config['name']}] Error polling the block head: {e}")
+               continue
+           if head == last_heads.get(network_key):
+               continue
+           last_heads[network_key] = head
+          
+           cycles[network_key] = [cycle for cycle in cycles[network_key] if cycle.is_alive()]
+           if len(cycles[network_key]) >= MAX_OVERLAPPING_CYCLES:
+               record_count("cycles_skipped_total", (("network", network_key),))
+               logger.warning(f"[{config['name']}] Skipping block {head}: {len(cycles[network_key])} cycles still running")
+               continue
+           now_ts = time.time()
+           trade_pairs = due_trade_pairs(config, last_quoted[network_key], now_ts)
+           if not trade_pairs:
+               continue
+           for pair in trade_pairs:
+               last_quoted[network_key][pair] = now_ts
+           cycle = threading.Thread(target=run_scheduled_cycle, args=(network_key, config, trade_pairs, head, last_quoted[network_key]),
+                                    name=f"cycle-{network_key}-{head}", daemon=True)
+           cycle.start()
+           cycles[network_key].append(cycle)
+      
+       if not TOGGLE or collection_stop.wait(BLOCK_POLL_INTERVAL):
+           for cycle in [cycle for network_cycles in cycles.values() for cycle in network_cycles]:
+               cycle.join()
+           logger.info("TOGGLE is set to False, terminating script after one block cycle..." if not TOGGLE else
+                       "Stop requested, terminating after the running block cycles...")
+           break
+
+############################
+# MAIN EXECUTION FUNCTIONS
+############################
 
-def  get_uniswap_quote (token_in_symbol, token_out_symbol, notional_amount, gas_price=None, network="ethereum"): # 
+def  run_network_cycle (network_key, config, now, trade_pairs=None, block_number=None, deadline=None):
    """
-   Get quote from Uniswap for a given token pair and amount, selecting the best pool
+   Run one quote collection cycle for a network with the configured quote engine.
+   trade_pairs limits the cycle to some of the network's pairs; block_number pins it to a given block.
+   Pairs not quoted by the deadline (a time.time() value) are cancelled; returns those missed pairs
    """
-   config = NETWORK_CONFIGS[network]
-   w3_instance = config["w3"]
-   quoter_contract = config.get("quoter")
-   quoter_available = config.get("quoter_available", False)
-   quoter_v2_contract = config.get("quoter_v2")
-   quoter_v2_available = config.get("quoter_v2_available", False)
-   tokens = config["tokens"]
+   initialize_network(network_key)
+   trade_pairs = trade_pairs or config["trade_pairs"]
+   logger.info(f"[{now}] Processing {config['name']}...") # 
+   metrics_cycle_totals = start_metrics_cycle()
   
-   # Check if we have at least one quoter available
-   if not quoter_available and not quoter_v2_available:
-       error_msg = f"[{config['name']}] No quoter contracts available" # 
-       logger.error(error_msg)
-       raise Exception(error_msg)
+   # Reopen pooled connections up front after a long sleep instead of in the middle of the first burst
+   if QUOTE_ENGINE == "threaded" and ENABLE_PARALLEL_PROCESSING:
+       config["w3"].provider.warm_up()
   
-   token_in = tokens[token_in_symbol]
-   token_out = tokens[token_out_symbol]
-   decimals_in = TOKEN_DECIMALS[token_in_symbol]
-   decimals_out = TOKEN_DECIMALS[token_out_symbol]
-   amount_in = int(notional_amount * 10**decimals_in)
+   # Pin every read of the cycle to one block so all quotes see the same state
+   try:
+       if block_number is None:
+           block_number = config["head_block"] = config["w3"].eth.block_number
+       logger.info(f"[{config['name']}] Quoting {len(trade_pairs)} pairs at block {block_number}")
+   except Exception as e:
+       logger.error(f"[{config['name']}] Error fetching block number: {e}")
+       block_number = "latest" # Unpinned reads are not memoized
   
-   # Find the best pool with sufficient liquidity
-   fee_tier, pool_address = find_best_pool_with_liquidity(token_in, token_out, amount_in, token_in_symbol, network)
+   # Cache the gas price once per network per block (one tuple, so overlapping cycles never see a torn pair)
+   try:
+       gas_price_block, cached_gas_price = config.get("gas_price_at", (None, None))
+       if gas_price_block != block_number or block_number == "latest":
+           cached_gas_price = config["w3"].eth.gas_price
+           config["gas_price_at"] = (block_number, cached_gas_price)
+       logger.info(f"[{config['name']}] Cached gas price for this cycle: {cached_gas_price / 10**9} Gwei") # 
+   except Exception as e:
+       logger.error(f"[{config['name']}] Error fetching gas price: {e}")
+       cached_gas_price = None # Allow trades to proceed with on-demand gas price fetching
   
-   # Check if any pools were found
-   if fee_tier is None:
-       error_msg = f"[{config['name']}] No pools available for {token_in_symbol}-{token_out_symbol} - skipping pair" # 
-       logger.warning(error_msg)
-       raise Exception(error_msg)
+   # Snapshots of blocks no cycle is quoting are never read again
+   with active_cycle_lock:
+       active_cycle_blocks[(network_key, block_number)] += 1
+       active_blocks = {block for key, block in active_cycle_blocks if key == network_key}
+       # Pruned in place: the other cycles' threads keep adding to this dict
+       for key in list(config["pool_snapshots"]):
+           if key[0] not in active_blocks:
+               config["pool_snapshots"].pop(key, None)
+   try:
+       missed = quote_network_pairs(network_key, config, now, trade_pairs, block_number, cached_gas_price, deadline)
+   finally:
+       with active_cycle_lock:
+           active_cycle_blocks[(network_key, block_number)] -= 1
+           if active_cycle_blocks[(network_key, block_number)] <= 0:
+               del active_cycle_blocks[(network_key, block_number)]
   
-   # Try the selected fee tier first, then fallback to others if needed
-   fee_tiers_to_try = [fee_tier] + [f for f in POOL_FEE_TIERS if f != fee_tier]
+   if missed:
+       record_count("pairs_missed_total", (("network", network_key),), len(missed))
+       logger.warning(f"[{config['name']}] Missed the {PAIR_DEADLINE}s deadline at block {block_number} for {len(missed)} pairs: {', '.join(f'{token_a}/{token_b}' for token_a, token_b in missed)}")
   
-   last_error = None
-   for current_fee_tier in fee_tiers_to_try:
+   # Cycle boundary: make this cycle's rows durable
+   sync_output_writer()
+  
+   # Persist pools learned lazily during the cycle
+   try:
+       save_pool_registry()
+   except Exception as e:
+       logger.warning(f"[{config['name']}] Could not save pool registry: {e}")
+  
+   finish_metrics_cycle(network_key, metrics_cycle_totals)
+   return missed
+
+def  pair_executor (network_key):
+   """
+   (max_workers, executor) of the network's pair worker pool, kept across cycles so a cycle cut off by its
+   deadline does not leave a pool's threads behind. Rebuilt when the settings change its size (the old pool
+   finishes its pairs)
+   """
+   # With the adaptive limiter gating RPC concurrency, threads no longer need to be a tuned guess
+   max_workers = RPC_MAX_CONCURRENCY if ENABLE_RPC_LIMITER else MAX_WORKERS_ETHEREUM
+   with pair_executors_lock:
+       size, executor = pair_executors.get(network_key, (None, None))
+       if size != max_workers:
+           if executor is not None:
+               executor.shutdown(wait=False)
+           executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"pairs-{network_key}")
+           pair_executors[network_key] = (max_workers, executor)
+       return max_workers, executor
+
+def  quote_network_pairs (network_key, config, now, trade_pairs, block_number, cached_gas_price, deadline=None):
+   """Prefetch and quote a cycle's pairs with the configured quote engine; returns the pairs cut off by the deadline"""
+  
+   # Batch this cycle's contract reads so the pair workers (or coroutines) are served from the memo cache
+   try:
+       prefetch_network_reads(network_key, config, block_number, trade_pairs)
+   except Exception as e:
+       logger.error(f"[{config['name']}] Error prefetching contract reads: {e}") # Fall back to individual eth_calls
+  
+   # Keep the pools' state at this block for offline requoting
+   if ENABLE_SNAPSHOT_STORE and isinstance(block_number, int):
        try:
-           amount_out = None
-           gas_estimate = 150000  # Default fallback 
-          
-           # Use QuoterV2 if QuoterV1 is not available (e.g. on Base))
-           if quoter_v2_available and (not quoter_available or network == "base"): # network == "base" part is now moot
-               # Create the path for QuoterV2
-               fee_hex = current_fee_tier.to_bytes(3, byteorder='big').hex()
-               path = token_in.replace('0x', '') + fee_hex + token_out.replace('0x', '') # 
-               path = '0x' + path.lower()
-               path_bytes = Web3.to_bytes(hexstr=path)
-              
-               # QuoterV2 returns (amountOut, sqrtPriceX96AfterList, initializedTicksCrossedList, gasEstimate)
-               amount_out, _, _, gas_estimate = quoter_v2_contract.functions.quoteExactInput( # 
-                   path_bytes, amount_in
-               ).call()
-               logger.info(f"[{config['name']}] Uniswap: Using QuoterV2 for fee tier {current_fee_tier/10000}% for {token_in_symbol}-{token_out_symbol}")
-          
-           # Use QuoterV1 if available
-           elif quoter_available:
-               amount_out = quoter_contract.functions.quoteExactInputSingle( # 
-                   token_in, token_out, current_fee_tier, amount_in, 0
-               ).call()
-               logger.info(f"[{config['name']}] Uniswap: Using QuoterV1 for fee tier {current_fee_tier/10000}% for {token_in_symbol}-{token_out_symbol}")
-              
-               # Try to get gas estimate from QuoterV2 if available and QuoterV1 was used for amount_out 
-               if quoter_v2_available and quoter_v2_contract:
-                   try:
-                       fee_hex = current_fee_tier.to_bytes(3, byteorder='big').hex()
-                       path = token_in.replace('0x', '') + fee_hex + token_out.replace('0x', '') # 
-                       path = '0x' + path.lower()
-                       path_bytes = Web3.to_bytes(hexstr=path)
-                       _, _, _, gas_estimate_v2 = quoter_v2_contract.functions.quoteExactInput( # 
-                           path_bytes, amount_in
-                       ).call()
-                       gas_estimate = gas_estimate_v2 # Update gas estimate if successful
-                       logger.info(f"[{config['name']}] Uniswap: Gas estimate from QuoterV2: {gas_estimate}")
-                   except Exception:
-                       pass # Silently fall back to default estimate if QuoterV2 gas fails 
-          
-           if amount_out is None:
-               logger.error(f"[{config['name']}] Uniswap: Could not get amountOut using available quoters for {token_in_symbol}-{token_out_symbol} at fee {current_fee_tier/10000}%")
-               raise Exception("No quoter available or quoter failed to return amount out")
-          
-           # Validate quote with slippage check for all trades 
-           is_valid_quote, slippage_percentage = validate_quote_with_slippage_check(
-               token_in, token_out, current_fee_tier, amount_in, amount_out,
-               token_in_symbol, quoter_contract, quoter_available,
-               quoter_v2_contract, quoter_v2_available, config
-           )
-           
-           if not is_valid_quote: # 
-               logger.warning(f"[{config['name']}] Quote failed slippage validation for {token_in_symbol}-{token_out_symbol} at fee tier {current_fee_tier/10000}%, trying next tier")
-               last_error = Exception(f"Slippage validation failed: {slippage_percentage:.2f}%") # Store this as a potential error
-               continue
-          
-           receiving = amount_out / (10 ** decimals_out)
-           price = notional_amount / receiving if receiving > 0 else 0 # 
-           pool_fee_pct = current_fee_tier / 1000000 # Uniswap pool fee is fee_tier / 1,000,000 (e.g. 3000 / 1M = 0.3%)
-           pool_fee_amount = notional_amount * pool_fee_pct
-           interface_fee_amount = notional_amount * INTERFACE_FEE_PCT
-          
-           if gas_price is None: # 
-               gas_price = w3_instance.eth.gas_price
-              
-           gas_cost_eth = (gas_estimate * gas_price) / 10**18
-           eth_price_usd = get_current_eth_price() # 
-           gas_cost_usd = gas_cost_eth * eth_price_usd
-
-           chain_id = 1 # Ethereum Mainnet chain ID
-
-           return {
-               "timestamp": dt.datetime.now(dt.UTC).isoformat(),
-               "quoter": "uniswap_quoter", # 
-               "aggregator": "uniswap",
-               "network": network,
-               "token_in_chain_id": chain_id,
-               "token_out_chain_id": chain_id,
-               "direction": f"{token_in_symbol}->{token_out_symbol}",
-               "notional": notional_amount, # 
-               "selling": notional_amount,
-               "token_in_symbol": token_in_symbol,
-               "token_in_address": token_in,
-               "receiving": receiving,
-               "token_out_symbol": token_out_symbol,
-               "token_out_address": token_out, # 
-               "amount_in": str(amount_in),
-               "amount_out": str(amount_out),
-               "amount_out_decimals": str(receiving),
-               "price": price,
-               "fee": "0", # MetaMask specific, set to 0 for Uniswap
-               "interface_fee": interface_fee_amount, # 
-               "gas_compute": str(gas_estimate),
-               "gas_cost_eth": str(gas_cost_eth),
-               "gas_cost_usd": str(gas_cost_usd),
-               "effective_price": str((notional_amount + interface_fee_amount + gas_cost_usd)/receiving if receiving > 0 else 0),
-               "pool_address": pool_address if pool_address else "unknown",
-               "fee_tier": current_fee_tier, # 
-               "pool_fee": pool_fee_amount,
-               "fetch_time": "N/A", # MetaMask specific
-               "slippage_percentage": str(slippage_percentage) if slippage_percentage is not None else "Missing"
-           }
-       except Exception as e: # 
-           last_error = e
-           # Log error for this specific fee tier attempt, but continue to next tier
-           logger.warning(f"[{config['name']}] Uniswap: Error getting quote for {token_in_symbol}-{token_out_symbol} at fee {current_fee_tier/10000}%: {e}")
-           continue # Try next fee tier
+           store_pool_snapshots(network_key, config, block_number, trade_pairs, cached_gas_price)
+       except Exception as e:
+           logger.error(f"[{config['name']}] Error storing pool snapshots: {e}")
   
-   # If we've tried all fee tiers and none worked
-   error_msg = f"[{config['name']}] Failed to get Uniswap quote for {token_in_symbol}-{token_out_symbol} after trying all fee tiers: {last_error}"
-   logger.error(error_msg)
-   raise Exception(error_msg) # This will be caught by the calling function
+   # ETH price is read on-chain by get_eth_price_usd() at the cycle's block and cached per block
+   # No need to pass cached_eth_price around for Uniswap only.
+  
+   # cached_eth_price removed from pair_data
+   pair_tasks = [(token_a, token_b, config, network_key, cached_gas_price, now, block_number) for token_a, token_b in trade_pairs]
+  
+   # Process trading pairs for this network
+   missed = []
+   if QUOTE_ENGINE == "async":
+       logger.info(f"[{config['name']}] Processing {len(pair_tasks)} trading pairs asynchronously with up to {ASYNC_MAX_CONCURRENCY} calls in flight...")
+       missed = run_async(async_process_network(pair_tasks, deadline))
+   elif QUOTE_ENGINE == "threaded" and ENABLE_PARALLEL_PROCESSING:
+       max_workers, executor = pair_executor(network_key)
+       logger.info(f"[{config['name']}] Processing {len(pair_tasks)} trading pairs with up to {max_workers} parallel workers...")
+      
+       # Past the deadline the cycle returns without waiting for pairs still running, which stop at their own
+       # deadline check instead of writing stale rows; the network's pool bounds how many can still be running
+       # Each worker runs in a copy of the cycle's context so its requests count toward this cycle's totals
+       futures = {executor.submit(contextvars.copy_context().run, process_trading_pair, pair_data, deadline): pair_data
+                  for pair_data in pair_tasks} # 
+       done, not_done = concurrent.futures.wait(futures, timeout=None if deadline is None else max(0, deadline - time.time()))
+       for future in done: # 
+           try:
+               if future.result() is False:
+                   not_done.add(future)
+           except Exception as e: # 
+               # Errors from process_trading_pair should be logged there
+               # This catches errors if process_trading_pair itself fails or re-raises something unexpected.
+               logger.error(f"[{config['name']}] Error processing a trading pair task: {e}")
+       for future in not_done:
+           future.cancel()
+       missed = [futures[future] for future in not_done]
+   else:
+       logger.info(f"[{config['name']}] Processing trading pairs sequentially...") # 
+       for index, pair_data in enumerate(pair_tasks):
+           if deadline is not None and time.time() > deadline:
+               missed.extend(pair_tasks[index:])
+               break
+           if process_trading_pair(pair_data, deadline) is False:
+               missed.append(pair_data)
+   return [(pair_data[0], pair_data[1]) for pair_data in missed]
 
 ############################
-# DATA PROCESSING FUNCTIONS
+# HISTORICAL BACKFILL
 ############################
 
-def  fetch_uniswap_quote_data (token_a, token_b, notional, cached_gas_price, network_key, config): # 
+def  backfill_checkpoint_file (network_key, start_block, end_block, step):
+   """Checkpoint path of one backfill range, so a rerun of the same range resumes it"""
+   return os.path.join(SAVE_DIR, f"backfill_{network_key}_{start_block}_{end_block}_{step}.json")
+
+def  load_backfill_checkpoint (checkpoint_file):
+   """Blocks of the range already quoted and written"""
+   if not os.path.isfile(checkpoint_file):
+       return set()
+   try:
+       with open(checkpoint_file) as f:
+           return set(json.load(f)["done"])
+   except Exception as e:
+       logger.warning(f"Could not load backfill checkpoint from {checkpoint_file}: {e}")
+       return set()
+
+def  save_backfill_checkpoint (checkpoint_file, done):
+   """Persist the quoted blocks of the range (atomic replace)"""
+   tmp_file = checkpoint_file + ".tmp"
+   os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+   with open(tmp_file, "w") as f:
+       json.dump({"done": sorted(done)}, f)
+   os.replace(tmp_file, checkpoint_file)
+
+def  historical_gas_price (config, block_number):
    """
-   Fetch Uniswap quote for a single trading pair and notional amount.
+   Gas price paid at a past block: its base fee plus the median priority fee of its transactions.
+   eth_gasPrice only knows the current price, so it is used as is for blocks before EIP-1559
    """
-   direction = f"{token_a}->{token_b}"
-   uniswap_quote = None
+   w3_instance = config["w3"]
    try:
-       uniswap_quote = get_uniswap_quote(token_a, token_b, notional, cached_gas_price, network_key) # 
-       if uniswap_quote: # Check if quote was successfully retrieved
-            logger.info(f"[{config['name']}] Uniswap: Quote received for {direction} with ${notional} USD")
+       history = w3_instance.eth.fee_history(1, block_number, [BACKFILL_PRIORITY_FEE_PERCENTILE])
+       return history["baseFeePerGas"][0] + history["reward"][0][0]
    except Exception as e:
-       # Error logging is handled within get_uniswap_quote if all tiers fail.
-       # This catch is for unexpected errors or if get_uniswap_quote re-raises.
-       # More specific logging from get_uniswap_quote should provide details.
-       logger.error(f"[{config['name']}] Uniswap: Error getting quote for {direction} with ${notional} USD in fetch_uniswap_quote_data: {e}") # , (adapted for uniswap only)
-       # No need to check for "No pools available" here as get_uniswap_quote handles that logging.
-   return uniswap_quote
+       logger.warning(f"[{config['name']}] No fee history at block {block_number} ({e}), using the current gas price")
+       return w3_instance.eth.gas_price
 
+def  init_backfill_worker (network_key, rpc_urls, settings, worker_log_queue):
+   """Process pool initializer: apply the parent's settings, log through the parent and connect the worker's own web3"""
+   apply_settings(settings)
+   configure_worker_logging(worker_log_queue)
+   signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl-C and cancels the remaining blocks
+   initialize_network(network_key, rpc_urls)
 
-def  process_trading_pair (pair_data):
+def  backfill_block_rows (network_key, block_number):
    """
-   Process a single trading pair with all its notional amounts
-   """ # 
-   token_a, token_b, config, network_key, cached_gas_price, cycle_timestamp = pair_data
-     # cached_eth_price removed as it was for MetaMask
+   Quote every pair and notional at one past block (in a backfill worker) and return the rows,
+   timestamped with the block's time. The parent writes them, so the worker never touches the output
+   """
+   config = initialize_network(network_key)
+   block = config["w3"].eth.get_block(block_number)
+   timestamp = dt.datetime.fromtimestamp(block["timestamp"], dt.UTC)
+   gas_price = historical_gas_price(config, block_number)
+   config["pool_snapshots"] = {key: snapshot for key, snapshot in config["pool_snapshots"].items() if key[0] == block_number}
+   try:
+       prefetch_network_reads(network_key, config, block_number)
+   except Exception as e:
+       logger.error(f"[{config['name']}] Error prefetching contract reads at block {block_number}: {e}")
   
-   # Skip pairs where tokens don't exist on this network (should not happen with current setup)
-   if token_a not in config["tokens"] or token_b not in config["tokens"]: # 
-       logger.warning(f"[{config['name']}] Skipping {token_a}/{token_b} - tokens not available on this network")
-       return
+   rows = []
+   for token_a, token_b in config["trade_pairs"]:
+       if token_a not in config["tokens"] or token_b not in config["tokens"]:
+           continue
+       for notional in USD_NOTIONALS:
+           try:
+               row = get_uniswap_quote(token_a, token_b, notional, gas_price, network_key, block_number)
+           except RpcThrottledError:
+               raise  # Fail the block rather than write it incomplete; it is retried on the next run
+           except Exception as e:
+               logger.warning(f"[{config['name']}] No Uniswap quote for {token_a}->{token_b} with ${notional} USD at block {block_number}: {e}")
+               continue
+           row.timestamp = timestamp
+           rows.append(row)
+   return rows
+
+def  run_backfill (network_key, start_block, end_block, step=1, workers=None, rpc_urls=None, settings=None):
+   """
+   Quote the network's pairs at every step-th block from start_block to end_block (inclusive) on a
+   pool of worker processes, writing the rows to the quotes table. settings are applied in each
+   worker, like QuoteCollector settings. Progress is checkpointed every BACKFILL_CHECKPOINT_INTERVAL
+   blocks, so rerunning the same range quotes only the missing blocks (rows of blocks written after
+   the last checkpoint may be written again). Returns the blocks that failed
+   """
+   config = NETWORK_CONFIGS[network_key]
+   workers = workers or BACKFILL_WORKERS
+   checkpoint_file = backfill_checkpoint_file(network_key, start_block, end_block, step)
+   done = load_backfill_checkpoint(checkpoint_file)
+   blocks = [block_number for block_number in range(start_block, end_block + 1, step) if block_number not in done]
+   logger.info(f"[{config['name']}] Backfilling {len(blocks)} blocks from {start_block} to {end_block} every {step} blocks "
+               f"with {workers} worker processes ({len(done)} already done)")
+   backfill_start = time.time()
+   failed = []
   
-   # PEPE specific logic removed as PEPE is not in the new trade pairs 
-   notionals = USD_NOTIONALS # 
+   # Spawned rather than forked: the parent's connection pools and threads must not be copied
+   mp_context = multiprocessing.get_context("spawn")
+   # Workers log through this process, so only one process writes (and rotates) the log file
+   worker_log_queue = mp_context.Queue()
+   log_forwarder = QueueListener(worker_log_queue, ForwardedLogHandler())
+   log_forwarder.start()
+   executor = concurrent.futures.ProcessPoolExecutor(
+       max_workers=workers, mp_context=mp_context,
+       initializer=init_backfill_worker, initargs=(network_key, rpc_urls, settings or {}, worker_log_queue)
+   )
+   try:
+       futures = {executor.submit(backfill_block_rows, network_key, block_number): block_number for block_number in blocks}
+       for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+           block_number = futures[future]
+           try:
+               rows = future.result()
+           except concurrent.futures.process.BrokenProcessPool:
+               raise  # A worker could not start (or died); every remaining block would fail the same way
+           except Exception as e:
+               logger.error(f"[{config['name']}] Backfill of block {block_number} failed: {e}")
+               failed.append(block_number)
+           else:
+               write_quote_rows(rows)
+               done.add(block_number)
+          
+           if count % BACKFILL_CHECKPOINT_INTERVAL == 0:
+               sync_output_writer()
+               save_backfill_checkpoint(checkpoint_file, done)
+               logger.info(f"[{config['name']}] Backfill: {count}/{len(blocks)} blocks in {time.time() - backfill_start:.1f}s")
+   finally:
+       executor.shutdown(cancel_futures=True)
+       log_forwarder.stop()  # After the workers exit, so their last records are written
+       worker_log_queue.close()
+       sync_output_writer()
+       save_backfill_checkpoint(checkpoint_file, done)
   
-   for notional in notionals:
-       direction = f"{token_a}->{token_b}"
-       logger.info(f"[{cycle_timestamp}] [{config['name']}] Getting Uniswap quote for {direction} with ${notional} USD...")
+   logger.info(f"[{config['name']}] Backfill of {len(blocks)} blocks completed in {time.time() - backfill_start:.1f}s, {len(failed)} failed")
+   return failed
+
+############################
+# SNAPSHOT STORE
+############################
+
+# Store layout, per network under SNAPSHOT_STORE_DIR: one <pool>.bin of records per pool, blocks.bin with one
+# record per stored block, and index.json (tokens, pools and pairs, so a replay needs no node).
+# Pool record: header, state, then the bitmap words and tick liquidity set since the previous record, and the
+# word positions and ticks removed (a keyframe holds the full state, as changes from an empty one)
+SNAPSHOT_RECORD_HEADER = struct.Struct("<IQB")  # Payload bytes, block, keyframe flag
+SNAPSHOT_STATE = struct.Struct("<20si16sIHhhHIHI")  # sqrtPriceX96, tick, liquidity, fee, tick spacing, word range, set/removed counts
+SNAPSHOT_WORD = struct.Struct("<h32s")  # Word position, bitmap word
+SNAPSHOT_TICK = struct.Struct("<i16s")  # Tick, liquidityNet
+SNAPSHOT_BLOCK = struct.Struct("<QdQd")  # Block, collection time (unix), gas price (wei), ETH price (USD)
+
+class  OfflineProvider(JSONBaseProvider):
+   """Provider of a replayed network: every request fails, so reads the store cannot serve never reach a node"""
+   def  make_request (self, method, params):
+       raise Exception(f"{method} is not available offline (not in the snapshot store)")
+
+def  snapshot_store_path (network_key, name):
+   """Path of a file of a network's snapshot store"""
+   return os.path.join(SNAPSHOT_STORE_DIR, network_key, name)
+
+def  load_snapshot_index (network_key):
+   """A network's store index: {"tokens": {symbol: [address, decimals]}, "pools": {pool: [token_a, token_b, fee]}, "trade_pairs"}"""
+   index_file = snapshot_store_path(network_key, "index.json")
+   if not os.path.isfile(index_file):
+       return {"tokens": {}, "pools": {}, "trade_pairs": []}
+   with open(index_file) as f:
+       return json.load(f)
+
+def  save_snapshot_index (network_key, index):
+   """Persist a network's store index (atomic replace)"""
+   tmp_file = snapshot_store_path(network_key, "index.json.tmp")
+   os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+   with open(tmp_file, "w") as f:
+       json.dump(index, f)
+   os.replace(tmp_file, snapshot_store_path(network_key, "index.json"))
+
+def  encode_snapshot_record (block_number, snapshot, previous=None):
+   """One pool record: the snapshot as changes from the previous record's state, or a keyframe without one"""
+   base = previous or {"tick_bitmap": {}, "liquidity_net": {}}
+   set_words = [(word_pos, word) for word_pos, word in snapshot["tick_bitmap"].items() if base["tick_bitmap"].get(word_pos) != word]
+   set_ticks = [(tick, net) for tick, net in snapshot["liquidity_net"].items() if base["liquidity_net"].get(tick) != net]
+   removed_words = [word_pos for word_pos in base["tick_bitmap"] if word_pos not in snapshot["tick_bitmap"]]
+   removed_ticks = [tick for tick in base["liquidity_net"] if tick not in snapshot["liquidity_net"]]
+   payload = [SNAPSHOT_STATE.pack(snapshot["sqrt_price_x96"].to_bytes(20, "little"), snapshot["tick"], snapshot["liquidity"].to_bytes(16, "little"),
+                                  snapshot["fee"], snapshot["tick_spacing"], snapshot["min_word"], snapshot["max_word"],
+                                  len(set_words), len(set_ticks), len(removed_words), len(removed_ticks))]
+   payload.extend(SNAPSHOT_WORD.pack(word_pos, word.to_bytes(32, "little")) for word_pos, word in set_words)
+   payload.extend(SNAPSHOT_TICK.pack(tick, net.to_bytes(16, "little", signed=True)) for tick, net in set_ticks)
+   payload.append(struct.pack(f"<{len(removed_words)}h{len(removed_ticks)}i", *removed_words, *removed_ticks))
+   payload = b"".join(payload)
+   return SNAPSHOT_RECORD_HEADER.pack(len(payload), block_number, previous is None) + payload
+
+def  apply_snapshot_record (buffer, offset, pool_address, state=None):
+   """Decode the record at offset on top of the previous record's state; returns the new state (a snapshot)"""
+   _, block_number, keyframe = SNAPSHOT_RECORD_HEADER.unpack_from(buffer, offset)
+   offset += SNAPSHOT_RECORD_HEADER.size
+   (sqrt_price_x96, tick, liquidity, fee, tick_spacing, min_word, max_word,
+    set_word_count, set_tick_count, removed_word_count, removed_tick_count) = SNAPSHOT_STATE.unpack_from(buffer, offset)
+   offset += SNAPSHOT_STATE.size
+   base = {"tick_bitmap": {}, "liquidity_net": {}} if keyframe or state is None else state
+   snapshot = {"pool": pool_address, "block": block_number, "fee": fee, "tick_spacing": tick_spacing,
+               "sqrt_price_x96": int.from_bytes(sqrt_price_x96, "little"), "tick": tick, "liquidity": int.from_bytes(liquidity, "little"),
+               "min_word": min_word, "max_word": max_word,
+               "tick_bitmap": dict(base["tick_bitmap"]), "liquidity_net": dict(base["liquidity_net"])}
+   for word_pos, word in SNAPSHOT_WORD.iter_unpack(buffer[offset:offset + set_word_count * SNAPSHOT_WORD.size]):
+       snapshot["tick_bitmap"][word_pos] = int.from_bytes(word, "little")
+   offset += set_word_count * SNAPSHOT_WORD.size
+   for tick_index, net in SNAPSHOT_TICK.iter_unpack(buffer[offset:offset + set_tick_count * SNAPSHOT_TICK.size]):
+       snapshot["liquidity_net"][tick_index] = int.from_bytes(net, "little", signed=True)
+   offset += set_tick_count * SNAPSHOT_TICK.size
+   removed = struct.unpack_from(f"<{removed_word_count}h{removed_tick_count}i", buffer, offset)
+   for word_pos in removed[:removed_word_count]:
+       del snapshot["tick_bitmap"][word_pos]
+   for tick_index in removed[removed_word_count:]:
+       del snapshot["liquidity_net"][tick_index]
+   return snapshot
+
+def  open_snapshot_file (path):
+   """
+   Memory-map a pool's record file and index its records by block, or None if it does not exist.
+   A file that grew since is remapped and only its new records are indexed; a record still being
+   appended is left out
+   """
+   with snapshot_store_lock:
+       size = os.path.getsize(path) if os.path.isfile(path) else 0
+       reader = snapshot_store["readers"].get(path)
+       if reader is not None and reader["size"] == size:
+           return reader
+       if size == 0:
+           return None
+       if reader is None:
+           reader = {"blocks": [], "offsets": [], "keyframes": [], "end": 0, "cursor": None}
+       else:
+           reader["mmap"].close()
+       with open(path, "rb") as f:
+           reader["mmap"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+       reader["size"] = size
+       offset = reader["end"]
+       while offset + SNAPSHOT_RECORD_HEADER.size <= size:
+           length, block_number, keyframe = SNAPSHOT_RECORD_HEADER.unpack_from(reader["mmap"], offset)
+           if offset + SNAPSHOT_RECORD_HEADER.size + length > size:
+               break
+           if keyframe:
+               reader["keyframes"].append(len(reader["offsets"]))
+           reader["blocks"].append(block_number)
+           reader["offsets"].append(offset)
+           offset += SNAPSHOT_RECORD_HEADER.size + length
+       reader["end"] = offset
+       snapshot_store["readers"][path] = reader
+       return reader
+
+def  read_pool_snapshot (network_key, pool_address, block_number):
+   """
+   A pool's stored snapshot at exactly block_number, or None. Decodes from the closest keyframe, or
+   from the last block read when that is closer, so reading blocks in order applies one delta each
+   """
+   reader = open_snapshot_file(snapshot_store_path(network_key, f"{pool_address}.bin"))
+   if reader is None:
+       return None
+   position = bisect.bisect_left(reader["blocks"], block_number)
+   if position == len(reader["blocks"]) or reader["blocks"][position] != block_number:
+       return None
+   keyframe = reader["keyframes"][bisect.bisect_right(reader["keyframes"], position) - 1]
+   cursor = reader["cursor"]
+   start, state = (cursor[0] + 1, cursor[1]) if cursor is not None and keyframe <= cursor[0] <= position else (keyframe, None)
+   for record in range(start, position + 1):
+       state = apply_snapshot_record(reader["mmap"], reader["offsets"][record], pool_address, state)
+   reader["cursor"] = (position, state)
+   return state
+
+def  stored_blocks (network_key, start_block, end_block):
+   """The stored blocks from start_block to end_block: [(block, collection time, gas price, ETH price)]"""
+   path = snapshot_store_path(network_key, "blocks.bin")
+   if not os.path.isfile(path) or os.path.getsize(path) < SNAPSHOT_BLOCK.size:
+       return []
+   with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+       records = SNAPSHOT_BLOCK.iter_unpack(buffer[:len(buffer) - len(buffer) % SNAPSHOT_BLOCK.size])
+       return [record for record in records if start_block <= record[0] <= end_block]
+
+def  store_pool_snapshots (network_key, config, block_number, trade_pairs, gas_price):
+   """
+   Append the state of every pool of the cycle's pairs at the cycle's block to the snapshot store,
+   with the block's gas and ETH prices. Snapshots already loaded for local quoting are reused, the
+   others are read in one batched load. Blocks older than a pool's last stored one are skipped
+   (overlapping cycles may finish out of order)
+   """
+   if gas_price is None:
+       logger.warning(f"[{config['name']}] No gas price for block {block_number}, not storing its snapshots")
+       return
+   tokens = config["tokens"]
+   pools = {}
+   for token_a, token_b in trade_pairs:
+       if token_a not in tokens or token_b not in tokens:
+           continue
+       for fee in POOL_FEE_TIERS:
+           pool_address = get_pool_address(config, tokens[token_a], tokens[token_b], fee)
+           if pool_address is not None:
+               pools[pool_address] = (token_a, token_b, fee)
+   missing = {pool_address: fee for pool_address, (_, _, fee) in pools.items() if (block_number, pool_address) not in config["pool_snapshots"]}
+   if missing:
+       snapshots = fetch_pool_snapshots(config, missing, block_identifier=block_number)
+       config["pool_snapshots"].update({(block_number, pool_address): snapshot for pool_address, snapshot in snapshots.items()})
+   eth_price = get_eth_price_usd(config, block_number)
+  
+   with snapshot_store_lock:
+       last_block = snapshot_store["last_block"].get(network_key)
+       if last_block is None:
+           stored = stored_blocks(network_key, 0, 2**64 - 1)
+           last_block = stored[-1][0] if stored else -1
+       if block_number <= last_block:
+           return
       
-       # Get Uniswap quote
-       uniswap_quote = fetch_uniswap_quote_data(token_a, token_b, notional, cached_gas_price, network_key, config)
+       index = load_snapshot_index(network_key)
+       index["tokens"].update({symbol: [address, TOKEN_DECIMALS[symbol]] for symbol, address in tokens.items()})
+       index["pools"].update({pool_address: list(pool) for pool_address, pool in pools.items()})
+       index["trade_pairs"] = list(dict.fromkeys([tuple(pair) for pair in index["trade_pairs"]] + list(trade_pairs)))
+       save_snapshot_index(network_key, index)
       
-       # Write Uniswap quote to CSV
-       if uniswap_quote:
-           write_quote_row(uniswap_quote) # 
-           logger.info(f"[{config['name']}] Uniswap: Quote written for {direction} with ${notional} USD")
-       else: # (adapted)
-           logger.warning(f"[{config['name']}] No Uniswap quote available for {direction} with ${notional} USD")
+       stored_pools = stored_bytes = 0
+       for pool_address in pools:
+           snapshot = config["pool_snapshots"].get((block_number, pool_address))
+           if snapshot is None:
+               continue
+           writer = snapshot_store["writers"].get((network_key, pool_address), {"snapshot": None, "records": 0})
+           previous = writer["snapshot"] if writer["records"] % SNAPSHOT_KEYFRAME_INTERVAL else None
+           record = encode_snapshot_record(block_number, snapshot, previous)
+           with open(snapshot_store_path(network_key, f"{pool_address}.bin"), "ab") as f:
+               f.write(record)
+           snapshot_store["writers"][(network_key, pool_address)] = {"snapshot": snapshot, "records": writer["records"] + 1}
+           stored_pools += 1
+           stored_bytes += len(record)
       
-       # Base chain delay removed as Base network is removed 
+       # The block record goes last: a replayed block has every pool record written before it
+       with open(snapshot_store_path(network_key, "blocks.bin"), "ab") as f:
+           f.write(SNAPSHOT_BLOCK.pack(block_number, time.time(), gas_price, eth_price))
+       snapshot_store["last_block"][network_key] = block_number
+   record_count("snapshot_store_bytes_total", (("network", network_key),), stored_bytes)
+   logger.info(f"[{config['name']}] Stored snapshots of {stored_pools} of {len(pools)} pools at block {block_number} ({stored_bytes} bytes)")
+
+def  initialize_replay_network (network_key, index):
+   """
+   Set up a network for replay without a node: contracts over an offline provider, tokens and pairs
+   from the store index. Raises if the network is already connected in this process
+   """
+   config = NETWORK_CONFIGS[network_key]
+   with network_init_lock:
+       if config.get("initialized") and not config.get("offline"):
+           raise Exception(f"{config['name']} is connected to a node in this process; replay in a process of its own")
+       if not config.get("initialized"):
+           config["rpc_endpoints"] = []
+           config["w3"] = Web3(OfflineProvider())
+           initialize_network_contracts(config)
+           config["offline"] = True
+           config["initialized"] = True
+   config["tokens"] = {symbol: address for symbol, (address, _) in index["tokens"].items()}
+   TOKEN_DECIMALS.update({symbol: decimals for symbol, (_, decimals) in index["tokens"].items()})
+   config["trade_pairs"] = [tuple(pair) for pair in index["trade_pairs"]]
+   return config
+
+def  replay_quotes (network_key, start_block, end_block, trade_pairs=None, notionals=None, settings=None):
+   """
+   Requote the stored blocks from start_block to end_block (inclusive) offline: get_uniswap_quote
+   runs on the stored pool states, gas and ETH prices with local swap math, at local CPU speed.
+   settings override module configuration by name as for QuoteCollector (e.g. SLIPPAGE_TOLERANCE_BY_TOKEN
+   or FEE_TIER_SELECTION). Returns the QuoteRecords, timestamped with their block's collection time
+   """
+   # Settings (and local quoting) apply to this replay only, and so does every change it makes to the
+   # process's state: the network's configuration, the store's token decimals, its pools in the registry
+   # (which must never be saved with them) and the ETH prices of its blocks are all restored on return
+   with overridden_settings(dict(settings or {}, QUOTE_SOURCE="local", LOCAL_QUOTE_VERIFY_SAMPLE_RATE=0)), contextlib.ExitStack() as restore:
+       restore.enter_context(restored_entries(NETWORK_CONFIGS[network_key], lock=network_init_lock))
+       index = load_snapshot_index(network_key)
+       restore.enter_context(restored_entries(TOKEN_DECIMALS, index["tokens"]))
+       config = initialize_replay_network(network_key, index)
+       tokens = config["tokens"]
+       trade_pairs = trade_pairs or config["trade_pairs"]
+       notionals = notionals or USD_NOTIONALS
+      
+       # The store's pools are the only ones a replay can quote. The registry is loaded first, or its
+       # lazy load from disk would overwrite these entries
+       load_pool_registry()
+       restore.enter_context(restored_entries(pool_registry["pools"], [pool_registry_key(config, tokens[token_a], tokens[token_b], fee)
+                                                                      for token_a, token_b in trade_pairs for fee in POOL_FEE_TIERS], pool_registry_lock))
+       stored_pools = {(tokens[token_a], tokens[token_b], fee): pool_address for pool_address, (token_a, token_b, fee) in index["pools"].items()}
+       for token_a, token_b in trade_pairs:
+           for fee in POOL_FEE_TIERS:
+               record_pool_address(config, tokens[token_a], tokens[token_b], fee,
+                                   stored_pools.get((tokens[token_a], tokens[token_b], fee)) or stored_pools.get((tokens[token_b], tokens[token_a], fee)))
+       pool_contracts = {pool_address: PrecompiledContract(pool_address, POOL_ABI) for pool_address in index["pools"]}
+      
+       replay_start = time.time()
+       rows = []
+       blocks = stored_blocks(network_key, start_block, end_block)
+       restore.enter_context(restored_entries(eth_price_cache, [(config["chain_id"], block[0]) for block in blocks], eth_price_lock))
+       for block_number, collected_at, gas_price, eth_price in blocks:
+           config["pool_snapshots"] = {}
+           for pool_address, pool_contract in pool_contracts.items():
+               snapshot = read_pool_snapshot(network_key, pool_address, block_number)
+               if snapshot is not None:
+                   config["pool_snapshots"][(block_number, pool_address)] = snapshot
+                   cache_read_result(config, block_number, *encode_contract_call(pool_contract, "liquidity", []), (True, snapshot["liquidity"]))
+           cache_eth_price(config, block_number, eth_price)
+           timestamp = dt.datetime.fromtimestamp(collected_at, dt.UTC)
+          
+           for token_a, token_b in trade_pairs:
+               for notional in notionals:
+                   try:
+                       row = get_uniswap_quote(token_a, token_b, notional, gas_price, network_key, block_number)
+                   except Exception as e:
+                       logger.warning(f"[{config['name']}] No replayed quote for {token_a}->{token_b} with ${notional} USD at block {block_number}: {e}")
+                       continue
+                   row.timestamp = timestamp
+                   rows.append(row)
+       logger.info(f"[{config['name']}] Replayed {len(blocks)} blocks into {len(rows)} quotes in {time.time() - replay_start:.2f}s")
+       return rows
 
 ############################
-# MAIN EXECUTION FUNCTIONS
+# NETWORK SUPERVISOR
+############################
+
+def  network_file (path, network_key):
+   """A network worker's own copy of a shared state file (registries, event state, metrics, log)"""
+   root, extension = os.path.splitext(path)
+   return f"{root}_{network_key}{extension}"
+
+def  forward_stop_request (stop):
+   """
+   Network worker thread: end the collection loop once the supervisor sets its shared stop flag (a plain
+   shared value rather than a multiprocessing.Event, whose set() hangs on waiters in exited workers)
+   """
+   while not stop.value:
+       time.sleep(NETWORK_SUPERVISOR_POLL_INTERVAL)
+   collection_stop.set()
+
+def  run_network_worker (network_key, network_config, rpc_urls, settings, sink, stop):
+   """
+   Worker process of one network: apply the parent's settings and the network's own, then run the
+   collection loop for that network alone (with the supervisor's network_config), sending the rows to
+   the supervisor through sink. Once the stop flag is set, the worker finishes its cycle and exits
+   """
+   apply_settings(settings)
+   apply_settings(network_config.get("settings", {}))
+   for name in ("log_file", "POOL_REGISTRY_FILE", "TOKEN_REGISTRY_FILE", "EVENT_STATE_FILE", "METRICS_FILE"):
+       if globals()[name]:
+           globals()[name] = network_file(globals()[name], network_key)
+   NETWORK_CONFIGS[network_key] = network_config
+   network_sink["queue"] = sink
+   configure_logging()
+   signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor handles Ctrl-C and stops the workers
+   threading.Thread(target=forward_stop_request, args=(stop,), name="network-stop", daemon=True).start()
+  
+   config = network_config
+   try:
+       collector = QuoteCollector(network_key, rpc_urls)
+       collector.initialize()
+       logger.info(f"{config['name']} - Tracking pairs: {', '.join([f'{pair[0]}/{pair[1]}' for pair in config['trade_pairs']])}")
+       run_collection([collector])
+   except Exception as e:
+       logger.error(f"[{config['name']}] Network worker failed: {e}")
+       raise
+   finally:
+       sync_output_writer()
+
+def  forward_network_rows (sink):
+   """Supervisor thread: hand the workers' row batches to the output writer, until a None message"""
+   while True:
+       message = sink.get()
+       if message is None:
+           return
+       if message[0] == "rows":
+           _, table, rows = message
+           write_quote_rows(rows, table)
+       else:
+           sync_output_writer()
+
+def  run_network_supervisor (rpc_urls=None, settings=None):
+   """
+   Run every configured network's collector in its own worker process and merge their rows into the
+   output files. Each worker has its own connections, RPC limiter and GIL, plus the settings of its
+   network's "settings" entry. A worker that exits with an error is restarted after a backoff, while
+   the others keep collecting; with TOGGLE off, returns once every worker finished its cycle. On the
+   way out (Ctrl-C included) the workers are asked to stop and their remaining rows are written
+   """
+   context = multiprocessing.get_context("spawn")  # The parent's connection pools and threads must not be copied
+   sink = context.Queue(maxsize=NETWORK_SINK_QUEUE_MAX_MESSAGES)
+   stop = context.RawValue("b", 0)
+   forwarder = threading.Thread(target=forward_network_rows, args=(sink,), name="network-sink", daemon=True)
+   forwarder.start()
+   workers = {network_key: {"process": None, "crashes": 0, "started_at": 0.0, "restart_at": 0.0, "done": False}
+              for network_key in NETWORK_CONFIGS}
+   try:
+       while not all(worker["done"] for worker in workers.values()):
+           for network_key, worker in workers.items():
+               name = NETWORK_CONFIGS[network_key]["name"]
+               process = worker["process"]
+               if worker["done"] or (process is not None and process.is_alive()):
+                   continue
+               if process is not None:
+                   worker["process"] = None
+                   if process.exitcode == 0 or not TOGGLE or stop.value:
+                       logger.info(f"[{name}] Network worker exited with code {process.exitcode}")
+                       worker["done"] = True
+                       continue
+                   if time.time() - worker["started_at"] > NETWORK_RESTART_BACKOFF_MAX:
+                       worker["crashes"] = 0
+                   worker["crashes"] += 1
+                   backoff = min(NETWORK_RESTART_BACKOFF * 2 ** (worker["crashes"] - 1), NETWORK_RESTART_BACKOFF_MAX)
+                   worker["restart_at"] = time.time() + backoff
+                   record_count("network_worker_restarts_total", (("network", network_key),))
+                   logger.error(f"[{name}] Network worker exited with code {process.exitcode}, restarting in {backoff:.0f}s")
+                   continue
+               if time.time() < worker["restart_at"]:
+                   continue
+               worker["process"] = context.Process(target=run_network_worker, args=(network_key, NETWORK_CONFIGS[network_key], rpc_urls,
+                                                                                    settings or {}, sink, stop),
+                                                   name=f"collector-{network_key}")
+               worker["process"].start()
+               worker["started_at"] = time.time()
+               logger.info(f"[{name}] Started network worker process {worker['process'].pid}")
+           time.sleep(NETWORK_SUPERVISOR_POLL_INTERVAL)
+   finally:
+       # Let the workers finish their cycle and hand over their rows (the forwarder keeps draining the
+       # sink meanwhile); only workers still running after NETWORK_STOP_TIMEOUT are terminated
+       stop.value = 1
+       stop_deadline = time.time() + NETWORK_STOP_TIMEOUT
+       for network_key, worker in workers.items():
+           if worker["process"] is None:
+               continue
+           worker["process"].join(max(0, stop_deadline - time.time()))
+           if worker["process"].is_alive():
+               logger.error(f"[{NETWORK_CONFIGS[network_key]['name']}] Network worker did not stop within {NETWORK_STOP_TIMEOUT}s, terminating it")
+               worker["process"].terminate()
+               worker["process"].join()
+       sink.put(None)
+       forwarder.join(timeout=HTTP_TIMEOUT)
+       sync_output_writer()
+
+############################
+# LIBRARY API
 ############################
 
+class  QuoteCollector:
+   """
+   The quoting core as a library object for one network. Importing the module and building a
+   collector neither connects nor touches the filesystem: the connection, contracts and ABI-bound
+   contract objects are set up on first use. settings overrides module configuration by name
+   (e.g. {"QUOTE_ENGINE": "async"}) for the duration of each of the collector's calls only; collectors
+   with different settings should not be used from several threads at once, as the settings are globals
+   """
+   def  __init__ (self, network="ethereum", rpc_urls=None, settings=None):
+       if network not in NETWORK_CONFIGS:
+           raise Exception(f"Unknown network {network}; configured networks: {', '.join(NETWORK_CONFIGS)}")
+       unknown_settings = [name for name in settings or {} if not name.isupper() or name not in globals()]
+       if unknown_settings:
+           raise Exception(f"Unknown settings: {', '.join(unknown_settings)}")
+       self.settings = dict(settings or {})
+       self.network = network
+       self.rpc_urls = rpc_urls.split(",") if isinstance(rpc_urls, str) else rpc_urls
+  
+   def  initialize (self):
+       """Connect the network and set up its contracts, if not done yet; returns its configuration"""
+       with overridden_settings(self.settings):
+           return initialize_network(self.network, self.rpc_urls)
+  
+   @property
+   def  config (self):
+       """The network's configuration, connected and with its contracts set up"""
+       return self.initialize()
+  
+   def  quote (self, token_in_symbol, token_out_symbol, notional_amount, block_identifier="latest"):
+       """One quote (a QuoteRecord, in the output columns) for a USD notional"""
+       self.initialize()
+       with overridden_settings(self.settings):
+           return get_uniswap_quote(token_in_symbol, token_out_symbol, notional_amount, None, self.network, block_identifier)
+  
+   def  depth_curve (self, token_in_symbol, token_out_symbol, notionals, block_identifier="latest"):
+       """Price impact curve over an array of notionals (see get_depth_curve)"""
+       self.initialize()
+       with overridden_settings(self.settings):
+           return get_depth_curve(token_in_symbol, token_out_symbol, notionals, None, self.network, block_identifier)
+  
+   def  run_cycle (self, trade_pairs=None, block_number=None, now=None):
+       """Quote the network's pairs (or some of them) once and write the rows"""
+       config = self.initialize()
+       with overridden_settings(self.settings):
+           run_network_cycle(self.network, config, now or dt.datetime.now(dt.UTC).isoformat(), trade_pairs, block_number)
+  
+   def  backfill (self, start_block, end_block, step=1, workers=None):
+       """Quote the network's pairs at past blocks on a process pool and write the rows (see run_backfill)"""
+       self.initialize()
+       with overridden_settings(self.settings):
+           return run_backfill(self.network, start_block, end_block, step, workers, self.rpc_urls, self.settings)
+  
+   def  record_local_fixtures (self, token_a, token_b, fee_tiers=None, directory=LOCAL_FIXTURE_DIR, block_number=None):
+       """
+       Record a fixture (see record_local_quote_fixture) for every fee tier of a pair with a pool, all at
+       one block; returns their paths
+       """
+       config = self.initialize()
+       with overridden_settings(self.settings):
+           block_number = block_number or config["w3"].eth.block_number
+           tokens = config["tokens"]
+           return [record_local_quote_fixture(self.network, token_a, token_b, fee, directory, block_number) for fee in fee_tiers or POOL_FEE_TIERS
+                   if get_pool_address(config, tokens[token_a], tokens[token_b], fee) is not None]
+
+############################
+# COMMAND LINE
+############################
+
+def  parse_block_range (value):
+   """START:END[:STEP] of --backfill, as (start, end, step)"""
+   try:
+       bounds = [int(part) for part in value.split(":")]
+   except ValueError:
+       bounds = []
+   if len(bounds) not in (2, 3) or bounds[0] > bounds[1] or (len(bounds) == 3 and bounds[2] < 1):
+       raise argparse.ArgumentTypeError(f"expected START:END[:STEP] with START <= END and STEP >= 1, got {value}")
+   return bounds[0], bounds[1], bounds[2] if len(bounds) == 3 else 1
+
+def  parse_fixture_pool (value):
+   """TOKEN_A/TOKEN_B[/FEE] of --record-local-fixture, as (token_a, token_b, fee tiers or None for all)"""
+   parts = value.split("/")
+   if len(parts) not in (2, 3) or (len(parts) == 3 and (not parts[2].isdigit() or int(parts[2]) not in POOL_FEE_TIERS)):
+       raise argparse.ArgumentTypeError(f"expected TOKEN_A/TOKEN_B[/FEE] with FEE one of {POOL_FEE_TIERS}, got {value}")
+   return parts[0], parts[1], [int(parts[2])] if len(parts) == 3 else None
+
+def  run_collection (collectors):
+   """Collection loop of the configured COLLECTION_MODE over the collectors' networks"""
+   # Incremental mode requotes on pool events instead of on a timer
+   if COLLECTION_MODE == "events":
+       logger.info(f"Event-driven collection: polling pool events every {EVENT_POLL_INTERVAL}s")
+       run_event_loop([collector.network for collector in collectors])
+  
+   # Block-aligned mode starts a cycle on each new head for the pairs that are due
+   if COLLECTION_MODE == "blocks":
+       logger.info(f"Block-aligned collection: polling for new heads every {BLOCK_POLL_INTERVAL}s, {PAIR_DEADLINE}s pair deadline")
+       run_block_scheduler([collector.network for collector in collectors])
+  
+   while COLLECTION_MODE == "interval":
+       now = dt.datetime.now(dt.UTC).isoformat()
+       logger.info(f"[{now}] Starting new quote collection cycle")
+      
+       # Iterate over each network (preserved for future use)
+       for collector in collectors:
+           collector.run_cycle(now=now)
+
+       if not TOGGLE:
+           logger.info("TOGGLE is set to False, terminating script after completing one cycle...") # 
+           print("TOGGLE is set to False, terminating script after completing one cycle...")
+           break
+          
+       # Sleep some random interval
+       sleep_time = random.uniform(.25 * 3600, .5 * 3600) # 
+       logger.info(f"Completed cycle. Sleeping for {sleep_time/3600:.2f} hours until next collection...") # 
+       if collection_stop.wait(sleep_time):
+           logger.info("Stop requested, terminating after the completed cycle...")
+           break
+
 def  main ():
    """
    Main execution function for the Uniswap quotes collector
    """
+   parser = argparse.ArgumentParser(description="Collect Uniswap V3 quotes on a schedule or on pool events")
+   parser.add_argument("--engine", choices=["threaded", "sequential", "async"], help="Quote engine (default: QUOTE_ENGINE)")
+   parser.add_argument("--mode", choices=["interval", "events", "blocks"], help="Collection mode (default: COLLECTION_MODE)")
+   parser.add_argument("--rpc-url", help="Comma-separated RPC URLs, overriding the environment")
+   parser.add_argument("--once", action="store_true", help="Stop after one cycle (or one event poll)")
+   parser.add_argument("--backfill", type=parse_block_range, metavar="START:END[:STEP]",
+                       help="Quote every STEP-th block of a past range instead of collecting live (needs an archive node)")
+   parser.add_argument("--workers", type=int, help="Backfill worker processes (default: BACKFILL_WORKERS)")
+   parser.add_argument("--record-local-fixture", nargs="?", const=LOCAL_FIXTURE_DIR, metavar="DIR",
+                       help="Record pool snapshots and their QuoterV2 quotes (see --fixture-pool) into DIR and exit "
+                            "(default: tests/fixtures/local_quotes)")
+   parser.add_argument("--fixture-pool", type=parse_fixture_pool, default=("ETH", "USDC", None), metavar="TOKEN_A/TOKEN_B[/FEE]",
+                       help="Pair of --record-local-fixture, at one fee tier or every tier with a pool (default: ETH/USDC)")
+   parser.add_argument("--fixture-block", type=int, help="Block of --record-local-fixture (default: latest)")
+   parser.add_argument("--verify-local-fixture", nargs="+", metavar="PATH",
+                       help="Check the local swap math against recorded fixtures offline and exit (non-zero on a mismatch)")
+   args = parser.parse_args()
+  
+   # Fixture checks need neither a node nor the output files
+   if args.verify_local_fixture:
+       failed = False
+       for path in args.verify_local_fixture:
+           try:
+               print(f"{path}: {verify_local_quote_fixture(path)} local quotes match QuoterV2")
+           except Exception as e:
+               print(f"{path}: {e}")
+               failed = True
+       sys.exit(1 if failed else 0)
+   settings = {"QUOTE_ENGINE": args.engine, "COLLECTION_MODE": args.mode, "TOGGLE": False if args.once else None}
+   cli_settings = {name: value for name, value in settings.items() if value is not None}
+  
+   apply_settings(cli_settings)  # The command line's settings are the process's (collection mode, engine, TOGGLE)
+   configure_logging()
+   signal.signal(signal.SIGINT, signal_handler)
+   collectors = [QuoteCollector(network_key, args.rpc_url, cli_settings) for network_key in NETWORK_CONFIGS]
+   network_processes = ENABLE_NETWORK_PROCESSES and len(NETWORK_CONFIGS) > 1 and not args.backfill
+   if len(NETWORK_CONFIGS) == 1:
+       apply_settings(next(iter(NETWORK_CONFIGS.values())).get("settings", {}))  # A single network's settings are the process's
+  
    start_time = time.time()
    logger.info("Starting Uniswap (Ethereum) quote collector...")
-   logger.info(f"CSV output file: {CSV_FILE}")
-  
-   # Log all networks and their trading pairs
-   for network_key, config in NETWORK_CONFIGS.items(): 
-       logger.info(f"{config['name']} - Tracking pairs: {', '.join([f'{pair[0]}/{pair[1]}' for pair in config['trade_pairs']])}")
+   logger.info(f"Output file ({OUTPUT_FORMAT}): {CSV_FILE}")
   
    logger.info(f"USD notional amounts: {', '.join([f'${n}' for n in USD_NOTIONALS])}") # 
   
+   # Connect every network up front, so an unreachable node stops the collector at startup
+   # (network workers connect on their own instead, and are restarted on failure)
+   if not network_processes:
+       for collector in collectors:
+           try:
+               collector.initialize()
+           except Exception:
+               sys.exit(1)
+      
+       # Log all networks and their trading pairs (known once their token lists are loaded)
+       for network_key, config in NETWORK_CONFIGS.items(): 
+           logger.info(f"{config['name']} - Tracking pairs: {', '.join([f'{pair[0]}/{pair[1]}' for pair in config['trade_pairs']])}")
+  
+   if args.record_local_fixture:
+       try:
+           token_a, token_b, fee_tiers = args.fixture_pool
+           collectors[0].record_local_fixtures(token_a, token_b, fee_tiers, args.record_local_fixture, args.fixture_block)
+       except Exception as e:
+           logger.error(f"Could not record local quote fixture: {e}")
+           print(f"Could not record local quote fixture: {e}")
+           sys.exit(1)
+       return
+  
+   start_output_writer()
+   start_metrics_server()
+  
    try:
-       while True:
-           now = dt.datetime.now(dt.UTC).isoformat()
-           logger.info(f"[{now}] Starting new quote collection cycle")
-          
-           # Iterate over each network (preserved for future use)
-           for network_key, config in NETWORK_CONFIGS.items():
-               logger.info(f"[{now}] Processing {config['name']}...") # 
-              
-               # Cache the gas price once per network per cycle
-               try:
-                   cached_gas_price = config["w3"].eth.gas_price
-                   logger.info(f"[{config['name']}] Cached gas price for this cycle: {cached_gas_price / 10**9} Gwei") # 
-               except Exception as e:
-                   logger.error(f"[{config['name']}] Error fetching gas price: {e}")
-                   cached_gas_price = None # Allow trades to proceed with on-demand gas price fetching
-              
-               # ETH price is fetched by get_current_eth_price() which has its own caching 
-               # No need to pass cached_eth_price around for Uniswap only.
-              
-               # Process trading pairs for this network
-               if ENABLE_PARALLEL_PROCESSING:
-                   pair_tasks = [] # 
-                   for token_a, token_b in config["trade_pairs"]:
-                       # cached_eth_price removed from pair_data
-                       pair_data = (token_a, token_b, config, network_key, cached_gas_price, now)
-                       pair_tasks.append(pair_data) # 
-                  
-                   max_workers = MAX_WORKERS_ETHEREUM
-                   logger.info(f"[{config['name']}] Processing {len(pair_tasks)} trading pairs with {max_workers} parallel workers...")
-                  
-                   with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                       futures = [executor.submit(process_trading_pair, pair_data) for pair_data in pair_tasks] # 
-                       for future in concurrent.futures.as_completed(futures): # 
-                           try:
-                               future.result()
-                           except Exception as e: # 
-                               # Errors from process_trading_pair should be logged there
-                               # This catches errors if process_trading_pair itself fails or re-raises something unexpected.
-                               logger.error(f"[{config['name']}] Error processing a trading pair task: {e}")
-               else:
-                   logger.info(f"[{config['name']}] Processing trading pairs sequentially...") # 
-                   for token_a, token_b in config["trade_pairs"]:
-                       pair_data = (token_a, token_b, config, network_key, cached_gas_price, now)
-                       process_trading_pair(pair_data)
-
-           if not TOGGLE:
-               logger.info("TOGGLE is set to False, terminating script after completing one cycle...") # 
-               print("TOGGLE is set to False, terminating script after completing one cycle...")
-               break
-              
-           # Sleep some random interval
-           sleep_time = random.uniform(.25 * 3600, .5 * 3600) # 
-           logger.info(f"Completed cycle. Sleeping for {sleep_time/3600:.2f} hours until next collection...") # 
-           time.sleep(sleep_time)
+       # A backfill quotes the past block range once, resuming from its checkpoint
+       if args.backfill:
+           for collector in collectors:
+               collector.backfill(*args.backfill, args.workers)
+           return
+      
+       # Several networks are collected concurrently, one worker process each
+       if network_processes:
+           logger.info(f"Collecting {len(NETWORK_CONFIGS)} networks in separate worker processes")
+           run_network_supervisor(collectors[0].rpc_urls, cli_settings)
+           return
+      
+       run_collection(collectors)
           
    except KeyboardInterrupt:
        logger.info("Keyboard interrupt received. Shutting down quote collector...")
@@ -761,6 +4641,7 @@ def  main ():
        logger.error(f"Unexpected error in main loop: {e}") # Ensure this gets logged if it's an unhandled one from deeper
        raise
    finally:
+       stop_output_writer()
        logger.info("Quote collection completed.")
        end_time = time.time()
        total_time = end_time - start_time
@@ -0,0 +1,383 @@
+############################
+# UNISWAP V3 SWAP MATH
+############################
+
+# Pure-Python port of the Uniswap V3 core libraries (TickMath, SqrtPriceMath, SwapMath,
+# TickBitmap) and of the UniswapV3Pool.swap loop, so exact-input quotes can be computed
+# locally from a pool state snapshot. All arithmetic is on Python ints and follows the
+# Solidity rounding of each library function, so results match QuoterV2 to the wei.
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+Q96 = 1 << 96
+UINT160_MAX = (1 << 160) - 1
+UINT256_MAX = (1 << 256) - 1
+
+# Tick spacing enabled by the factory for each fee tier
+FEE_TICK_SPACING = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+# Approximate gas usage of a QuoterV2 single-hop quote; each initialized tick crossed loads
+# and updates tick storage, which dominates the cost of larger swaps
+SWAP_GAS_BASE = 90000
+SWAP_GAS_PER_TICK_CROSSED = 25000
+
+class  SnapshotRangeError (Exception):
+   """Raised when a swap moves past the initialized ticks covered by a pool snapshot"""
+
+############################
+# FULL MATH
+############################
+
+def  mul_div (a, b, denominator):
+   """FullMath.mulDiv - floor(a * b / denominator) with a full-precision intermediate"""
+   result = (a * b) // denominator
+   if result > UINT256_MAX:
+       raise OverflowError("mulDiv overflow")
+   return result
+
+def  mul_div_rounding_up (a, b, denominator):
+   """FullMath.mulDivRoundingUp"""
+   result = mul_div(a, b, denominator)
+   if (a * b) % denominator > 0:
+       if result == UINT256_MAX:
+           raise OverflowError("mulDivRoundingUp overflow")
+       result += 1
+   return result
+
+def  div_rounding_up (x, y):
+   """UnsafeMath.divRoundingUp"""
+   return x // y + (1 if x % y > 0 else 0)
+
+############################
+# TICK MATH
+############################
+
+# sqrt(1.0001)^-(2^i) as Q128.128 for i = 0..19, used by getSqrtRatioAtTick
+TICK_RATIO_FACTORS = [
+   0xfffcb933bd6fad37aa2d162d1a594001,
+   0xfff97272373d413259a46990580e213a,
+   0xfff2e50f5f656932ef12357cf3c7fdcc,
+   0xffe5caca7e10e4e61c3624eaa0941cd0,
+   0xffcb9843d60f6159c9db58835c926644,
+   0xff973b41fa98c081472e6896dfb254c0,
+   0xff2ea16466c96a3843ec78b326b52861,
+   0xfe5dee046a99a2a811c461f1969c3053,
+   0xfcbe86c7900a88aedcffc83b479aa3a4,
+   0xf987a7253ac413176f2b074cf7815e54,
+   0xf3392b0822b70005940c7a398e4b70f3,
+   0xe7159475a2c29b7443b29c7fa6e889d9,
+   0xd097f3bdfd2022b8845ad8f792aa5825,
+   0xa9f746462d870fdf8a65dc1f90e061e5,
+   0x70d869a156d2a1b890bb3df62baf32f7,
+   0x31be135f97d08fd981231505542fcfa6,
+   0x9aa508b5b7a84e1c677de54f3e99bc9,
+   0x5d6af8dedb81196699c329225ee604,
+   0x2216e584f5fa1ea926041bedfe98,
+   0x48a170391f7dc42444e8fa2,
+]
+
+def  get_sqrt_ratio_at_tick (tick):
+   """TickMath.getSqrtRatioAtTick - sqrt(1.0001^tick) as a Q64.96"""
+   abs_tick = abs(tick)
+   if abs_tick > MAX_TICK:
+       raise ValueError(f"Tick {tick} out of range")
+
+   ratio = TICK_RATIO_FACTORS[0] if abs_tick & 0x1 else 1 << 128
+   for bit, factor in enumerate(TICK_RATIO_FACTORS[1:], start=1):
+       if abs_tick & (1 << bit):
+           ratio = (ratio * factor) >> 128
+
+   if tick > 0:
+       ratio = UINT256_MAX // ratio
+
+   # Round up when going from Q128.128 to Q64.96 so getTickAtSqrtRatio of the result is consistent
+   return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+def  get_tick_at_sqrt_ratio (sqrt_price_x96):
+   """TickMath.getTickAtSqrtRatio - greatest tick whose sqrt ratio is <= sqrt_price_x96"""
+   if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+       raise ValueError(f"Sqrt price {sqrt_price_x96} out of range")
+
+   ratio = sqrt_price_x96 << 32
+   msb = ratio.bit_length() - 1
+   r = ratio >> (msb - 127) if msb >= 128 else ratio << (127 - msb)
+   log_2 = (msb - 128) << 64
+
+   for bit in range(63, 49, -1):
+       r = (r * r) >> 127
+       f = r >> 128
+       log_2 |= f << bit
+       r >>= f
+
+   log_sqrt10001 = log_2 * 255738958999603826347141  # 128.128 number
+   tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+   tick_high = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+
+   if tick_low == tick_high:
+       return tick_low
+   return tick_high if get_sqrt_ratio_at_tick(tick_high) <= sqrt_price_x96 else tick_low
+
+############################
+# SQRT PRICE MATH
+############################
+
+def  get_next_sqrt_price_from_amount0_rounding_up (sqrt_price_x96, liquidity, amount, add):
+   """SqrtPriceMath.getNextSqrtPriceFromAmount0RoundingUp"""
+   if amount == 0:
+       return sqrt_price_x96
+   numerator1 = liquidity << 96
+
+   if add:
+       product = amount * sqrt_price_x96
+       if product <= UINT256_MAX:
+           denominator = numerator1 + product
+           if denominator <= UINT256_MAX:
+               return mul_div_rounding_up(numerator1, sqrt_price_x96, denominator)
+       return div_rounding_up(numerator1, numerator1 // sqrt_price_x96 + amount)
+
+   product = amount * sqrt_price_x96
+   if product > UINT256_MAX or numerator1 <= product:
+       raise ArithmeticError("Insufficient liquidity for amount0")
+   return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 - product)
+
+def  get_next_sqrt_price_from_amount1_rounding_down (sqrt_price_x96, liquidity, amount, add):
+   """SqrtPriceMath.getNextSqrtPriceFromAmount1RoundingDown"""
+   if add:
+       quotient = (amount << 96) // liquidity if amount <= UINT160_MAX else mul_div(amount, Q96, liquidity)
+       result = sqrt_price_x96 + quotient
+       if result > UINT160_MAX:
+           raise OverflowError("Sqrt price overflow")
+       return result
+
+   quotient = div_rounding_up(amount << 96, liquidity) if amount <= UINT160_MAX else mul_div_rounding_up(amount, Q96, liquidity)
+   if sqrt_price_x96 <= quotient:
+       raise ArithmeticError("Insufficient liquidity for amount1")
+   return sqrt_price_x96 - quotient
+
+def  get_next_sqrt_price_from_input (sqrt_price_x96, liquidity, amount_in, zero_for_one):
+   """SqrtPriceMath.getNextSqrtPriceFromInput"""
+   if zero_for_one:
+       return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_in, True)
+   return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_in, True)
+
+def  get_amount0_delta (sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up):
+   """SqrtPriceMath.getAmount0Delta"""
+   if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+       sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+   numerator1 = liquidity << 96
+   numerator2 = sqrt_ratio_b_x96 - sqrt_ratio_a_x96
+
+   if round_up:
+       return div_rounding_up(mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b_x96), sqrt_ratio_a_x96)
+   return mul_div(numerator1, numerator2, sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+def  get_amount1_delta (sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity, round_up):
+   """SqrtPriceMath.getAmount1Delta"""
+   if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+       sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+
+   if round_up:
+       return mul_div_rounding_up(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+   return mul_div(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+
+############################
+# SWAP MATH
+############################
+
+def  compute_swap_step (sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, amount_remaining, fee_pips):
+   """
+   SwapMath.computeSwapStep for exact input swaps.
+   Returns (sqrt_ratio_next_x96, amount_in, amount_out, fee_amount)
+   """
+   if amount_remaining < 0:
+       raise ValueError("Only exact input swaps are supported")
+   zero_for_one = sqrt_ratio_current_x96 >= sqrt_ratio_target_x96
+
+   amount_remaining_less_fee = mul_div(amount_remaining, 1000000 - fee_pips, 1000000)
+   if zero_for_one:
+       amount_in = get_amount0_delta(sqrt_ratio_target_x96, sqrt_ratio_current_x96, liquidity, True)
+   else:
+       amount_in = get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, True)
+
+   if amount_remaining_less_fee >= amount_in:
+       sqrt_ratio_next_x96 = sqrt_ratio_target_x96
+   else:
+       sqrt_ratio_next_x96 = get_next_sqrt_price_from_input(
+           sqrt_ratio_current_x96, liquidity, amount_remaining_less_fee, zero_for_one
+       )
+
+   reached_target = sqrt_ratio_target_x96 == sqrt_ratio_next_x96
+   if zero_for_one:
+       if not reached_target:
+           amount_in = get_amount0_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, True)
+       amount_out = get_amount1_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, False)
+   else:
+       if not reached_target:
+           amount_in = get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, True)
+       amount_out = get_amount0_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, False)
+
+   if not reached_target:
+       # We didn't reach the target, so take the remainder of the maximum input as fee
+       fee_amount = amount_remaining - amount_in
+   else:
+       fee_amount = mul_div_rounding_up(amount_in, fee_pips, 1000000 - fee_pips)
+
+   return sqrt_ratio_next_x96, amount_in, amount_out, fee_amount
+
+############################
+# TICK BITMAP
+############################
+
+def  next_initialized_tick_within_one_word (snapshot, tick, lte):
+   """
+   TickBitmap.nextInitializedTickWithinOneWord against a snapshot's bitmap words.
+   Returns (next_tick, initialized)
+   """
+   tick_spacing = snapshot["tick_spacing"]
+   compressed = tick // tick_spacing  # Floor division matches the Solidity round-towards-negative-infinity
+
+   if not lte:
+       compressed += 1
+   word_pos = compressed >> 8
+   bit_pos = compressed & 0xff
+   if not snapshot["min_word"] <= word_pos <= snapshot["max_word"]:
+       raise SnapshotRangeError(f"Tick bitmap word {word_pos} is outside the snapshot")
+   word = snapshot["tick_bitmap"].get(word_pos, 0)
+
+   if lte:
+       # All the 1s at or to the right of the current bit_pos
+       masked = word & ((1 << bit_pos) - 1 + (1 << bit_pos))
+       if masked != 0:
+           return (compressed - (bit_pos - (masked.bit_length() - 1))) * tick_spacing, True
+       return (compressed - bit_pos) * tick_spacing, False
+
+   # All the 1s at or to the left of bit_pos
+   masked = word & ~((1 << bit_pos) - 1) & UINT256_MAX
+   if masked != 0:
+       least_significant_bit = (masked & -masked).bit_length() - 1
+       return (compressed + (least_significant_bit - bit_pos)) * tick_spacing, True
+   return (compressed + (255 - bit_pos)) * tick_spacing, False
+
+############################
+# SWAP SIMULATION
+############################
+
+def  simulate_exact_input (snapshot, zero_for_one, amount_in, sqrt_price_limit_x96=0):
+   """
+   Run the UniswapV3Pool.swap loop for an exact input amount against a pool snapshot.
+   A zero price limit behaves like the Quoter (swap until the input is spent or the price bound is hit).
+   Returns a dict with amount_out, amount_in_used, sqrt_price_x96_after, tick_after, ticks_crossed, gas_estimate
+   """
+   if amount_in <= 0:
+       raise ValueError("amount_in must be positive")
+   if sqrt_price_limit_x96 == 0:
+       sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+
+   fee = snapshot["fee"]
+   sqrt_price_x96 = snapshot["sqrt_price_x96"]
+   tick = snapshot["tick"]
+   liquidity = snapshot["liquidity"]
+   amount_remaining = amount_in
+   amount_out = 0
+   ticks_crossed = 0
+
+   while amount_remaining != 0 and sqrt_price_x96 != sqrt_price_limit_x96:
+       sqrt_price_start_x96 = sqrt_price_x96
+       tick_next, initialized = next_initialized_tick_within_one_word(snapshot, tick, zero_for_one)
+       tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+       sqrt_price_next_x96 = get_sqrt_ratio_at_tick(tick_next)
+
+       if (sqrt_price_next_x96 < sqrt_price_limit_x96) if zero_for_one else (sqrt_price_next_x96 > sqrt_price_limit_x96):
+           sqrt_price_target_x96 = sqrt_price_limit_x96
+       else:
+           sqrt_price_target_x96 = sqrt_price_next_x96
+
+       sqrt_price_x96, step_amount_in, step_amount_out, step_fee_amount = compute_swap_step(
+           sqrt_price_x96, sqrt_price_target_x96, liquidity, amount_remaining, fee
+       )
+       amount_remaining -= step_amount_in + step_fee_amount
+       amount_out += step_amount_out
+
+       if sqrt_price_x96 == sqrt_price_next_x96:
+           # Crossed onto the next tick; apply its net liquidity if it is initialized
+           if initialized:
+               if tick_next not in snapshot["liquidity_net"]:
+                   raise SnapshotRangeError(f"Tick {tick_next} is missing from the snapshot")
+               liquidity_net = snapshot["liquidity_net"][tick_next]
+               if zero_for_one:
+                   liquidity_net = -liquidity_net
+               liquidity += liquidity_net
+               if liquidity < 0:
+                   raise ArithmeticError("Liquidity underflow")
+               ticks_crossed += 1
+           tick = tick_next - 1 if zero_for_one else tick_next
+       elif sqrt_price_x96 != sqrt_price_start_x96:
+           # Recompute the tick unless the price did not move
+           tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+   return {
+       "amount_out": amount_out,
+       "amount_in_used": amount_in - amount_remaining,
+       "sqrt_price_x96_after": sqrt_price_x96,
+       "tick_after": tick,
+       "ticks_crossed": ticks_crossed,
+       "gas_estimate": SWAP_GAS_BASE + SWAP_GAS_PER_TICK_CROSSED * ticks_crossed
+   }
+
+def  build_swap_segments (snapshot, zero_for_one, max_amount_in):
+   """
+   Walk the swap loop once for max_amount_in and record every constant-liquidity segment it
+   passes through, so the output of many smaller sizes can be evaluated together.
+   Returns (segments, covered_amount_in): each segment is (amount_in_before, amount_out_before,
+   sqrt_price_x96, liquidity, ticks_crossed) with cumulative gross input and output at its start.
+   covered_amount_in is less than max_amount_in when the walk reaches the edge of the snapshot
+   or the price bound.
+   """
+   sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+   fee = snapshot["fee"]
+   sqrt_price_x96 = snapshot["sqrt_price_x96"]
+   tick = snapshot["tick"]
+   liquidity = snapshot["liquidity"]
+   amount_remaining = max_amount_in
+   amount_out = 0
+   ticks_crossed = 0
+   segments = []
+
+   while amount_remaining != 0 and sqrt_price_x96 != sqrt_price_limit_x96:
+       try:
+           tick_next, initialized = next_initialized_tick_within_one_word(snapshot, tick, zero_for_one)
+       except SnapshotRangeError:
+           break
+       tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+       sqrt_price_next_x96 = get_sqrt_ratio_at_tick(tick_next)
+       if initialized and tick_next not in snapshot["liquidity_net"]:
+           break
+
+       if (sqrt_price_next_x96 < sqrt_price_limit_x96) if zero_for_one else (sqrt_price_next_x96 > sqrt_price_limit_x96):
+           sqrt_price_target_x96 = sqrt_price_limit_x96
+       else:
+           sqrt_price_target_x96 = sqrt_price_next_x96
+
+       segments.append((max_amount_in - amount_remaining, amount_out, sqrt_price_x96, liquidity, ticks_crossed))
+       sqrt_price_start_x96 = sqrt_price_x96
+       sqrt_price_x96, step_amount_in, step_amount_out, step_fee_amount = compute_swap_step(
+           sqrt_price_x96, sqrt_price_target_x96, liquidity, amount_remaining, fee
+       )
+       amount_remaining -= step_amount_in + step_fee_amount
+       amount_out += step_amount_out
+
+       if sqrt_price_x96 == sqrt_price_next_x96:
+           if initialized:
+               liquidity_net = snapshot["liquidity_net"][tick_next]
+               liquidity += -liquidity_net if zero_for_one else liquidity_net
+               ticks_crossed += 1
+           tick = tick_next - 1 if zero_for_one else tick_next
+       elif sqrt_price_x96 != sqrt_price_start_x96:
+           tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+   if amount_remaining == 0:
+       return segments, max_amount_in
+   return segments, max_amount_in - amount_remaining